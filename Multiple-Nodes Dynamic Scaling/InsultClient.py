@@ -97,9 +97,9 @@ class InsultClientDynamic:
     def get_all_insults_from_service(self):
         if self.insult_service_proxy:
             try:
-                return self.insult_service_proxy.get_insults()
+                return self.insult_service_proxy.get_insults_page(0)[1]
             except Exception as e:
-                print(f"Client: Error calling InsultService.get_insults(): {e}")
+                print(f"Client: Error calling InsultService.get_insults_page(): {e}")
         else:
             print("Client: InsultService proxy not available.")
         return []
@@ -117,9 +117,9 @@ class InsultClientDynamic:
     def get_censored_texts_from_scaler(self):
         if self.scaler_manager_proxy:
             try:
-                return self.scaler_manager_proxy.get_censored_texts()
+                return self.scaler_manager_proxy.get_censored_texts_page(0)[1]
             except Exception as e:
-                print(f"Client: Error calling ScalerManager.get_censored_texts(): {e}")
+                print(f"Client: Error calling ScalerManager.get_censored_texts_page(): {e}")
         else:
             print("Client: ScalerManager proxy not available.")
         return []
@@ -163,7 +163,7 @@ if __name__ == "__main__":
     parser.add_argument("--num-insults", type=int, default=2,
                         help="Number of random insults to send if not continuous.")
 
-    parser.add_argument("--get-insults", action="store_true", help="Get all insults from InsultService (Redis).")
+    parser.add_argument("--get-insults", action="store_true", help="Get the first page of insults from InsultService (Redis).")
     parser.add_argument("--get-scaler-stats", action="store_true", help="Get stats from ScalerManager.")
     parser.add_argument("--get-censored-sample", action="store_true",
                         help="Get a sample of censored texts.")  # Ensure ScalerManager has this method
@@ -2,59 +2,126 @@ import pika
 import time
 import config
 from RedisManager import redis_cli
-from multiprocessing import Event
+from multiprocessing import Event, Value
 
 
 class InsultProcessorWorker:
-    def __init__(self, worker_id: str, stop_event: Event):
+    def __init__(self, worker_id: str, stop_event: Event, activate_event: Event = None,
+                 ready_at: Value = None, first_message_at: Value = None):
         self.worker_id = worker_id
         self.stop_event = stop_event
+        self.activate_event = activate_event  # Given to spare workers, which wait connected until it is set
+        self.ready_at = ready_at  # Startup timestamps reported to the ScalerManager
+        self.first_message_at = first_message_at
         self.connection = None
         self.channel = None
+        self.last_processed_tag = None  # Delivery tag of the last processed, not yet acknowledged, message
+        self.writer = redis_cli.write_buffer(completed_key=config.REDIS_INSULT_COMPLETED_KEY)  # Results are stored in batches before their messages are acked
         print(f"[InsultProcessorWorker {self.worker_id}] Initialized.")
 
     def connect_rabbitmq(self):
+        self.last_processed_tag = None  # Tags from a previous channel are no longer valid
+        self.writer.discard()  # The broker redelivers the messages behind these writes
         try:
             self.connection = pika.BlockingConnection(pika.URLParameters(config.RABBITMQ_URL))
             self.channel = self.connection.channel()
             self.channel.queue_declare(queue=config.INSULTS_PROCESSING_QUEUE_NAME, durable=True)
-            self.channel.basic_qos(prefetch_count=20)
+            self.channel.basic_qos(prefetch_count=config.WORKER_PREFETCH_COUNT)
             print(f"[InsultProcessorWorker {self.worker_id}] Connected to RabbitMQ, consuming from '{config.INSULTS_PROCESSING_QUEUE_NAME}'.")
         except pika.exceptions.AMQPConnectionError as e:
             print(f"[InsultProcessorWorker {self.worker_id}] Error connecting to RabbitMQ: {e}. Retrying in 5s...")
             time.sleep(5)
             self.connect_rabbitmq()  # Retry
 
+    def process_message(self, body: bytes):
+        insult_to_process = body.decode('utf-8')
+        self.writer.add_insult(insult_to_process)
+        self.writer.increment_processed_count()
+
+    def ack_processed(self):
+        """Flushes the buffered Redis writes, then acknowledges their messages with a single multiple=True ack."""
+        if self.last_processed_tag is None:
+            return
+        last_processed_tag, self.last_processed_tag = self.last_processed_tag, None
+        try:
+            self.writer.flush()
+        except Exception:
+            # The batch was not stored: requeue its messages instead of acknowledging them
+            self.channel.basic_nack(delivery_tag=last_processed_tag, multiple=True, requeue=True)
+            raise
+        self.channel.basic_ack(delivery_tag=last_processed_tag, multiple=True)
+
+    def consume(self):
+        # The broker pushes up to WORKER_PREFETCH_COUNT messages; the inactivity timeout makes the
+        # generator yield (None, None, None) when idle, so stop_event is checked at least that often
+        try:
+            for method_frame, properties, body in self.channel.consume(config.INSULTS_PROCESSING_QUEUE_NAME,
+                                                                       inactivity_timeout=config.WORKER_CONSUME_TIMEOUT):
+                if method_frame:
+                    try:
+                        self.process_message(body)
+                    except Exception:
+                        self.channel.basic_nack(delivery_tag=method_frame.delivery_tag, requeue=True)
+                        self.ack_processed()
+                        raise
+                    self.last_processed_tag = method_frame.delivery_tag
+                    if self.first_message_at is not None and not self.first_message_at.value:
+                        self.first_message_at.value = time.time()
+                    if self.writer.is_due():
+                        self.ack_processed()
+                else:
+                    self.ack_processed()  # Idle: don't keep finished messages unstored and unacknowledged
+                if self.stop_event.is_set():
+                    break
+        finally:
+            if self.channel and self.channel.is_open:
+                try:
+                    self.ack_processed()
+                finally:
+                    self.channel.cancel()  # Requeues the prefetched messages that were not processed
+
+    def wait_for_activation(self) -> bool:
+        """Opens the Redis connection and, for a spare worker, idles connected until activated.
+
+        Returns False if the worker was stopped before being activated.
+        """
+        redis_cli.r.ping()  # Connects before the first message instead of on it
+        if self.ready_at is not None:
+            self.ready_at.value = time.time()
+        while self.activate_event is not None and not self.activate_event.is_set():
+            if self.stop_event.is_set():
+                return False
+            try:
+                # Waits while servicing the connection, so the broker's heartbeats are answered
+                self.connection.process_data_events(time_limit=config.WORKER_CONSUME_TIMEOUT)
+            except (pika.exceptions.StreamLostError, pika.exceptions.AMQPConnectionError):
+                print(f"[InsultProcessorWorker {self.worker_id}] RabbitMQ connection lost while idle. Reconnecting...")
+                self.connect_rabbitmq()
+        return True
+
     def run(self):
         # print(f"[InsultProcessorWorker {self.worker_id}] Starting...")
         self.connect_rabbitmq()
         if not self.channel:
             # print(f"[InsultProcessorWorker {self.worker_id}] Cannot start without RabbitMQ channel. Exiting.")
             return
-        method_frame = None
+
+        if not self.wait_for_activation():
+            if self.connection and self.connection.is_open:
+                self.connection.close()
+            return
+
         while not self.stop_event.is_set():
             try:
-                method_frame, properties, body = self.channel.basic_get(queue=config.INSULTS_PROCESSING_QUEUE_NAME,
-                                                                    auto_ack=True)
-                if method_frame:
-                    insult_to_process = body.decode('utf-8')
-                    redis_cli.add_insult(insult_to_process)
-                    redis_cli.r.incr(config.REDIS_PROCESSED_COUNTER_KEY)
-                else:
-                    time.sleep(0.01)
-            except pika.exceptions.StreamLostError:
+                self.consume()
+            except (pika.exceptions.StreamLostError, pika.exceptions.AMQPConnectionError):
                 print(f"[InsultProcessorWorker {self.worker_id}] RabbitMQ connection lost. Reconnecting...")
                 self.connect_rabbitmq()
             except Exception as e:
                 print(f"[InsultProcessorWorker {self.worker_id}] Error during processing: {e}")
-                if method_frame and self.channel and self.channel.is_open:
-                    try:
-                        self.channel.basic_nack(delivery_tag=method_frame.delivery_tag, requeue=True)
-                    except Exception as ne:
-                        print(f"[InsultProcessorWorker {self.worker_id}] Error NACKing message: {ne}")
-                time.sleep(1)
+                time.sleep(1)  # Wait a bit before consuming again
 
         # print(f"[InsultProcessorWorker {self.worker_id}] Stop event received. Shutting down.")
         if self.connection and self.connection.is_open:
             self.connection.close()
-        # print(f"[InsultProcessorWorker {self.worker_id}] Shutdown complete.")
\ No newline at end of file
+        # print(f"[InsultProcessorWorker {self.worker_id}] Shutdown complete.")
@@ -1,3 +1,5 @@
+import os
+import sys
 import pika
 import time
 import random
@@ -6,6 +8,9 @@ import config
 from RedisManager import redis_cli
 from multiprocessing import Process
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Shared"))
+from Pagination import DEFAULT_PAGE_SIZE, clamp_limit, iter_pages
+
 @Pyro4.expose
 @Pyro4.behavior(instance_mode="session")
 class InsultServicePyro:
@@ -17,10 +22,18 @@ class InsultServicePyro:
         """Gets all insults from Redis."""
         return redis_cli.get_all_insults()
 
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE) -> list:
+        """Gets [next_cursor, insults] from Redis with SSCAN; next_cursor is 0 once every insult was returned."""
+        return redis_cli.get_insults_page(int(cursor), clamp_limit(limit))
+
+    def iter_insults(self, limit=DEFAULT_PAGE_SIZE):
+        """Streams the insults page by page (a Pyro remote iterator)."""
+        return iter_pages(self.get_insults_page, limit)
+
     def get_service_stats(self) -> dict:
         """Returns statistics related to insults and broadcasting."""
         return {
-            "insults_in_redis_total": len(redis_cli.get_all_insults()),
+            "insults_in_redis_total": redis_cli.get_insults_count(),
             "insults_processed_total_redis": redis_cli.r.get(config.REDIS_PROCESSED_COUNTER_KEY) or 0,
             "num_broadcaster_processes_configured": config.NUM_INSULT_NOTIFIERS
         }
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pika
+import requests
+from requests.auth import HTTPBasicAuth
+import config
+
+
+class QueueMetricsCollector:
+    """Reads queue depth and consumer counts over one reused AMQP channel.
+
+    A passive queue_declare returns the live counts from the broker, unlike the management API whose
+    stats are sampled. The HTTP API is only used, through a pooled session, when AMQP fails. Results are
+    cached for cache_ttl seconds, so every caller within the same scaling tick shares one probe.
+    """
+    def __init__(self, cache_ttl: float = config.QUEUE_METRICS_CACHE_TTL):
+        self.cache_ttl = cache_ttl
+        self.cache = {}  # queue_name -> (monotonic time, {'messages': int, 'consumers': int})
+        self.lock = threading.Lock()  # The Pyro daemon thread and the main loop share the channel
+        self.connection = None
+        self.channel = None
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(config.RABBITMQ_USER, config.RABBITMQ_PASS)
+
+    def _get_channel(self):
+        if self.channel is None or not self.channel.is_open:
+            if self.connection is None or not self.connection.is_open:
+                self.connection = pika.BlockingConnection(pika.URLParameters(config.RABBITMQ_URL))
+            self.channel = self.connection.channel()
+        return self.channel
+
+    def _close(self):
+        try:
+            if self.connection and self.connection.is_open:
+                self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+        self.channel = None
+
+    def _probe_amqp(self, queue_name: str) -> dict:
+        # passive=True only inspects the queue; the message count excludes messages delivered but not yet acked
+        result = self._get_channel().queue_declare(queue=queue_name, passive=True)
+        return {'messages': result.method.message_count, 'consumers': result.method.consumer_count, 'unacked': None}
+
+    def _probe_http(self, queue_name: str, vhost: str = '%2F') -> dict:
+        api_url = f"http://{config.RABBITMQ_HOST}:15672/api/queues/{vhost}/{queue_name}"
+        response = self.session.get(api_url, timeout=2)
+        response.raise_for_status()
+        data = response.json()
+        return {'messages': data.get('messages_ready', data.get('messages', 0)), 'consumers': data.get('consumers', 0),
+                'unacked': data.get('messages_unacknowledged', 0)}
+
+    def get_queue_stats(self, queue_name: str) -> dict:
+        """Returns {'messages', 'consumers', 'unacked'} for the queue, or None if neither AMQP nor HTTP answered.
+
+        'unacked' is None when the stats came over AMQP, which does not report it.
+        """
+        with self.lock:
+            cached = self.cache.get(queue_name)
+            if cached and time.monotonic() - cached[0] < self.cache_ttl:
+                return cached[1]
+
+            try:
+                stats = self._probe_amqp(queue_name)
+            except Exception as e:
+                # A missing queue closes the channel and a lost connection breaks it: start over next time
+                print(f"[QueueMetrics] AMQP probe failed for '{queue_name}': {e!r}. Falling back to HTTP API.")
+                self._close()
+                try:
+                    stats = self._probe_http(queue_name)
+                except Exception as e:
+                    print(f"[QueueMetrics] Error getting stats for '{queue_name}' via HTTP API: {e}")
+                    return None
+
+            self.cache[queue_name] = (time.monotonic(), stats)
+            return stats
+
+    def get_queue_length(self, queue_name: str) -> int:
+        """Returns the messages waiting in the queue, or -1 on error."""
+        stats = self.get_queue_stats(queue_name)
+        return stats['messages'] if stats else -1
+
+    def get_pending_messages(self, queue_name: str, prefetch: int) -> int:
+        """Returns the messages not completed yet (ready plus delivered but unacked), or -1 on error.
+
+        Without an unacked count (AMQP), it is estimated: while messages are ready the broker keeps every
+        consumer's prefetch window full, and once none are ready the windows are taken as drained.
+        """
+        stats = self.get_queue_stats(queue_name)
+        if not stats:
+            return -1
+        unacked = stats['unacked']
+        if unacked is None:
+            unacked = prefetch * stats['consumers'] if stats['messages'] > 0 else 0
+        return stats['messages'] + unacked
+
+    def close(self):
+        with self.lock:
+            self._close()
+            self.session.close()
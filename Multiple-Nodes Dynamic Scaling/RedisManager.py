@@ -1,6 +1,84 @@
+import time
+
 import redis
 import config
 
+
+def completed_channel(completed_key: str) -> str:
+    """Pub/sub channel where every flush announces how many messages of the pool it completed."""
+    return f"{completed_key}:FLUSHED"
+
+
+class RedisWriteBuffer:
+    """Collects worker writes and sends them in one pipelined round trip per flush.
+
+    The owner decides when to flush (is_due, idle, shutdown), so it can acknowledge the messages
+    behind the writes only once they are stored; a failed flush drops the batch.
+    """
+    def __init__(self, r: redis.Redis, completed_key: str = None, max_items: int = config.REDIS_WRITE_BUFFER_SIZE,
+                 max_delay: float = config.REDIS_WRITE_BUFFER_MAX_DELAY):
+        self.r = r
+        self.completed_key = completed_key  # Per-pool counter also increased by processed_count, if given
+        self.max_items = max_items
+        self.max_delay = max_delay  # s the oldest buffered write may wait
+        self.censored_texts = []
+        self.insults = set()
+        self.processed_count = 0
+        self.first_write_time = None
+
+    def _buffered(self):
+        if self.first_write_time is None:
+            self.first_write_time = time.monotonic()
+
+    def add_censored_text(self, text: str):
+        """Buffers a censored text for the RPUSH of the next flush."""
+        self._buffered()
+        self.censored_texts.append(text)
+
+    def add_insult(self, insult: str):
+        """Buffers an insult for the SADD of the next flush."""
+        self._buffered()
+        self.insults.add(insult.lower())
+
+    def increment_processed_count(self, value: int = 1):
+        """Buffers an increment for the INCRBY of the next flush."""
+        self._buffered()
+        self.processed_count += value
+
+    def is_due(self) -> bool:
+        """True once the buffer holds max_items writes or its oldest write is max_delay old."""
+        if self.first_write_time is None:
+            return False
+        return (self.processed_count >= self.max_items or len(self.censored_texts) >= self.max_items
+                or len(self.insults) >= self.max_items
+                or time.monotonic() - self.first_write_time >= self.max_delay)
+
+    def discard(self):
+        """Drops the buffered writes without sending them."""
+        self.censored_texts, self.insults, self.processed_count = [], set(), 0
+        self.first_write_time = None
+
+    def flush(self):
+        """Sends every buffered write in a single pipeline: one RPUSH (+LTRIM), one SADD and one INCRBY."""
+        if self.first_write_time is None:
+            return
+        censored_texts, insults, processed_count = self.censored_texts, self.insults, self.processed_count
+        self.discard()
+
+        pipe = self.r.pipeline(transaction=False)
+        if censored_texts:
+            pipe.rpush(config.REDIS_CENSORED_TEXTS_LIST_KEY, *censored_texts)
+            pipe.ltrim(config.REDIS_CENSORED_TEXTS_LIST_KEY, -config.REDIS_CENSORED_TEXTS_MAX, -1)
+        if insults:
+            pipe.sadd(config.REDIS_INSULTS_SET_KEY, *insults)
+        if processed_count:
+            pipe.incrby(config.REDIS_PROCESSED_COUNTER_KEY, processed_count)
+            if self.completed_key:
+                pipe.incrby(self.completed_key, processed_count)
+                pipe.publish(completed_channel(self.completed_key), processed_count)
+        pipe.execute()
+
+
 class RedisManager:
     def __init__(self):
         try:
@@ -22,6 +100,15 @@ class RedisManager:
         """Returns a list of all unique insults."""
         return list(self.r.smembers(config.REDIS_INSULTS_SET_KEY))
 
+    def get_insults_page(self, cursor: int = 0, count: int = 100) -> list:
+        """Returns [next_cursor, insults] from one SSCAN step; next_cursor is 0 once the scan is complete."""
+        cursor, insults = self.r.sscan(config.REDIS_INSULTS_SET_KEY, cursor, count=count)
+        return [cursor, insults]
+
+    def get_insults_count(self) -> int:
+        """Returns the number of unique insults."""
+        return self.r.scard(config.REDIS_INSULTS_SET_KEY)
+
     def is_insult(self, word: str) -> bool:
         """Checks if a word is in the insults set."""
         return self.r.sismember(config.REDIS_INSULTS_SET_KEY, word.lower())
@@ -47,6 +134,15 @@ class RedisManager:
         val = self.r.get(config.REDIS_PROCESSED_COUNTER_KEY)
         return int(val) if val else 0
 
+    def write_buffer(self, **kwargs) -> RedisWriteBuffer:
+        """Returns a new buffered writer over this connection (one per worker)."""
+        return RedisWriteBuffer(self.r, **kwargs)
+
+    def get_completed_count(self, completed_key: str) -> int:
+        """Gets the messages completed by one worker pool."""
+        val = self.r.get(completed_key)
+        return int(val) if val else 0
+
     def reset_processed_count(self):
         """Resets the total processed texts counter."""
         self.r.delete(config.REDIS_PROCESSED_COUNTER_KEY)
@@ -1,17 +1,22 @@
+import os
+import sys
 import Pyro4
 import time
 import math
-import requests
-from requests.auth import HTTPBasicAuth
-from multiprocessing import Process, Event, Manager as ProcManager
+from collections import deque
+from multiprocessing import Process, Event, Value, Manager as ProcManager
 import threading
 import config
 
 from Pyro4 import errors
 from InsultFilterWorker import InsultFilterWorker
 from InsultProcessorWorker import InsultProcessorWorker
+from QueueMetrics import QueueMetricsCollector
 from RedisManager import redis_cli
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Shared"))
+from Pagination import DEFAULT_PAGE_SIZE, clamp_limit, iter_pages
+
 
 @Pyro4.expose
 @Pyro4.behavior(instance_mode="single")
@@ -27,8 +32,10 @@ class ScalerManagerPyro:
         # Format: {worker_id: {'process': Process, 'stop_event': Event, 'type': str}}
         self.filter_worker_processes_local = {}
 
+        # Arrival rate estimator state; the counts are None until the first observation
         self.last_filter_queue_check_time = time.time()
-        self.last_filter_message_count = 0
+        self.last_filter_message_count = None
+        self.last_filter_completed_count = None
         self.estimated_filter_arrival_rate_lambda = 0.0
 
         # Pool for InsultProcessorWorkers
@@ -39,9 +46,26 @@ class ScalerManagerPyro:
 
 
         self.last_insult_queue_check_time = time.time()
-        self.last_insult_message_count = 0
+        self.last_insult_message_count = None
+        self.last_insult_completed_count = None
         self.estimated_insult_arrival_rate_lambda = 0.0
 
+        # Warm spare workers (already connected, waiting for their activate_event) and startup metrics
+        self.spare_workers = {"FilterWorker": [], "InsultProcessorWorker": []}
+        self.time_to_first_message = {
+            "FilterWorker": deque(maxlen=config.STARTUP_METRICS_SAMPLES),
+            "InsultProcessorWorker": deque(maxlen=config.STARTUP_METRICS_SAMPLES),
+        }
+
+        # Per-worker capacity C of each pool, re-estimated while the pool is saturated (see estimate_worker_capacity)
+        self.worker_capacity = {
+            "FilterWorker": config.FILTER_WORKER_CAPACITY_C,
+            "InsultProcessorWorker": config.INSULT_PROCESSOR_WORKER_CAPACITY_C,
+        }
+        self.last_capacity_check = {"FilterWorker": None, "InsultProcessorWorker": None}  # (time, completed, backlog, workers)
+
+        self.queue_metrics = QueueMetricsCollector()  # Queue depths through a passive queue_declare
+
         self.ns = None
         try:
             self.ns = Pyro4.locateNS(host=config.PYRO_NS_HOST, port=config.PYRO_NS_PORT)
@@ -55,60 +79,142 @@ class ScalerManagerPyro:
 
         print("ScalerManager initialized (manages FilterWorkers and InsultProcessorWorkers).")
 
-    def get_queue_length_http(self, queue_name: str, vhost: str = '%2F') -> int:
-        # This method remains the same
-        api_url = f"http://{config.RABBITMQ_HOST}:15672/api/queues/{vhost}/{queue_name}"
-        try:
-            # We use the user and password from config to authenticate the HTTP call
-            response = requests.get(api_url, auth=HTTPBasicAuth(config.RABBITMQ_USER, config.RABBITMQ_PASS))
-            response.raise_for_status()
-            data = response.json()
-            return data.get('messages', 0)
-        except requests.exceptions.RequestException as e:
-            print(f"[ScalerManager] Error getting queue length for '{queue_name}' via HTTP API: {e}")
-            return -1
-        except Exception as e:
-            print(f"[ScalerManager] Unexpected error parsing queue length for '{queue_name}': {e}")
-            return -1
-
-    def start_worker(self, worker_type: str):
-        """Starts a worker of the specified type and manages local and shared lists."""
+    def get_queue_length(self, queue_name: str) -> int:
+        """Returns the messages waiting in the queue (cached for one tick), or -1 on error."""
+        return self.queue_metrics.get_queue_length(queue_name)
+
+    def estimate_arrival_rate(self, pending: int, completed_count_key: str, ewma_window: float,
+                              last_msg_count_attr_name: str, last_completed_count_attr_name: str,
+                              last_check_time_attr_name: str, lambda_attr_name: str) -> float:
+        """Updates and returns the EWMA of the arrival rate λ of a queue.
+
+        Every message that arrived since the last check was either completed by a worker or is still
+        pending, so each sample is (Δcompleted + Δpending) / Δt. Pending messages include those prefetched
+        by workers but not acked yet: with the ready count alone, the windows filled by new workers after a
+        scale-up would look like a drop in arrivals.
+        """
+        now = time.time()
+        completed = redis_cli.get_completed_count(completed_count_key)
+        last_pending = getattr(self, last_msg_count_attr_name)
+        last_completed = getattr(self, last_completed_count_attr_name)
+        elapsed = now - getattr(self, last_check_time_attr_name)
+        lambda_rate = getattr(self, lambda_attr_name)
+
+        if last_pending is not None and elapsed > 0:
+            # Counter resets (reset_counter) would give negative samples, clamp them to 0
+            sample = max(0.0, ((completed - last_completed) + (pending - last_pending)) / elapsed)
+            # Time-based smoothing factor, so the window means the same for any scaling interval
+            alpha = 1 - math.exp(-elapsed / ewma_window)
+            lambda_rate += alpha * (sample - lambda_rate)
+            setattr(self, lambda_attr_name, lambda_rate)
+
+        setattr(self, last_msg_count_attr_name, pending)
+        setattr(self, last_completed_count_attr_name, completed)
+        setattr(self, last_check_time_attr_name, now)
+        return lambda_rate
+
+    def estimate_worker_capacity(self, worker_type: str, completed: int, backlog: int, workers: int) -> float:
+        """Updates and returns the EWMA of the per-worker capacity C of a pool.
+
+        Only a saturated pool completes messages at its capacity; with an empty queue it completes them at the
+        arrival rate. A sample Δcompleted / Δt / workers is therefore only taken when the queue had a backlog at
+        both ends of the interval and the number of workers did not change.
+        """
+        now = time.time()
+        last = self.last_capacity_check[worker_type]
+        self.last_capacity_check[worker_type] = (now, completed, backlog, workers)
+        capacity = self.worker_capacity[worker_type]
+        if last is None:
+            return capacity
+        last_time, last_completed, last_backlog, last_workers = last
+        elapsed = now - last_time
+        if elapsed > 0 and workers > 0 and workers == last_workers and backlog > 0 and last_backlog > 0:
+            sample = (completed - last_completed) / elapsed / workers
+            if sample > 0:  # A counter reset or a stalled pool says nothing about the capacity
+                alpha = 1 - math.exp(-elapsed / config.WORKER_CAPACITY_EWMA_WINDOW)
+                capacity += alpha * (sample - capacity)
+                self.worker_capacity[worker_type] = capacity
+        return capacity
+
+    def spawn_worker(self, worker_type: str, activate: bool) -> dict:
+        """Starts a worker process and returns its local info; spare workers are spawned with activate=False."""
         worker_id = f"{worker_type}_{time.time_ns()}"
-        # The Event is created here (in the parent process) and will be passed as an argument to the child process.
-        # The reference to the Event is also stored LOCALLY.
+        # The Events and Values are created here (in the parent process) and passed to the child process.
+        # The references are also stored LOCALLY.
         stop_event = Event()
+        activate_event = Event()
+        if activate:
+            activate_event.set()
+        ready_at = Value('d', 0.0, lock=False)  # Each one is written only by the worker
+        first_message_at = Value('d', 0.0, lock=False)
 
         # Wrapper to ensure the Worker instance is created inside the new child process
-        def worker_runner(worker_class, wid, sevent):
-            instance = worker_class(wid, sevent)
+        def worker_runner(worker_class, wid, sevent, aevent, ready, first_message):
+            instance = worker_class(wid, sevent, aevent, ready, first_message)
             instance.run()
 
-        worker_process = None
+        worker_class = InsultFilterWorker if worker_type == "FilterWorker" else InsultProcessorWorker
+        worker_process = Process(target=worker_runner,
+                                 args=(worker_class, worker_id, stop_event, activate_event, ready_at, first_message_at),
+                                 daemon=True)
+        worker_process.start()
+        return {
+            'id': worker_id,
+            'process': worker_process,
+            'stop_event': stop_event, # The Event is stored locally
+            'activate_event': activate_event,
+            'ready_at': ready_at,
+            'first_message_at': first_message_at,
+            'scaled_at': None,  # Time of the scale-up decision that activated the worker
+            'type': worker_type
+        }
+
+    def replenish_spare_workers(self, worker_type: str, target: int):
+        """Drops dead spare workers and spawns new ones up to target, without waiting for them to connect."""
+        spare_workers = self.spare_workers[worker_type]
+        spare_workers[:] = [info for info in spare_workers if info['process'].is_alive()]
+        while len(spare_workers) < target:
+            info = self.spawn_worker(worker_type, activate=False)
+            spare_workers.append(info)
+            print(f"[ScalerManager] Started spare {worker_type}: {info['id']}")
+
+    def start_worker(self, worker_type: str):
+        """Activates a spare worker of the specified type (or starts a new one) and manages local and shared lists."""
         worker_pool_list_shared = None # Shared list from the Manager (only ID and type)
         worker_pool_local_dict = None # Local dictionary with Process and Event objects
 
         if worker_type == "FilterWorker":
-            worker_process = Process(target=worker_runner, args=(InsultFilterWorker, worker_id, stop_event),
-                                     daemon=True)
             worker_pool_list_shared = self.filter_worker_processes_info
             worker_pool_local_dict = self.filter_worker_processes_local
         elif worker_type == "InsultProcessorWorker":
-            worker_process = Process(target=worker_runner, args=(InsultProcessorWorker, worker_id, stop_event),
-                                     daemon=True)
             worker_pool_list_shared = self.insult_processor_worker_processes_info
             worker_pool_local_dict = self.insult_processor_worker_processes_local
         else:
             print(f"[ScalerManager] Unknown worker type: {worker_type}")
             return
 
+        scaled_at = time.time()
+        spare_workers = self.spare_workers[worker_type]
+        # Prefer the spares that already finished connecting (oldest first)
+        spare_workers.sort(key=lambda info: (not info['ready_at'].value, info['id']))
+        worker_info_local = None
+        while spare_workers:
+            candidate = spare_workers.pop(0)
+            if candidate['process'].is_alive():
+                worker_info_local = candidate
+                break
+        if worker_info_local is not None:
+            worker_info_local['activate_event'].set()
+            print(f"[ScalerManager] Activated spare {worker_type}: {worker_info_local['id']}")
+        else:
+            worker_info_local = self.spawn_worker(worker_type, activate=True)
+            print(f"[ScalerManager] Started {worker_type}: {worker_info_local['id']}")
+        worker_info_local['scaled_at'] = scaled_at
+        worker_id = worker_info_local['id']
 
         # Stores the COMPLETE information (including Process and Event) in the LOCAL dictionary of the ScalerManager
         # This reference is NOT serialized for the shared list
-        worker_pool_local_dict[worker_id] = {
-            'process': worker_process,
-            'stop_event': stop_event, # The Event is stored locally
-            'type': worker_type
-        }
+        worker_pool_local_dict[worker_id] = worker_info_local
 
         # Adds ONLY the minimum and pickleable information to the SHARED list (Manager)
         # This is what other processes (if any, or parts of the ScalerManager
@@ -116,8 +222,25 @@ class ScalerManagerPyro:
         worker_pool_list_shared.append(
             {'id': worker_id, 'type': worker_type}) # IMPORTANT: We do NOT include 'process' or 'stop_event' here.
 
-        worker_process.start()
-        print(f"[ScalerManager] Started {worker_type}: {worker_id}")
+    def collect_startup_metrics(self, worker_type: str, worker_pool_local_dict: dict):
+        """Records the time from the scale-up decision to the first message of every newly active worker."""
+        for worker_info_local in worker_pool_local_dict.values():
+            scaled_at = worker_info_local.get('scaled_at')
+            first_message_at = worker_info_local['first_message_at'].value
+            if scaled_at is not None and first_message_at:
+                self.time_to_first_message[worker_type].append(max(0.0, first_message_at - scaled_at))
+                worker_info_local['scaled_at'] = None  # Recorded once per activation
+
+    def get_startup_stats(self, worker_type: str) -> dict:
+        samples = list(self.time_to_first_message[worker_type])
+        if not samples:
+            return {"samples": 0}
+        return {
+            "samples": len(samples),
+            "last_s": round(samples[-1], 4),
+            "avg_s": round(sum(samples) / len(samples), 4),
+            "max_s": round(max(samples), 4),
+        }
 
 
     def stop_worker(self, worker_type: str):
@@ -164,20 +287,14 @@ class ScalerManagerPyro:
 
     def adjust_worker_pool(self, queue_name: str,
                            min_workers: int, max_workers: int,
-                           worker_capacity_c: float, average_response_time: float,
-                           last_msg_count_attr_name: str, last_check_time_attr_name: str,
-                           lambda_attr_name: str, worker_type_name: str):
+                           spare_workers: int, completed_count_key: str, ewma_window: float,
+                           last_msg_count_attr_name: str, last_completed_count_attr_name: str,
+                           last_check_time_attr_name: str, lambda_attr_name: str, worker_type_name: str):
         """Generic logic to adjust a worker pool."""
 
         worker_pool_list_shared = None # Shared list from the Manager (ID, type)
         worker_pool_local_dict = None # Local dictionary (ID -> Process, Event, type)
 
-        lambda_rate = 0.0
-        if queue_name == config.TEXT_QUEUE_NAME:
-            lambda_rate = config.FILTER_ARRIVAL_RATE
-        elif queue_name == config.INSULTS_PROCESSING_QUEUE_NAME:
-            lambda_rate = config.INSULT_ARRIVAL_RATE
-
         if worker_type_name == "FilterWorker":
             worker_pool_list_shared = self.filter_worker_processes_info
             worker_pool_local_dict = self.filter_worker_processes_local
@@ -188,14 +305,23 @@ class ScalerManagerPyro:
              print(f"[ScalerManager] Error: Unknown worker type during adjustment for {queue_name}.")
              return
 
-        backlog_b = self.get_queue_length_http(queue_name)
+        backlog_b = self.get_queue_length(queue_name)
         if backlog_b == -1:
             print(f"[ScalerManager] Cannot adjust {worker_type_name} pool, failed to get queue length for '{queue_name}'.")
             return
 
+        pending = self.queue_metrics.get_pending_messages(queue_name, config.WORKER_PREFETCH_COUNT)
+        lambda_rate = self.estimate_arrival_rate(max(pending, backlog_b), completed_count_key, ewma_window,
+                                                 last_msg_count_attr_name, last_completed_count_attr_name,
+                                                 last_check_time_attr_name, lambda_attr_name)
+
         current_workers_count = len(worker_pool_list_shared) # Use the size of the shared list (registered)
+        worker_capacity_c = self.estimate_worker_capacity(worker_type_name, getattr(self, last_completed_count_attr_name),
+                                                          backlog_b, current_workers_count)
+        average_response_time = 1 / worker_capacity_c  # A worker handles one message at a time
 
-        print(f"[ScalerManager-{worker_type_name}] State: Backlog (B)={backlog_b}, Est. Lambda (λ)={lambda_rate:.2f} msg/s")
+        print(f"[ScalerManager-{worker_type_name}] State: Backlog (B)={backlog_b}, Est. Lambda (λ)={lambda_rate:.2f} msg/s, "
+              f"Est. C={worker_capacity_c:.2f} msg/s")
 
         # Formula N = ceil((lambda * Tr + B) / C )
         numerator = (lambda_rate * average_response_time) + backlog_b
@@ -230,6 +356,10 @@ class ScalerManagerPyro:
                     break # Stop if we reached the minimum
 
 
+        # Spares taken by this adjustment (or that died) are replaced in the background: spawning does not wait
+        self.replenish_spare_workers(worker_type_name, spare_workers)
+        self.collect_startup_metrics(worker_type_name, worker_pool_local_dict)
+
         # --- Cleanup of worker processes that may have finished unexpectedly ---
         # Iterate over the shared list (with a copy) to find workers that *should* be registered
         # But which, when checked with the local Process object, are not alive.
@@ -302,9 +432,11 @@ class ScalerManagerPyro:
                     queue_name=config.TEXT_QUEUE_NAME,
                     min_workers=config.FILTER_MIN_WORKERS,
                     max_workers=config.FILTER_MAX_WORKERS,
-                    worker_capacity_c=config.FILTER_WORKER_CAPACITY_C,
-                    average_response_time=config.FILTER_AVERAGE_RESPONSE_TIME,
+                    spare_workers=config.FILTER_SPARE_WORKERS,
+                    completed_count_key=config.REDIS_FILTER_COMPLETED_KEY,
+                    ewma_window=config.FILTER_LAMBDA_EWMA_WINDOW,
                     last_msg_count_attr_name='last_filter_message_count',
+                    last_completed_count_attr_name='last_filter_completed_count',
                     last_check_time_attr_name='last_filter_queue_check_time',
                     lambda_attr_name='estimated_filter_arrival_rate_lambda',
                     worker_type_name="FilterWorker"
@@ -318,9 +450,11 @@ class ScalerManagerPyro:
                     queue_name=config.INSULTS_PROCESSING_QUEUE_NAME,
                     min_workers=config.INSULT_PROCESSOR_MIN_WORKERS,
                     max_workers=config.INSULT_PROCESSOR_MAX_WORKERS,
-                    worker_capacity_c=config.INSULT_PROCESSOR_WORKER_CAPACITY_C,
-                    average_response_time=config.INSULT_PROCESSOR_AVERAGE_RESPONSE_TIME,
+                    spare_workers=config.INSULT_PROCESSOR_SPARE_WORKERS,
+                    completed_count_key=config.REDIS_INSULT_COMPLETED_KEY,
+                    ewma_window=config.INSULT_PROCESSOR_LAMBDA_EWMA_WINDOW,
                     last_msg_count_attr_name='last_insult_message_count',
+                    last_completed_count_attr_name='last_insult_completed_count',
                     last_check_time_attr_name='last_insult_queue_check_time',
                     lambda_attr_name='estimated_insult_arrival_rate_lambda',
                     worker_type_name="InsultProcessorWorker"
@@ -337,6 +471,11 @@ class ScalerManagerPyro:
             "FilterWorker": self.filter_worker_processes_local,
             "InsultProcessorWorker": self.insult_processor_worker_processes_local
         }
+        # Spare workers are stopped and joined like the active ones (they are not in the shared lists)
+        for worker_type, spare_workers in self.spare_workers.items():
+            for worker_info_local in spare_workers:
+                all_local_pools[worker_type][worker_info_local['id']] = worker_info_local
+            spare_workers.clear()
 
         print("[ScalerManager] Signaling all workers to stop...")
         # Iterate over a copy of the items in the local dictionary to be able to modify the original
@@ -400,13 +539,19 @@ class ScalerManagerPyro:
                               pass # Already removed
 
 
+        self.queue_metrics.close()
         print("[ScalerManager] All workers stopped and lists cleaned.")
 
 
+    def capacity_summary(self, worker_type: str) -> str:
+        capacity = self.worker_capacity[worker_type]
+        return f"C={capacity:.2f}, Tr={1 / capacity:.8f}"
+
     @Pyro4.expose
     def get_scaler_stats(self):
-        filter_queue_len = self.get_queue_length_http(config.TEXT_QUEUE_NAME)
-        insult_proc_queue_len = self.get_queue_length_http(config.INSULTS_PROCESSING_QUEUE_NAME)
+        # Served from the metrics cache when the main loop probed the queues during this tick
+        filter_queue_stats = self.queue_metrics.get_queue_stats(config.TEXT_QUEUE_NAME)
+        insult_proc_queue_stats = self.queue_metrics.get_queue_stats(config.INSULTS_PROCESSING_QUEUE_NAME)
 
         # Need to use the size of the shared lists for the number of active workers
         # that the ScalerManager *believes* are alive/registered.
@@ -416,22 +561,28 @@ class ScalerManagerPyro:
         return {
             "filter_workers_pool": {
                 "active_workers": active_filter_workers,
-                "text_queue_length": filter_queue_len if filter_queue_len != -1 else "Error",
-                # The estimated lambda is stored as an attribute of the ScalerManager object
-                "total_texts_censored_redis": redis_cli.get_censored_texts_count(),
+                "text_queue_length": filter_queue_stats['messages'] if filter_queue_stats else "Error",
+                "text_queue_consumers": filter_queue_stats['consumers'] if filter_queue_stats else "Error",
+                "estimated_arrival_rate_lambda": round(self.estimated_filter_arrival_rate_lambda, 2),
+                "spare_workers": len(self.spare_workers["FilterWorker"]),
+                "time_to_first_message": self.get_startup_stats("FilterWorker"),
+                "censored_texts_stored_redis": redis_cli.get_censored_texts_count(),  # Capped at REDIS_CENSORED_TEXTS_MAX
                 "filter_processed_redis_counter": redis_cli.r.get(config.REDIS_PROCESSED_COUNTER_KEY) or 0,
             },
             "insult_processor_pool": {  # NEW
                 "active_workers": active_insult_processors,
-                "insults_processing_queue_length": insult_proc_queue_len if insult_proc_queue_len != -1 else "Error",
-                 # The estimated lambda is stored as an attribute of the ScalerManager object
+                "insults_processing_queue_length": insult_proc_queue_stats['messages'] if insult_proc_queue_stats else "Error",
+                "insults_processing_queue_consumers": insult_proc_queue_stats['consumers'] if insult_proc_queue_stats else "Error",
+                "estimated_arrival_rate_lambda": round(self.estimated_insult_arrival_rate_lambda, 2),
+                "spare_workers": len(self.spare_workers["InsultProcessorWorker"]),
+                "time_to_first_message": self.get_startup_stats("InsultProcessorWorker"),
                 "insults_processed_redis_counter": redis_cli.r.get(config.REDIS_PROCESSED_COUNTER_KEY) or 0,
             },
             "config_summary": {
                 "filter_min_max_workers": f"{config.FILTER_MIN_WORKERS}-{config.FILTER_MAX_WORKERS}",
-                "filter_C_Tr": f"C={config.FILTER_WORKER_CAPACITY_C}, Tr={config.FILTER_AVERAGE_RESPONSE_TIME}",
+                "filter_C_Tr": self.capacity_summary("FilterWorker"),
                 "insult_proc_min_max_workers": f"{config.INSULT_PROCESSOR_MIN_WORKERS}-{config.INSULT_PROCESSOR_MAX_WORKERS}",
-                "insult_proc_C_Tr": f"C={config.INSULT_PROCESSOR_WORKER_CAPACITY_C}, Tr={config.INSULT_PROCESSOR_AVERAGE_RESPONSE_TIME}",
+                "insult_proc_C_Tr": self.capacity_summary("InsultProcessorWorker"),
             }
         }
 
@@ -439,6 +590,17 @@ class ScalerManagerPyro:
     def get_censored_texts(self):
          return redis_cli.get_censored_texts(0, -1)
 
+    @Pyro4.expose
+    def get_censored_texts_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        """[next_cursor, censored texts] read with LRANGE; next_cursor is 0 once the list has been read."""
+        cursor, limit = max(0, int(cursor)), clamp_limit(limit)
+        texts = redis_cli.get_censored_texts(cursor, cursor + limit - 1)
+        return [cursor + len(texts) if len(texts) == limit else 0, texts]
+
+    @Pyro4.expose
+    def iter_censored_texts(self, limit=DEFAULT_PAGE_SIZE):
+        return iter_pages(self.get_censored_texts_page, limit)
+
     @Pyro4.expose
     def reset_counter(self):
         """Resets the processed texts counter in Redis."""
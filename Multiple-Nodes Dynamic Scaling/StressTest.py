@@ -1,12 +1,19 @@
+import os
+import threading
 import pika
 import time
 import random
 import argparse
 import Pyro4
 import config
+from RedisManager import completed_channel, redis_cli
 from multiprocessing import Process, Queue as MPQueue
 import sys # Import sys to exit if NS is missing
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Shared"))
+from LatencyHistogram import LatencyHistogram
+from LoadProfile import ARRIVALS, PROFILES, schedule
+
 # --- Test Data ---
 INSULTS_TO_PUBLISH = ["tonto", "lleig", "boig", "idiota", "estúpid", "inútil", "desastre", "fracassat", "covard",
                       "mentider",
@@ -22,6 +29,7 @@ TEXTS_TO_SEND_FOR_FILTERING = [
 ]
 
 FIXED_CONCURRENCY_LEVEL = 5 # Fixed number of concurrent processes
+OPEN_LOOP_START_DELAY = 1.0 # s for every sender to connect before the shared schedule starts
 
 def create_rabbitmq_connection(host_url):
     """Helper function to create a RabbitMQ connection."""
@@ -140,30 +148,110 @@ def insult_sender_worker(host_url, queue_name, results_mp_queue, num_messages_to
         results_mp_queue.put({'type': 'insult', 'sent': sent_count, 'errors': error_count})
 
 
-def get_redis_processed_count(scaler_proxy, test_type):
-    """Gets the current processed count from Redis via the ScalerManager proxy."""
-    try:
-        stats = scaler_proxy.get_scaler_stats()
-        if test_type == 'filter_text':
-            # Need to access the nested structure correctly
-            count_str = stats.get('filter_workers_pool', {}).get('filter_processed_redis_counter', '0')
-        elif test_type == 'add_insult':
-            # Need to access the nested structure correctly
-             count_str = stats.get('insult_processor_pool', {}).get('insults_processed_redis_counter', '0')
-        else:
-            return 0 # Should not happen with argparse choices
-
-        # Redis counters are typically integers stored as strings
-        return int(count_str)
-    except Exception as e:
-        print(f"Error getting Redis processed count from ScalerManager: {e}")
-        return -1 # Indicate an error
+def open_loop_sender_worker(host_url, queue_name, test_type, results_mp_queue, load):
+    """Publishes at the intended times of the load schedule, whatever the broker's speed (open loop).
 
+    Publisher confirms make a publish return once the broker has the message, so the latency from
+    the intended send time shows when the senders fall behind.
+    """
+    sent_count = 0
+    error_count = 0
+    histogram = LatencyHistogram()
+    connection = None
+    while connection is None:
+        connection = create_rabbitmq_connection(host_url)
+        if connection is None:
+            time.sleep(1)
 
-def run_stress_test(num_messages, test_type):
+    try:
+        channel = connection.channel()
+        channel.queue_declare(queue=queue_name, durable=True)
+        channel.confirm_delivery()
+        for offset in schedule(load['profile'], load['rate'], load['duration'], load['arrivals'], load['seed'],
+                               load['phase']):
+            intended = load['start_time'] + offset
+            delay = intended - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            if test_type == 'filter_text':
+                body = random.choice(TEXTS_TO_SEND_FOR_FILTERING)
+            else:
+                body = random.choice(INSULTS_TO_PUBLISH) + "_" + str(random.randint(1000, 9999))
+            try:
+                channel.basic_publish(exchange='', routing_key=queue_name, body=body)
+                histogram.record(time.time() - intended)
+                sent_count += 1
+            except pika.exceptions.AMQPError:
+                error_count += 1
+                if not channel.is_open:
+                    print("StressTest Open-Loop Worker: Channel closed. Exiting worker.")
+                    break
+    except Exception as e:
+        print(f"StressTest Open-Loop Worker Major Error: {e}")
+        error_count += 1
+    finally:
+        if connection and connection.is_open:
+            connection.close()
+        results_mp_queue.put({'type': test_type, 'sent': sent_count, 'errors': error_count, 'latency': histogram})
+
+
+class CompletionTracker:
+    """Follows a worker pool's completions through the notification its workers publish on every flush.
+
+    Notifications wake the waiting loop and feed the per-second throughput series; the pool's Redis
+    counter stays the exact reference and is read only when the target looks reached or nothing arrives.
+    """
+    def __init__(self, completed_key: str):
+        self.completed_key = completed_key
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.notified = 0
+        self.series = {}  # second since start_time -> messages completed in it
+        self.start_time = time.time()
+        self.last_completion_time = None
+        # Subscribed before reading the baseline, so no flush after it is missed
+        self.pubsub = redis_cli.r.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(**{completed_channel(completed_key): self._on_flush})
+        self.listener = self.pubsub.run_in_thread(sleep_time=0.1, daemon=True)
+        self.initial_count = redis_cli.get_completed_count(completed_key)
+
+    def _on_flush(self, message):
+        now = time.time()
+        with self.lock:
+            completed = int(message['data'])
+            self.notified += completed
+            second = max(0, int(now - self.start_time))
+            self.series[second] = self.series.get(second, 0) + completed
+            self.last_completion_time = now
+        self.changed.set()
+
+    def wait_for(self, target_count: int, timeout: float) -> int:
+        """Blocks until the pool's counter reaches target_count or timeout s pass; returns the last count read."""
+        deadline = time.time() + timeout
+        current_count = redis_cli.get_completed_count(self.completed_key)
+        while current_count < target_count and time.time() < deadline:
+            woken = self.changed.wait(timeout=1.0)
+            self.changed.clear()
+            with self.lock:
+                expected_count = self.initial_count + self.notified
+            print(f"Processed: {min(expected_count, target_count)}/{target_count}...", end='\r')
+            if not woken or expected_count >= target_count:
+                current_count = redis_cli.get_completed_count(self.completed_key)
+        return current_count
+
+    def close(self):
+        self.listener.stop()
+        self.pubsub.close()
+
+
+def run_stress_test(num_messages, test_type, load=None, concurrency=FIXED_CONCURRENCY_LEVEL):
     print(f"Starting Stress Test for {test_type}...")
-    print(f"Total messages to send: {num_messages}")
-    print(f"Concurrency (senders): {FIXED_CONCURRENCY_LEVEL}")
+    if load:
+        print(f"Open loop: {load['rate']} messages/s target for {load['duration']} s "
+              f"({load['profile']} profile, {load['arrivals']} arrivals)")
+    else:
+        print(f"Total messages to send: {num_messages}")
+    print(f"Concurrency (senders): {concurrency}")
     print(f"Target RabbitMQ: {config.RABBITMQ_URL}")
     print(f"Pyro NS for stats: {config.PYRO_NS_HOST}:{config.PYRO_NS_PORT}")
     print("-" * 30)
@@ -183,10 +271,10 @@ def run_stress_test(num_messages, test_type):
     # Reset Counter in Redis
     scaler_proxy.reset_counter()
 
-    initial_processed_count = get_redis_processed_count(scaler_proxy, test_type)
-    if initial_processed_count == -1:
-         print("Failed to get initial processed count from Redis. Exiting.")
-         sys.exit(1)
+    # Completions are pushed by the workers on each flush, instead of polling the ScalerManager
+    completed_key = config.REDIS_FILTER_COMPLETED_KEY if test_type == 'filter_text' else config.REDIS_INSULT_COMPLETED_KEY
+    tracker = CompletionTracker(completed_key)
+    initial_processed_count = tracker.initial_count
     print(f"Initial processed count in Redis ({test_type}): {initial_processed_count}")
     print("-" * 30)
 
@@ -210,25 +298,50 @@ def run_stress_test(num_messages, test_type):
         print(f"Error: Unknown test type '{test_type}'. Exiting.")
         sys.exit(1)
 
-    # Calculate messages per worker
-    messages_per_worker = num_messages // FIXED_CONCURRENCY_LEVEL
-    remainder = num_messages % FIXED_CONCURRENCY_LEVEL
-
-    print(f"Distributing {num_messages} messages among {FIXED_CONCURRENCY_LEVEL} workers:")
-    print(f"  {messages_per_worker} messages per worker.")
-    if remainder > 0:
-        print(f"  The last worker will send {messages_per_worker + remainder} messages.")
-
     start_time = time.time()  # Start time of the overall test
-
-    # Start sender processes
-    for i in range(FIXED_CONCURRENCY_LEVEL):
-        messages_this_worker = messages_per_worker + (remainder if i == FIXED_CONCURRENCY_LEVEL - 1 else 0)
-        p = Process(target=worker_target,
-                    args=(config.RABBITMQ_URL, queue_name, results_mp_queue, messages_this_worker),
-                    daemon=True)
-        sender_processes.append(p)
-        p.start()
+    if load:
+        start_time += OPEN_LOOP_START_DELAY  # Open-loop senders connect first, then share this start time
+    tracker.start_time = start_time  # Origin of the per-second throughput series
+
+    if load:
+        # Every sender follows its own schedule with an equal share of the rate
+        for i in range(concurrency):
+            sender_load = dict(load, rate=load['rate'] / concurrency, start_time=start_time, seed=i,
+                               phase=i / concurrency)
+            p = Process(target=open_loop_sender_worker,
+                        args=(config.RABBITMQ_URL, queue_name, test_type, results_mp_queue, sender_load),
+                        daemon=True)
+            sender_processes.append(p)
+            p.start()
+    else:
+        # Calculate messages per worker
+        messages_per_worker = num_messages // concurrency
+        remainder = num_messages % concurrency
+
+        print(f"Distributing {num_messages} messages among {concurrency} workers:")
+        print(f"  {messages_per_worker} messages per worker.")
+        if remainder > 0:
+            print(f"  The last worker will send {messages_per_worker + remainder} messages.")
+
+        # Start sender processes
+        for i in range(concurrency):
+            messages_this_worker = messages_per_worker + (remainder if i == concurrency - 1 else 0)
+            p = Process(target=worker_target,
+                        args=(config.RABBITMQ_URL, queue_name, results_mp_queue, messages_this_worker),
+                        daemon=True)
+            sender_processes.append(p)
+            p.start()
+
+    # Collect one result per sender (read before joining: a child exits only once its result is read)
+    total_sent_by_stress_test = 0
+    total_send_errors_by_stress_test = 0
+    send_latency = LatencyHistogram()
+    for _ in sender_processes:
+        res = results_mp_queue.get()
+        total_sent_by_stress_test += res.get('sent', 0)
+        total_send_errors_by_stress_test += res.get('errors', 0)
+        if 'latency' in res:
+            send_latency.merge(res['latency'])
 
     # Wait for all sender processes to complete sending
     for p in sender_processes:
@@ -236,16 +349,10 @@ def run_stress_test(num_messages, test_type):
 
     end_sending_time = time.time() # Time when all sender processes have finished
     print(f"{test_type} sender processes finished sending.")
-
-    total_sent_by_stress_test = 0
-    total_send_errors_by_stress_test = 0
-    while not results_mp_queue.empty():
-        try:
-            res = results_mp_queue.get_nowait()
-            total_sent_by_stress_test += res.get('sent', 0)
-            total_send_errors_by_stress_test += res.get('errors', 0)
-        except Exception:
-            pass # Ignore if queue is empty unexpectedly
+    if send_latency.count:
+        latency = send_latency.summary()
+        print(f"Publish latency from intended send time (ms): p50 {latency['p50_ms']:.3f}  p90 {latency['p90_ms']:.3f}  "
+              f"p99 {latency['p99_ms']:.3f}  p99.9 {latency['p99_9_ms']:.3f}  max {latency['max_ms']:.3f}")
 
 
     print(f"Stress test client attempted to send {total_sent_by_stress_test + total_send_errors_by_stress_test} messages ({test_type}). Sent {total_sent_by_stress_test}, failed {total_send_errors_by_stress_test}.")
@@ -254,6 +361,7 @@ def run_stress_test(num_messages, test_type):
         print("No messages were successfully sent by the stress test client. Cannot measure worker throughput.")
         print("-" * 30)
         print(f"Stress Test ({test_type}) Finished.")
+        tracker.close()
         sys.exit(0) # Exit gracefully if nothing was sent
 
     # --- Phase 2: Wait for workers to process the sent messages ---
@@ -261,26 +369,15 @@ def run_stress_test(num_messages, test_type):
     # Calculate the target processed count we expect
     target_processed_count = initial_processed_count + total_sent_by_stress_test
 
-    current_processed_count = get_redis_processed_count(scaler_proxy, test_type)
-
-    # Wait until the target processed count is reached
-    while current_processed_count < target_processed_count:
-        # Add a timeout to prevent infinite waiting if something goes wrong
-        if time.time() - start_time > 600: # 10 minutes timeout
-            print("\nWarning: Timeout waiting for messages to be processed.")
-            print(f"Current processed count: {current_processed_count}, Target: {target_processed_count}")
-            break # Exit the waiting loop
-
-        time.sleep(0.01) # Poll frequently
-
-        current_processed_count = get_redis_processed_count(scaler_proxy, test_type)
-        if current_processed_count == -1:
-            print("\nError: Lost connection to ScalerManager while waiting for processing. Exiting.")
-            sys.exit(1)
-        # Optional: print progress
-        print(f"Processed: {current_processed_count}/{target_processed_count}...", end='\r')
+    # Wait until the target processed count is reached (10 minutes timeout from the start of the test)
+    current_processed_count = tracker.wait_for(target_processed_count, timeout=max(0.0, start_time + 600 - time.time()))
+    tracker.close()
+    if current_processed_count < target_processed_count:
+        print("\nWarning: Timeout waiting for messages to be processed.")
+        print(f"Current processed count: {current_processed_count}, Target: {target_processed_count}")
 
-    end_processing_wait_time = time.time()
+    # The last flush notification is when the final message was stored, not when this loop noticed it
+    end_processing_wait_time = tracker.last_completion_time or time.time()
     print(f"\nTarget processed count ({target_processed_count}) reached or timeout occurred.")
     print(f"Final processed count in Redis ({test_type}): {current_processed_count}")
 
@@ -294,6 +391,8 @@ def run_stress_test(num_messages, test_type):
     print(f"Time taken to process messages: {processing_duration:.3f} seconds")
     print(f"Time taken to send messages: {end_sending_time - start_time:.3f} seconds")
 
+    print(f"Drain time after the last message was sent: {max(0.0, end_processing_wait_time - end_sending_time):.3f} seconds")
+
     worker_throughput = 0
     if processing_duration > 0:
         worker_throughput = processed_during_test / processing_duration
@@ -301,6 +400,11 @@ def run_stress_test(num_messages, test_type):
     else:
         print("Processing duration was zero or negative, cannot calculate worker throughput.")
 
+    if tracker.series:
+        print("\n--- Throughput per second (completed messages) ---")
+        for second in range(max(tracker.series) + 1):
+            print(f"  {second:>4}s: {tracker.series.get(second, 0)}")
+
 
     # --- Phase 4: Get final statistics from ScalerManager ---
     # We already have the scaler_proxy connection
@@ -340,17 +444,31 @@ if __name__ == "__main__":
     parser.add_argument(
         "-m", "--messages",
         type=int,
-        required=True, # Make this argument mandatory
-        help="Total number of messages to send during the test."
+        help="Total number of messages to send during the test (closed loop)."
     )
+    parser.add_argument("-r", "--rate", type=float, default=None,
+                        help="Open loop: target messages/second over all senders, sent on schedule for --duration")
+    parser.add_argument("-d", "--duration", type=float, default=10,
+                        help="Open-loop test duration in seconds (default: 10)")
+    parser.add_argument("--profile", choices=PROFILES, default="constant",
+                        help="Open-loop rate profile: constant, ramp (0 to --rate), step (4 steps) or spike (default: constant)")
+    parser.add_argument("--arrivals", choices=ARRIVALS, default="uniform",
+                        help="Open-loop spacing between messages: uniform or poisson (default: uniform)")
+    parser.add_argument("-c", "--concurrency", type=int, default=FIXED_CONCURRENCY_LEVEL,
+                        help=f"Number of sender processes (default: {FIXED_CONCURRENCY_LEVEL})")
     parser.add_argument("mode", # Changed from --type to positional 'mode'
                         choices=['add_insult', 'filter_text'],
                         help="The functionality to test ('add_insult' or 'filter_text')")
     args = parser.parse_args()
 
-    if args.messages <= 0:
-        print("Error: --messages must be a positive integer.")
+    load = None
+    if args.rate is not None:
+        if args.rate <= 0 or args.duration <= 0:
+            print("Error: --rate and --duration must be positive.")
+            sys.exit(1)
+        load = {'rate': args.rate, 'duration': args.duration, 'profile': args.profile, 'arrivals': args.arrivals}
+    elif args.messages is None or args.messages <= 0:
+        print("Error: --messages must be a positive integer (or use --rate for an open-loop test).")
         sys.exit(1)
 
-
-    run_stress_test(args.messages, args.mode)
\ No newline at end of file
+    run_stress_test(args.messages, args.mode, load, args.concurrency)
\ No newline at end of file
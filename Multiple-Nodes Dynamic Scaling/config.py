@@ -10,6 +10,12 @@ TEXT_QUEUE_NAME = 'text_queue'
 INSULTS_PROCESSING_QUEUE_NAME = 'add_insult_queue'
 INSULTS_EXCHANGE_NAME = 'insults_exchange'
 INSULTS_BROADCAST_EXCHANGE_NAME = 'Insults_broadcast'
+STARTUP_METRICS_SAMPLES = 100  # Recent scale-ups kept for the time-to-first-message stats
+QUEUE_METRICS_CACHE_TTL = 0.05  # s a queue depth probe is reused (shorter than the scaling intervals)
+
+# Worker consumption (basic_consume push mode)
+WORKER_PREFETCH_COUNT = 200  # Unacknowledged messages the broker pushes ahead to each worker
+WORKER_CONSUME_TIMEOUT = 0.1  # s the consumer waits for a message before checking stop_event
 
 # Redis Configuration
 REDIS_HOST = 'localhost'
@@ -17,7 +23,12 @@ REDIS_PORT = 6379
 REDIS_DB = 0
 REDIS_INSULTS_SET_KEY = 'insults_set'
 REDIS_CENSORED_TEXTS_LIST_KEY = 'censored_texts_list'
+REDIS_CENSORED_TEXTS_MAX = 10000  # Newest censored texts kept (LTRIM); older ones are dropped
 REDIS_PROCESSED_COUNTER_KEY = 'processed'
+REDIS_FILTER_COMPLETED_KEY = 'filter_completed'  # Texts completed by the FilterWorker pool (for the λ estimator)
+REDIS_INSULT_COMPLETED_KEY = 'insult_processor_completed'  # Insults completed by the InsultProcessorWorker pool
+REDIS_WRITE_BUFFER_SIZE = 100  # Buffered worker writes sent in one pipeline (their messages are acked together)
+REDIS_WRITE_BUFFER_MAX_DELAY = 0.05  # s the oldest buffered write may wait before a flush
 
 # Pyro Configuration
 PYRO_NS_HOST = 'localhost'
@@ -29,18 +40,21 @@ PYRO_DAEMON_HOST = "localhost"
 # Dynamic Scaling Parameters for InsultFilterWorker pool (text_queue)
 FILTER_MIN_WORKERS = 1
 FILTER_MAX_WORKERS = 100
+FILTER_SPARE_WORKERS = 2  # Pre-started, pre-connected idle workers activated on scale-up
+# Starting value of the per-worker capacity C (measured with basic_get polling workers). The ScalerManager
+# re-estimates C from the completed counter while the queue has a backlog, and uses Tr = 1/C
 FILTER_WORKER_CAPACITY_C = 1159.75 # msg/s
-FILTER_AVERAGE_RESPONSE_TIME = 0.00086225479 # s
-FILTER_ARRIVAL_RATE = 50000 # msg/s
 FILTER_SCALING_INTERVAL = 0.1  # s
+FILTER_LAMBDA_EWMA_WINDOW = 2.0  # s, time constant of the arrival rate (λ) moving average
 
 # Dynamic Scaling Parameters for InsultProcessorWorker pool (insults_processing_queue) - NOU
 INSULT_PROCESSOR_MIN_WORKERS = 1
 INSULT_PROCESSOR_MAX_WORKERS = 100
-INSULT_PROCESSOR_WORKER_CAPACITY_C = 1179.38 # insults/s
-INSULT_PROCESSOR_AVERAGE_RESPONSE_TIME = 0.00084790313 # s
-INSULT_ARRIVAL_RATE = 45000 # insults/s
+INSULT_PROCESSOR_SPARE_WORKERS = 1
+INSULT_PROCESSOR_WORKER_CAPACITY_C = 1179.38 # insults/s, starting value (see FILTER_WORKER_CAPACITY_C)
 INSULT_PROCESSOR_SCALING_INTERVAL = 0.1 # s
+INSULT_PROCESSOR_LAMBDA_EWMA_WINDOW = 2.0 # s
+WORKER_CAPACITY_EWMA_WINDOW = 5.0  # s, time constant of the measured per-worker capacity (C) moving average
 
 
 # Insult Service (Broadcaster) Configuration
@@ -36,10 +36,13 @@ class InsultClient:
                 pass
 
     def send_insults(self):
+        # A batch proxy sends all the (oneway) add_insult calls to the load balancer in a single message
+        batch = Pyro4.batch(self.load_balancer)
         for insult in self.insults:
-            self.load_balancer.add_insult(insult)
-            self.load_balancer.add_insult(insult)
+            batch.add_insult(insult)
+            batch.add_insult(insult)
             print("Insult sent to server:", insult)
+        batch(oneway=True)
 
     def broadcast(self):
         while True:
@@ -72,12 +75,14 @@ def main():
             t = input()
             if t == "I":
                 try:
-                    print("Insult list:", client.load_balancer.get_insults())
+                    cursor, insults = client.load_balancer.get_insults_page(0)
+                    print(f"Insult list (first {len(insults)}{', more available' if cursor else ''}):", insults)
                 except Pyro4.errors.CommunicationError as e:
                     print(f"Communication error: {e}.")
             elif t == "T":
                 try:
-                    print("Censored texts:", client.load_balancer.get_censored_texts())
+                    cursor, censored_texts = client.load_balancer.get_censored_texts_page(0)
+                    print(f"Censored texts (first {len(censored_texts)}{', more available' if cursor else ''}):", censored_texts)
                 except Pyro4.errors.CommunicationError as e:
                     print(f"Communication error: {e}.")
             elif t == "K":
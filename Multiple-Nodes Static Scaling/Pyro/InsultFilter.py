@@ -1,44 +1,69 @@
 import Pyro4
 import argparse
+import os
 import sys
 import redis
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from CallAcks import CallAcks
+from InsultMatcher import InsultMatcher
+from Pagination import DEFAULT_PAGE_SIZE, iter_pages
+from ResultsStore import BoundedResults
+from RedisCounter import DEFAULT_SHARDS, MAX_SHARDS, BufferedCounter
+
 @Pyro4.expose
 @Pyro4.behavior(instance_mode="single")
 class InsultFilter:
+    counter_shards = DEFAULT_SHARDS  # Set by main(): Pyro creates the instance itself
+
     def __init__(self):
-        self.censored_Texts = []
+        self.censored_Texts = BoundedResults()  # Newest distinct censored texts
         self.insults_List = ["beneit", "capsigrany", "ganàpia", "nyicris", "gamarús", "bocamoll", "murri", "dropo", "bleda", "xitxarel·lo"]
+        self.matcher = InsultMatcher(self.insults_List)  # Compiled index of insults_List used by filter_text
         self.counter_key = "COUNTER"
         self.client = redis.Redis(db=0, decode_responses=True)
+        self.counter = BufferedCounter(self.client, self.counter_key, shards=self.counter_shards)
+        self.acks = CallAcks()  # Oneway calls processed per client
 
-    def add_insult(self, insult):
-        if insult not in self.insults_List:
+    @Pyro4.oneway
+    def add_insult(self, insult, client_id=None):
+        if self.matcher.add(insult):
             self.insults_List.append(insult)
             # print(f"Insult added: {insult}")
         # else:
             # print(f"Insult already exists: {insult}")
+        self.acks.ack(client_id)
+
+    def get_acked(self, client_id):
+        # Regular call: answered after the client's earlier oneway calls on this connection (see CallAcks)
+        return self.acks.take(client_id)
 
     def filter_text(self, text):
-        censored_text = ""
-        # We use a copy of the insults list to avoid any modifications it while iterating
-        current_insults = list(self.insults_List) # Use the insult list available to this service
-        for word in text.split():
-            if word.lower() in current_insults:
-                censored_text += "CENSORED "
-            else:
-                censored_text += word + " "
-        return censored_text
+        return self.matcher.censor(text)
 
     def filter_service(self, text):
         censored_text = self.filter_text(text)
-        self.censored_Texts.append(censored_text)
-        self.client.incr(self.counter_key)
-        return censored_text.strip() # We add strip() to remove trailing spaces
+        self.censored_Texts.add(censored_text)
+        self.counter.incr()
+        return censored_text
+
+    def filter_many(self, texts):
+        # Batch version of filter_service: one call, results returned in the same order as texts
+        censored_texts = [self.filter_text(text) for text in texts]
+        self.censored_Texts.add_many(censored_texts)
+        self.counter.incr(len(texts))
+        return censored_texts
 
     def get_censored_texts(self):
-        return self.censored_Texts
+        return self.censored_Texts.items()
+
+    def get_censored_texts_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, censored texts]; next_cursor is 0 once every stored text has been returned
+        return self.censored_Texts.page(cursor, limit)
+
+    def iter_censored_texts(self, limit=DEFAULT_PAGE_SIZE):
+        return iter_pages(self.get_censored_texts_page, limit)
 
 def main():
     parser = argparse.ArgumentParser(description="Pyro Insult Filter")
@@ -47,10 +72,13 @@ def main():
 
     parser.add_argument("-id", "--instance-id", type=int, default=1, required=True,
                         help="Filter instance ID (e.g., 1, 2, 3)")
+    parser.add_argument("--counter-shards", type=int, choices=range(1, MAX_SHARDS + 1), default=DEFAULT_SHARDS,
+                        metavar="N", help=f"Redis keys COUNTER is spread over, 1-{MAX_SHARDS}; more keys spare one hot key when many processes count (default: {DEFAULT_SHARDS})")
     args = parser.parse_args()
     pyro_name = f"pyro.filter.{args.instance_id}"
     print(f"Starting Pyro Insult Filter with ID {args.instance_id} and name '{pyro_name}'...")
 
+    Pyro4.config.ONEWAY_THREADED = False  # Oneway calls run in order on their connection (see CallAcks)
     try:
         daemon = Pyro4.Daemon(host=None, port=args.port)  # Create the Pyro daemon with the specified port
         ns = Pyro4.locateNS()
@@ -63,6 +91,7 @@ def main():
         print(f"An error occurred during Pyro initialization: {e}", file=sys.stderr)
         sys.exit(1)
 
+    InsultFilter.counter_shards = args.counter_shards
     uri = daemon.register(InsultFilter)  # Register the service as a Pyro object
     # Register the instance with the unique name
     try:
@@ -72,7 +101,13 @@ def main():
         print(f"Error registering service '{pyro_name}' with the name server: {e}", file=sys.stderr)
         sys.exit(1)
     print(f"Insult Filter ID {args.instance_id} is ready.")
-    daemon.requestLoop()  # Start the event loop of the server to wait for calls
+    try:
+        daemon.requestLoop()  # Start the event loop of the server to wait for calls
+    finally:
+        try:
+            ns.remove(pyro_name)  # Load balancers started with --discover drop this instance
+        except Pyro4.errors.PyroError:
+            pass
 
 
 if __name__ == "__main__":
@@ -1,27 +1,52 @@
 import argparse
 import random
 import Pyro4
+import os
 import sys
 import redis
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from CallAcks import CallAcks
+from FanOut import Broadcaster, pyro_sender
+from Pagination import DEFAULT_PAGE_SIZE, iter_pages, page
+from RedisCounter import DEFAULT_SHARDS, MAX_SHARDS, BufferedCounter
+
 @Pyro4.expose
 @Pyro4.behavior(instance_mode="single")
 class InsultService:
+    counter_shards = DEFAULT_SHARDS  # Set by main(): Pyro creates the instance itself
+
     def __init__(self):
         self.insults_List = []
-        self.subscribers = []
+        self.fanout = Broadcaster(pyro_sender)  # Subscribers, each with its own proxy and send queue
         self.counter_key = "COUNTER"
         self.client = redis.Redis(db=0, decode_responses=True)
+        self.counter = BufferedCounter(self.client, self.counter_key, shards=self.counter_shards)
+        self.acks = CallAcks()  # Oneway calls processed per client
 
-    def add_insult(self, insult):
+    @Pyro4.oneway
+    def add_insult(self, insult, client_id=None):
         if insult not in self.insults_List:
             self.insults_List.append(insult)
-        self.client.incr(self.counter_key)
+        self.counter.incr()
+        self.acks.ack(client_id)
+
+    def get_acked(self, client_id):
+        # Regular call: answered after the client's earlier oneway calls on this connection (see CallAcks)
+        return self.acks.take(client_id)
 
     def get_insults(self):
         return self.insults_List
 
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, insults]; next_cursor is 0 once every insult has been returned
+        return page(self.insults_List, cursor, limit)
+
+    def iter_insults(self, limit=DEFAULT_PAGE_SIZE):
+        # Streamed by Pyro one page per next() call
+        return iter_pages(self.get_insults_page, limit)
+
     def insult_me(self):
         if not self.insults_List:
             return "No insults available"
@@ -31,19 +56,22 @@ class InsultService:
 
     def subscribe(self, url):
         try:
-            client_proxy = Pyro4.Proxy(url)
-            self.subscribers.append(client_proxy)
-            print("New subscriber added.")
+            if self.fanout.subscribe(str(url)):  # Keeps one proxy per subscriber
+                print("New subscriber added.")
         except Exception as e:
              print(f"Error afegint subscriptor {url}: {e}")
 
+    @Pyro4.oneway
     def notify_subscribers(self, insult):
-        for subscriber in self.subscribers:
-            try:
-                print(f"Notifying subscriber: {subscriber} with:" + insult) # Comentem
-                subscriber.receive_insult(insult)
-            except Pyro4.errors.CommunicationError:
-                print("Failed to contact a subscriber.")
+        # Queued for every subscriber; the deliveries run on the fan-out pool
+        self.fanout.publish(insult)
+
+    @Pyro4.oneway
+    def notify_many(self, insults):
+        self.fanout.publish_many(insults)
+
+    def get_fanout_stats(self):
+        return self.fanout.stats()
 
 
 def main():
@@ -53,10 +81,13 @@ def main():
 
     parser.add_argument("-id", "--instance-id", type=int, default=1, required=True,
                         help="Service instance ID (e.g., 1, 2, 3)")
+    parser.add_argument("--counter-shards", type=int, choices=range(1, MAX_SHARDS + 1), default=DEFAULT_SHARDS,
+                        metavar="N", help=f"Redis keys COUNTER is spread over, 1-{MAX_SHARDS}; more keys spare one hot key when many processes count (default: {DEFAULT_SHARDS})")
     args = parser.parse_args()
     pyro_name = f"pyro.service.{args.instance_id}"
     print(f"Starting Pyro Insult Service with ID {args.instance_id} and name '{pyro_name}'...")
 
+    Pyro4.config.ONEWAY_THREADED = False  # Oneway calls run in order on their connection (see CallAcks)
     try:
         daemon = Pyro4.Daemon(host=None, port=args.port)   # Create the Pyro daemon with the specified port
         ns = Pyro4.locateNS()
@@ -69,6 +100,7 @@ def main():
         print(f"An error occurred during Pyro initialization: {e}", file=sys.stderr)
         sys.exit(1)
 
+    InsultService.counter_shards = args.counter_shards
     uri = daemon.register(InsultService)    # Register the service as a Pyro object
     # Register the instance with the unique name
     try:
@@ -78,7 +110,13 @@ def main():
         print(f"Error registering service '{pyro_name}' with the name server: {e}", file=sys.stderr)
         sys.exit(1)
     print(f"Insult Service ID {args.instance_id} is ready.")
-    daemon.requestLoop()  # Start the event loop of the server to wait for calls
+    try:
+        daemon.requestLoop()  # Start the event loop of the server to wait for calls
+    finally:
+        try:
+            ns.remove(pyro_name)  # Load balancers started with --discover drop this instance
+        except Pyro4.errors.PyroError:
+            pass
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
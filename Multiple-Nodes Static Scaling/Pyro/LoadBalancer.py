@@ -1,130 +1,276 @@
 import argparse
 import Pyro4
+import os
 import sys
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import redis
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from Balancer import DEFAULT_PROBE_INTERVAL, DEFAULT_STRATEGY, STRATEGIES, Balancer
+from BatchSplit import MAX_BATCH_PARTS, batch_parts, split_batch
+from CallAcks import CallAcks
+from Pagination import DEFAULT_PAGE_SIZE, fan_out_page, iter_pages
+from PyroProxyPool import PyroProxyPool
+from ScatterGather import DEFAULT_WORKERS, gather_lists, scatter
+from RedisCounter import DEFAULT_SHARDS, MAX_SHARDS, BufferedCounter, read_counter_exact, reset_counter
+
+BACKEND_TIMEOUT = 5  # s per backend call
+PROBE_TIMEOUT = 1  # s per health check
+
+def is_backend_failure(error):
+    # Errors raised by the backend's own method travel back as their original exception type
+    return isinstance(error, Pyro4.errors.CommunicationError)
+
+def is_unsent(error):
+    # Pyro wraps the socket error of a failed connect, and a failed send is a ConnectionClosedError "sending: ...":
+    # the backend never got the whole request. A TimeoutError, or a connection lost while receiving, may come
+    # after the backend ran it
+    if isinstance(error, Pyro4.errors.ConnectionClosedError):
+        return str(error).startswith("sending:")
+    return isinstance(error, Pyro4.errors.CommunicationError) and isinstance(error.__cause__, OSError)
+
+def probe_backend(pool):
+    # A round trip over a pooled connection, whose daemon thread is already assigned, so a busy backend
+    # still answers it; a broken connection is dropped by the pool and the next probe opens a new one
+    with pool.proxy() as proxy:
+        proxy._pyroTimeout = PROBE_TIMEOUT
+        try:
+            proxy._pyroGetMetadata()
+        finally:
+            proxy._pyroTimeout = pool.timeout
+
 @Pyro4.expose
 @Pyro4.behavior(instance_mode="single")
 class LoadBalancer:
-    def __init__(self, filter_service_names, insult_service_names):
+    def __init__(self, filter_service_names, insult_service_names, pool_size=None, strategy=DEFAULT_STRATEGY,
+                 probe_interval=DEFAULT_PROBE_INTERVAL, counter_shards=DEFAULT_SHARDS):
         self.ns = Pyro4.locateNS()
-        self.filter_proxies = []
-        self.insult_proxies = []
-        self.get_proxies(filter_service_names)
-        self.get_proxies(insult_service_names)
-        self.filter_rr = 0
-        self.service_rr = 0
-        self.lock = threading.Lock()
+        self.pool_size = pool_size or Pyro4.config.THREADPOOL_SIZE  # One proxy per daemon thread and backend
+        self.static_uris = set()  # Backends named on the command line, kept whatever discovery finds
+        self.subscribers = []  # Also subscribed to services discovered later
+        filter_pools, _ = self.get_pools(filter_service_names)
+        _, insult_pools = self.get_pools(insult_service_names)
+        self.service_balancer = Balancer(insult_pools, strategy, "InsultService", label=lambda pool: str(pool.uri),
+                                         is_failure=is_backend_failure, is_unsent=is_unsent)
+        self.filter_balancer = Balancer(filter_pools, strategy, "InsultFilter", label=lambda pool: str(pool.uri),
+                                        is_failure=is_backend_failure, is_unsent=is_unsent)
+        if probe_interval > 0:
+            self.service_balancer.start_health_checks(probe_backend, probe_interval)
+            self.filter_balancer.start_health_checks(probe_backend, probe_interval)
         self.counter_key = "COUNTER"  # Key for Redis counter
         self.client = redis.Redis(db=0, decode_responses=True)
+        self.counter = BufferedCounter(self.client, self.counter_key, shards=counter_shards)
+        self.acks = CallAcks()  # Oneway calls forwarded per client
+        self.batch_executor = ThreadPoolExecutor(max_workers=MAX_BATCH_PARTS)  # Runs filter_many chunks in parallel
+        self.scatter_executor = ThreadPoolExecutor(max_workers=DEFAULT_WORKERS)  # Calls every backend at once
 
-    def get_proxies(self, service_names):
+    def create_pool(self, uri):
+        # Connects as many proxies as the daemon keeps threads alive
+        return PyroProxyPool(uri, size=self.pool_size, timeout=BACKEND_TIMEOUT, warm=Pyro4.config.THREADPOOL_SIZE_MIN)
+
+    def get_pools(self, service_names):
+        filter_pools, insult_pools = [], []
         for name in service_names:
             try:
                 uri = self.ns.lookup(name)
-                proxy = Pyro4.Proxy(uri)
-                proxy._pyroTimeout = 5 # Timeout for calls
+                pool = self.create_pool(uri)
                 if name.startswith("pyro.filter."):
-                    self.filter_proxies.append(proxy)
+                    filter_pools.append(pool)
                 elif name.startswith("pyro.service."):
-                    self.insult_proxies.append(proxy)
-                print(f"Proxy created for {name} ({uri})")
+                    insult_pools.append(pool)
+                self.static_uris.add(str(uri))
+                print(f"Proxy pool created for {name} ({uri})")
             except Pyro4.errors.NamingError:
                 print(f"WARNING: Pyro service name '{name}' not found in Name Server.", file=sys.stderr)
             except Exception as e:
-                print(f"ERROR creating proxy for name {name}: {e}", file=sys.stderr)
-        return None
+                print(f"ERROR creating proxy pool for name {name}: {e}", file=sys.stderr)
+        return filter_pools, insult_pools
+
+    def watch_name_server(self, interval):
+        threading.Thread(target=self.discovery_loop, args=(interval,), daemon=True, name="discovery").start()
+
+    def discovery_loop(self, interval):
+        ns = Pyro4.locateNS()  # This thread's own proxy
+        while True:
+            try:
+                self.discover_backends(ns)
+            except Exception as e:
+                print(f"LB: Error discovering backends: {e}", file=sys.stderr)
+                ns._pyroRelease()  # Reconnects on the next lookup
+            time.sleep(interval)
 
-    def add_insult(self, insult):
+    def discover_backends(self, ns):
+        # Every name under the prefixes is a backend: instances started later are added, unregistered ones removed
+        uris = ns.list(prefix="pyro.service.").values()
+        added, removed = self.service_balancer.sync(uris, self.create_pool, keep=self.static_uris)
+        for pool in added:
+            for url in list(self.subscribers):
+                try:
+                    self.call_backend(pool, "subscribe", url)
+                except Exception as e:
+                    print(f"LB: Error adding subscriber {url} via {pool.uri}: {e}", file=sys.stderr)
+        for pool in removed:
+            pool.close()
+        uris = ns.list(prefix="pyro.filter.").values()
+        added, removed = self.filter_balancer.sync(uris, self.create_pool, keep=self.static_uris)
+        for pool in removed:
+            pool.close()
+
+    @staticmethod
+    def call_backend(pool, method, *args):
+        with pool.proxy() as proxy:
+            return getattr(proxy, method)(*args)
+
+    def call_balanced(self, balancer, method, *args):
+        # A backend that could not be connected to is retried on the next one instead of failing the request
+        return balancer.call(lambda pool: self.call_backend(pool, method, *args))
+
+    def get_balancer_stats(self):
+        # Per-backend health, requests in flight, totals, errors and smoothed response time
+        return {"services": self.service_balancer.stats(), "filters": self.filter_balancer.stats()}
+
+    @Pyro4.oneway
+    def add_insult(self, insult, client_id=None):
         try:
-            with self.lock:
-                service_proxy = self.insult_proxies[self.service_rr]
-                self.service_rr = (self.service_rr + 1) % len(self.insult_proxies)
-            service_proxy.add_insult(insult)
-            self.client.incr(self.counter_key)  # INCR Redis Counter
-            # print(f"Insult added: {insult} to {service_proxy._pyroUri}")
+            self.call_balanced(self.service_balancer, "add_insult", insult)  # Oneway as well: the LB does not wait for the service either
+            self.counter.incr()
+            self.acks.ack(client_id)
+            # print(f"Insult added: {insult}")
         except Exception as e:
             print(f"ERROR: Exception during adding insult: {e}", file=sys.stderr)
 
+    def get_acked(self, client_id):
+        # Calls of client_id forwarded so far; answered after its earlier oneway calls on this connection
+        return self.acks.take(client_id)
+
     def filter_service(self, text):
         try:
-            with self.lock:
-                filter_proxy = self.filter_proxies[self.filter_rr]
-                self.filter_rr = (self.filter_rr + 1) % len(self.filter_proxies)
-            result = filter_proxy.filter_service(text) # Call to the real InsultFilter method
-            self.client.incr(self.counter_key)  # INCR Redis Counter
+            result = self.call_balanced(self.filter_balancer, "filter_service", text) # Call to the real InsultFilter method
+            self.counter.incr()
             # print("Filtered text:", result)
             return result
         except Exception as e:
             return f"ERROR: Exception during filtering: {e}"
 
+    def filter_many(self, texts):
+        if not texts:
+            return []
+        try:
+            # Large batches are split into one chunk per filter and censored in parallel
+            parts = batch_parts(len(texts), len(self.filter_balancer))
+            chunks = split_batch(texts, parts)
+            if parts == 1:
+                results = self.call_balanced(self.filter_balancer, "filter_many", chunks[0])
+            else:
+                results = []
+                # Each chunk picks its filter when it is sent, seeing the chunks already in flight
+                for censored_texts in self.batch_executor.map(
+                        lambda chunk: self.call_balanced(self.filter_balancer, "filter_many", chunk), chunks):
+                    results.extend(censored_texts)
+            self.counter.incr(len(texts))
+            return results
+        except Exception as e:
+            return f"ERROR: Exception during filtering: {e}"
+
     def insult_me(self):
         try:
-            with self.lock:
-                service_proxy = self.insult_proxies[self.service_rr]
-                self.service_rr = (self.service_rr + 1) % len(self.insult_proxies)
-            insult = service_proxy.insult_me()
-            print(f"Insult received: {insult} from {service_proxy._pyroUri}")
+            insult, uri = self.service_balancer.call(lambda pool: (self.call_backend(pool, "insult_me"), pool.uri),
+                                                      idempotent=True)
+            print(f"Insult received: {insult} from {uri}")
             return insult
         except Exception as e:
             return f"ERROR: Exception during getting insult: {e}"
 
     def subscribe(self, url):
         print(f"LB: Adding subscriber {url} to all insult services.")
-        for proxy in self.insult_proxies:
-            try:
-                proxy.subscribe(url) # Each InsultService subscribes its subscribers
-                print(f"LB: Subscriber added via {proxy._pyroUri}")
-            except Exception as e:
-                print(f"LB: Error adding subscriber via {proxy._pyroUri}: {e}", file=sys.stderr)
+        if url not in self.subscribers:
+            self.subscribers.append(url)
+        for pool, _, e in scatter(self.scatter_executor, self.service_balancer.targets(),
+                                  lambda pool: self.call_backend(pool, "subscribe", url), timeout=BACKEND_TIMEOUT):
+            if e is None:
+                print(f"LB: Subscriber added via {pool.uri}") # Each InsultService subscribes its subscribers
+            else:
+                print(f"LB: Error adding subscriber via {pool.uri}: {e}", file=sys.stderr)
         return None
 
 
+    def _gather(self, balancer, method):
+        # Every backend is asked at once; the ones that fail or time out are left out of the response
+        response, failures = gather_lists(self.scatter_executor, balancer.targets(),
+                                          lambda pool: self.call_backend(pool, method),
+                                          timeout=BACKEND_TIMEOUT, label=lambda pool: str(pool.uri))
+        for failure in failures:
+            print(f"ERROR in load balancer ({method}): {failure}", file=sys.stderr)
+        return response
+
     def get_insults(self):
-        if self.insult_proxies:
-            try:
-                response = []
-                for proxy in self.insult_proxies:
-                    response.extend(proxy.get_insults())
-                return response
-            except Exception as e:
-                print(f"ERROR in load balancer (get_insults_balanced): {e}", file=sys.stderr)
-                return None
+        if len(self.service_balancer):
+            return self._gather(self.service_balancer, "get_insults")
         print("WARNING: No insult services available for get_insults_balanced.", file=sys.stderr)
         return None
 
     def get_censored_texts(self):
-        if self.filter_proxies:
-            try:
-                response = []
-                for proxy in self.filter_proxies:
-                    response.extend(proxy.get_censored_texts())
-                return response
-            except Exception as e:
-                print(f"ERROR in load balancer (get_censored_texts_balanced): {e}", file=sys.stderr)
-                return None
+        if len(self.filter_balancer):
+            return self._gather(self.filter_balancer, "get_censored_texts")
         print("WARNING: No filter services available for get_censored_texts_balanced.", file=sys.stderr)
         return None
 
-    def notify_subscribers(self, insult):
-        print(f"LB: Forwarding notify_subscribers for insult '{insult}' to all insult services.")
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # The cursor is [backend index, backend cursor]; the services are read one after the other
+        try:
+            return fan_out_page([partial(self.call_backend, pool, "get_insults_page")
+                                 for pool in self.service_balancer.targets()], cursor, limit)
+        except Exception as e:
+            print(f"ERROR in load balancer (get_insults_page): {e}", file=sys.stderr)
+            raise
+
+    def get_censored_texts_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        try:
+            return fan_out_page([partial(self.call_backend, pool, "get_censored_texts_page")
+                                 for pool in self.filter_balancer.targets()], cursor, limit)
+        except Exception as e:
+            print(f"ERROR in load balancer (get_censored_texts_page): {e}", file=sys.stderr)
+            raise
+
+    def iter_insults(self, limit=DEFAULT_PAGE_SIZE):
+        return iter_pages(self.get_insults_page, limit)
+
+    def iter_censored_texts(self, limit=DEFAULT_PAGE_SIZE):
+        return iter_pages(self.get_censored_texts_page, limit)
+
+    def _broadcast(self, method, *args):
+        # Calls method on every InsultService at once; returns the number of services that failed
         communication_errors = 0
-        for proxy in self.insult_proxies:
-            try:
-                proxy.notify_subscribers(insult) # Each InsultService notifies its subscribers
-            except Exception as e:
+        for pool, _, e in scatter(self.scatter_executor, self.service_balancer.targets(),
+                                  lambda pool: self.call_backend(pool, method, *args), timeout=BACKEND_TIMEOUT):
+            if e is not None:
                 communication_errors += 1
-                print(f"LB: Error notifying subscribers via {proxy._pyroUri}: {e}", file=sys.stderr)
+                print(f"LB: Error notifying subscribers via {pool.uri}: {e}", file=sys.stderr)
+        return communication_errors
+
+    @Pyro4.oneway
+    def notify_subscribers(self, insult):
+        print(f"LB: Forwarding notify_subscribers for insult '{insult}' to all insult services.")
+        communication_errors = self._broadcast("notify_subscribers", insult) # Each InsultService notifies its subscribers
         if communication_errors > 0:
             print(f"LB: {communication_errors} errors occurred during notify_subscribers_balanced.", file=sys.stderr)
 
+    @Pyro4.oneway
+    def notify_many(self, insults):
+        communication_errors = self._broadcast("notify_many", insults)  # One call per service for the whole batch
+        if communication_errors > 0:
+            print(f"LB: {communication_errors} errors occurred during notify_many.", file=sys.stderr)
+
     # --- Method to get the total request count ---
     def get_processed_count(self):
-        count = self.client.get(self.counter_key)
+        self.counter.flush()
+        count = read_counter_exact(self.client, self.counter_key)  # Also waits for the backends' flushes
         print(f"Load Balancer returning processed count: {count}")
-        return int(count) if count else 0
+        return count
 
 def main():
     parser = argparse.ArgumentParser(description="Pyro Load Balancer")
@@ -132,26 +278,45 @@ def main():
                         help="List of InsultService pyro names separated by spaces (e.g., pyro.service.1 pyro.service.2)")
     parser.add_argument("-nf", "--names-filter", nargs='+', default=[],
                         help="List of InsultFilter pyro names separated by spaces (e.g., pyro.filter.1 pyro.filter.2)")
+    parser.add_argument("-t", "--threads", type=int, default=Pyro4.config.THREADPOOL_SIZE,
+                        help=f"Daemon threads serving requests; also the proxies pooled per backend (default: {Pyro4.config.THREADPOOL_SIZE})")
+    parser.add_argument("-s", "--strategy", choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help=f"How each request picks its backend (default: {DEFAULT_STRATEGY})")
+    parser.add_argument("--probe-interval", type=float, default=DEFAULT_PROBE_INTERVAL,
+                        help=f"Seconds between backend health checks, 0 disables them (default: {DEFAULT_PROBE_INTERVAL})")
+    parser.add_argument("--discover", action="store_true",
+                        help="Also use every pyro.service.* and pyro.filter.* name in the Name Server, adding and removing backends as they come and go")
+    parser.add_argument("--discovery-interval", type=float, default=2.0,
+                        help="Seconds between two listings of the Name Server (default: 2.0)")
+    parser.add_argument("--counter-shards", type=int, choices=range(1, MAX_SHARDS + 1), default=DEFAULT_SHARDS,
+                        metavar="N", help=f"Redis keys COUNTER is spread over, 1-{MAX_SHARDS}; more keys spare one hot key when many processes count (default: {DEFAULT_SHARDS})")
 
     args = parser.parse_args()
-    if not args.names_service and not args.names_filter:
-        print("Error: At least one service name must be provided for either filter or service.", file=sys.stderr)
-        print("Usage: python LoadBalancer.py -ns <service_names> -nf <filter_names>", file=sys.stderr)
+    if not args.names_service and not args.names_filter and not args.discover:
+        print("Error: At least one service name must be provided for either filter or service, or --discover.", file=sys.stderr)
+        print("Usage: python LoadBalancer.py -ns <service_names> -nf <filter_names> [--discover]", file=sys.stderr)
         sys.exit(1)
     load_balancer_pyro_name = "pyro.loadbalancer"
+    Pyro4.config.ONEWAY_THREADED = False  # Oneway calls run in order on their connection (see CallAcks)
+    Pyro4.config.THREADPOOL_SIZE = args.threads
     try:
         daemon = Pyro4.Daemon()
         ns = Pyro4.locateNS()
-        lb_instance = LoadBalancer(args.names_filter, args.names_service)
+        lb_instance = LoadBalancer(args.names_filter, args.names_service, pool_size=args.threads,
+                                   strategy=args.strategy, probe_interval=args.probe_interval,
+                                   counter_shards=args.counter_shards)
+        if args.discover:
+            lb_instance.watch_name_server(args.discovery_interval)
         uri = daemon.register(lb_instance)
         ns.register(load_balancer_pyro_name, uri)
 
         print("LoadBalancer: Clearing initial Redis key (COUNTER)...")
-        lb_instance.client.delete(lb_instance.counter_key)
+        reset_counter(lb_instance.client, lb_instance.counter_key)
         print("Redis keys cleared.")
 
         print(f"LoadBalancer registered as '{load_balancer_pyro_name}' with URI: {uri}")
         print(f"The LoadBalancer is ready. URI: {uri}")
+        print(f"Balancing strategy: {args.strategy}")
     except Pyro4.errors.NamingError:
         print("Error: Could not locate the Pyro Name Server. Ensure it is running.", file=sys.stderr)
         print("Run: python -m Pyro4.naming", file=sys.stderr)
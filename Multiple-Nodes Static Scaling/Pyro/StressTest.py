@@ -4,9 +4,14 @@ from multiprocessing import Process, Queue
 import random
 import argparse
 import sys
+import os
 import Pyro4.errors
 import redis
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from CallAcks import new_client_id
+from RedisCounter import read_counter, read_counter_exact, reset_counter
+
 # --- Configuration ---
 # Name for the LoadBalancer in the Name Server
 DEFAULT_PYRO_LOADBALANCER = "pyro.loadbalancer"
@@ -29,9 +34,10 @@ TEXTS_TO_FILTER = [
 ]
 
 # --- Worker Function ---
-def worker_request(results_queue, ns_host, ns_port, mode, n_msg, url_service, url_filter):
+def worker_request(results_queue, ns_host, ns_port, mode, n_msg, url_service, url_filter, batch_size=1):
     requests_sent = 0
     errors = 0
+    acknowledged = 0
 
     try:
         if ns_host and ns_port:
@@ -40,29 +46,44 @@ def worker_request(results_queue, ns_host, ns_port, mode, n_msg, url_service, ur
             ns = Pyro4.locateNS()
     except Pyro4.errors.NamingError:
         print(f"Worker ERROR: LoadBalancer '{DEFAULT_PYRO_LOADBALANCER}' not found. Make sure it is running.", file=sys.stderr)
-        results_queue.put((0, 1))
+        results_queue.put((0, 1, 0))
         return
     except Exception as e:
         print(f"Worker ERROR connecting to the LoadBalancer for testing: {e}", file=sys.stderr)
-        results_queue.put((0, 1))
+        results_queue.put((0, 1, 0))
         return
 
     if mode == 'add_insult':
         urls = []
         for url in url_service:
             urls.append(Pyro4.Proxy(ns.lookup(url)))
+        client_id = new_client_id()
         while requests_sent < n_msg:
             try:
+                # add_insult is oneway: the call returns once it is sent, without waiting for the service
                 service = urls[requests_sent % len(urls)]
-                data = random.choice(INSULTS_TO_ADD) + str(random.randint(1, 10000))
-                service.add_insult(data)
-                requests_sent += 1
+                if batch_size > 1:
+                    batch = Pyro4.batch(service)  # Several calls in a single message
+                    count = min(batch_size, n_msg - requests_sent)
+                    for _ in range(count):
+                        batch.add_insult(random.choice(INSULTS_TO_ADD) + str(random.randint(1, 10000)), client_id)
+                    batch(oneway=True)
+                    requests_sent += count
+                else:
+                    data = random.choice(INSULTS_TO_ADD) + str(random.randint(1, 10000))
+                    service.add_insult(data, client_id)
+                    requests_sent += 1
             except Pyro4.errors.CommunicationError as e:
                 print(f"Worker ERROR: Communication error with the LoadBalancer: {e}", file=sys.stderr)
                 errors += 1
             except Exception as e:
                 print(f"Worker ERROR during the call: {e}", file=sys.stderr)
                 errors += 1
+        for service in urls:
+            try:
+                acknowledged += service.get_acked(client_id)  # Waits for this connection's pending oneway calls
+            except Exception as e:
+                print(f"Worker ERROR reading the acknowledged calls: {e}", file=sys.stderr)
 
     elif mode == 'filter_text':
         urls = []
@@ -71,20 +92,31 @@ def worker_request(results_queue, ns_host, ns_port, mode, n_msg, url_service, ur
         while requests_sent < n_msg:
             try:
                 service = urls[requests_sent % len(urls)]
-                data = random.choice(TEXTS_TO_FILTER)
-                service.filter_service(data)
-                requests_sent += 1
+                if batch_size > 1:
+                    # One call censors a whole batch, amortising the per-call overhead
+                    batch = random.choices(TEXTS_TO_FILTER, k=min(batch_size, n_msg - requests_sent))
+                    service.filter_many(batch)
+                    requests_sent += len(batch)
+                else:
+                    data = random.choice(TEXTS_TO_FILTER)
+                    service.filter_service(data)
+                    requests_sent += 1
             except Pyro4.errors.CommunicationError as e:
                 print(f"Worker ERROR: Communication error with the LoadBalancer: {e}", file=sys.stderr)
                 errors += 1
             except Exception as e:
                 print(f"Worker ERROR during the call: {e}", file=sys.stderr)
                 errors += 1
-    results_queue.put((requests_sent, errors))
+        acknowledged = requests_sent  # Regular calls: all answered
+    results_queue.put((requests_sent, errors, acknowledged))
 
-def run_stress_test(mode, ns_host, ns_port, messages, names_service, names_filter):
+def run_stress_test(mode, ns_host, ns_port, messages, names_service, names_filter, batch_size=1):
     print(f"Starting Pyro stress test in '{mode}' via Load Balancer...")
     print(f"Concurrency: {DEFAULT_CONCURRENCY} processes")
+    if mode == 'filter_text':
+        print(f"Batch size: {batch_size} texts per call")
+    elif batch_size > 1:
+        print(f"Batch size: {batch_size} oneway calls per batch proxy message")
     print("-" * 30)
 
     num_service_instances = 0
@@ -105,13 +137,13 @@ def run_stress_test(mode, ns_host, ns_port, messages, names_service, names_filte
         print(f"Severe error connecting to Redis in run_stress_test: {e}", file=sys.stderr)
         exit(1)
 
-    redis_client.set(REDIS_COUNTER, 0)
+    reset_counter(redis_client, REDIS_COUNTER)
 
     start_time = time.time()
     # Start worker processes
     print("Starting worker processes...")
     for _ in range(DEFAULT_CONCURRENCY):
-        p = Process(target=worker_request, args=(results_queue, ns_host, ns_port, mode, n_messages, names_service, names_filter))
+        p = Process(target=worker_request, args=(results_queue, ns_host, ns_port, mode, n_messages, names_service, names_filter, batch_size))
         processes.append(p)
         p.start()
 
@@ -124,14 +156,16 @@ def run_stress_test(mode, ns_host, ns_port, messages, names_service, names_filte
 
     total_client_requests_sent = 0
     total_error_count = 0
+    total_acknowledged = 0
     while not results_queue.empty():
-        requests_sent, errors = results_queue.get()
+        requests_sent, errors, acknowledged = results_queue.get()
         total_client_requests_sent += requests_sent
         total_error_count += errors
+        total_acknowledged += acknowledged
 
     total_messages = n_messages * DEFAULT_CONCURRENCY
     # We wait for the instances of the service to finish processing all the messages.
-    while int(redis_client.get(REDIS_COUNTER)) < total_messages:
+    while read_counter(redis_client, REDIS_COUNTER) < total_messages:
         time.sleep(0.001)
 
     actual_duration_server = time.time() - start_time
@@ -142,8 +176,9 @@ def run_stress_test(mode, ns_host, ns_port, messages, names_service, names_filte
     print(f"Total time processing requests: {actual_duration_server:.3f} seconds")
     print(f"Total client requests sent: {total_client_requests_sent}")
     print(f"Total client errors: {total_error_count}")
+    print(f"Total requests acknowledged by the servers: {total_acknowledged}")
 
-    server_processed_count = int(redis_client.get(REDIS_COUNTER))
+    server_processed_count = read_counter_exact(redis_client, REDIS_COUNTER)
     if server_processed_count >= 0: # Validate the server processed count
         print(f"Total server processed requests: {server_processed_count}")
     else:
@@ -181,8 +216,11 @@ if __name__ == "__main__":
                         help="List of InsultService pyro names separated by spaces (e.g., pyro.service.1 pyro.service.2)")
     parser.add_argument("-nf", "--names-filter", nargs='+', default=[],
                         help="List of InsultFilter pyro names separated by spaces (e.g., pyro.filter.1 pyro.filter.2)")
-
+    parser.add_argument("-b", "--batch-size", type=int, default=1,
+                        help="Above 1, filter_text sends this many texts per filter_many call and add_insult this many "
+                             "oneway calls per batch proxy message (default: 1)")
 
     args = parser.parse_args()
 
-    run_stress_test(args.mode, args.ns_host, args.ns_port, args.messages, args.names_service, args.names_filter)
\ No newline at end of file
+    run_stress_test(args.mode, args.ns_host, args.ns_port, args.messages, args.names_service, args.names_filter,
+                    args.batch_size)
\ No newline at end of file
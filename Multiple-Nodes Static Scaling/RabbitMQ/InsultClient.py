@@ -99,15 +99,15 @@ if __name__ == "__main__":
             if t == "I":
                 try:
                     for i in range(args.num_instances_service):
-                        print(f"Insult list from instance {i+1}:",
-                              client.insult_service_proxies[i].get_insults())
+                        cursor, insults = client.insult_service_proxies[i].get_insults_page(0)
+                        print(f"Insult list from instance {i+1} (first {len(insults)}{', more available' if cursor else ''}):", insults)
                 except Pyro4.errors.CommunicationError as e:
                     print(f"Communication error: {e}.")
             elif t == "T":
                 try:
                     for i in range(args.num_instances_filter):
-                        print(f"Insult filter censored texts from instance {i+1}:",
-                              client.insult_filter_proxies[i].get_results())
+                        cursor, censored_texts = client.insult_filter_proxies[i].get_results_page(0)
+                        print(f"Insult filter censored texts from instance {i+1} (first {len(censored_texts)}{', more available' if cursor else ''}):", censored_texts)
                 except Pyro4.errors.CommunicationError as e:
                     print(f"Communication error: {e}.")
             elif t == "K":
@@ -1,28 +1,33 @@
 import argparse
+import os
+import sys
 import Pyro4
 import pika
-from multiprocessing import Manager, Process
+from multiprocessing import Process
 import redis
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from InsultMatcher import InsultMatcher
+from Pagination import DEFAULT_PAGE_SIZE
+from ResultsStore import ResultsManager
+from RedisCounter import DEFAULT_SHARDS, MAX_SHARDS, BufferedCounter, read_counter_exact, reset_counter
+
 class InsultFilter:
-    def __init__(self, shared_insult_list, shared_censored_texts):
+    def __init__(self, shared_insult_list, shared_censored_texts, counter_shards=DEFAULT_SHARDS):
         self.channel_insults = "Insults_channel"
         self.insults_list = shared_insult_list  # list of insults
-        self.censored_texts = shared_censored_texts # list for censored texts
+        self.matcher = InsultMatcher()  # Per-process compiled copy of insults_list (see filter)
+        self.censored_texts = shared_censored_texts # newest distinct censored texts (BoundedResults)
         self.text_queue = "text_queue"
         self.counter_key = "COUNTER"
         self.client = redis.Redis(db=0, decode_responses=True)
+        self.counter = BufferedCounter(self.client, self.counter_key, shards=counter_shards)
 
     def filter(self, text):
-        censored_text = ""
-        current_insults = list(self.insults_list)
-        for word in text.split():
-            if word.lower() in current_insults:
-                censored_text += "CENSORED "
-            else:
-                censored_text += word + " "
-        return censored_text.strip()
+        # insults_list is append-only, so only the new tail has to be fetched from the manager
+        self.matcher.sync(self.insults_list)
+        return self.matcher.censor(text)
 
     def filter_service(self):
         connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
@@ -33,9 +38,8 @@ class InsultFilter:
         def callback(ch, method, properties, body):
             text = body.decode('utf-8')
             filtered_text = self.filter(text)
-            self.client.incr(self.counter_key)
-            if filtered_text not in self.censored_texts:
-                self.censored_texts.append(filtered_text)
+            self.counter.incr()
+            self.censored_texts.add(filtered_text)
             # print(f"Censored text: {filtered_text}")
 
         channel.basic_consume(queue=self.text_queue, on_message_callback=callback, auto_ack=True)
@@ -43,19 +47,25 @@ class InsultFilter:
         channel.start_consuming()
 
     def get_results(self):
-        return f"Censored texts: {list(self.censored_texts)}"
+        return f"Censored texts: {self.censored_texts.items()}"
+
+    def get_results_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, censored texts]; next_cursor is 0 once every stored text has been returned
+        return self.censored_texts.page(cursor, limit)
 
     def get_processed_count(self):
-        count = self.client.get(self.counter_key)
-        return int(count) if count else 0
+        return read_counter_exact(self.client, self.counter_key)
 
 # Example of how to run the InsultFilterService
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-id", "--instance-id", type=int, default=1, help="Service instance ID", required=True)
+    parser.add_argument("--counter-shards", type=int, choices=range(1, MAX_SHARDS + 1), default=DEFAULT_SHARDS,
+                        metavar="N", help=f"Redis keys COUNTER is spread over, 1-{MAX_SHARDS}; more keys spare one hot key when many processes count (default: {DEFAULT_SHARDS})")
     args = parser.parse_args()
 
-    manager = Manager()
+    manager = ResultsManager()
+    manager.start()
     # Create a shared list for insults
     shared_insults = manager.list()
     initial_insults = ["tonto", "lleig", "boig", "idiota", "estúpid", "inútil", "desastre", "fracassat", "covard",
@@ -63,10 +73,10 @@ if __name__ == "__main__":
                        "dropo", "bleda", "xitxarel·lo"]
     shared_insults.extend(initial_insults)
 
-    # Create a shared list for censored texts
-    shared_texts = manager.list()
+    # Create a shared, bounded store for censored texts
+    shared_texts = manager.BoundedResults()
     # Create the service instance with the shared resources
-    filter_service_instance = InsultFilter(shared_insults, shared_texts)
+    filter_service_instance = InsultFilter(shared_insults, shared_texts, args.counter_shards)
 
     # --- Set up Pyro server ---
     print("Starting Pyro Insult Service for remote access...")
@@ -90,7 +100,7 @@ if __name__ == "__main__":
         exit(1)
 
     print("InsultService: Clearing initial Redis keys (INSULTS_COUNTER)...")
-    filter_service_instance.client.delete(filter_service_instance.counter_key)
+    reset_counter(filter_service_instance.client, filter_service_instance.counter_key)
     print("Redis keys cleared.")
 
     process_filter_service = Process(target=filter_service_instance.filter_service)
@@ -4,19 +4,26 @@ import pika
 import time
 import random
 from multiprocessing import Process, Manager
+import os
+import sys
 import redis
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from Pagination import DEFAULT_PAGE_SIZE, page
+from RedisCounter import DEFAULT_SHARDS, MAX_SHARDS, BufferedCounter, read_counter_exact, reset_counter
+
 class Insults:
-    def __init__(self, shared_insults_list):
+    def __init__(self, shared_insults_list, counter_shards=DEFAULT_SHARDS):
         self.channel_broadcast = "Insults_broadcast"
         self.add_insult_queue = "add_insult_queue"  # Define the work queue name
         self.insults_list = shared_insults_list  # Is a shared list
         self.counter_key = "COUNTER"  # Key for Redis counter
         self.client = redis.Redis(db=0, decode_responses=True)
+        self.counter = BufferedCounter(self.client, self.counter_key, shards=counter_shards)
 
     def add_insult(self, insult):
-        self.client.incr(self.counter_key)
+        self.counter.incr()
         if insult not in self.insults_list:
             self.insults_list.append(insult)
         # print(f"Insult added: {insult}")
@@ -24,6 +31,10 @@ class Insults:
     def get_insults(self):
         return f"Insult list: {list(self.insults_list)}"
 
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, insults], sliced inside the manager; next_cursor is 0 once every insult has been returned
+        return page(self.insults_list, cursor, limit)
+
     def insult_me(self):
         if self.insults_list:
             insult = random.choice(self.insults_list)
@@ -63,19 +74,20 @@ class Insults:
         channel.start_consuming()
 
     def get_processed_count(self):
-        count = self.client.get(self.counter_key)
-        return int(count) if count else 0
+        return read_counter_exact(self.client, self.counter_key)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-id", "--instance-id", type=int, default=1, help="Service instance ID", required=True)
+    parser.add_argument("--counter-shards", type=int, choices=range(1, MAX_SHARDS + 1), default=DEFAULT_SHARDS,
+                        metavar="N", help=f"Redis keys COUNTER is spread over, 1-{MAX_SHARDS}; more keys spare one hot key when many processes count (default: {DEFAULT_SHARDS})")
     args = parser.parse_args()
 
     manager = Manager()
     # Create a shared list for insults
     shared_insults = manager.list()
     # Create the service instance with the shared resources
-    insults_service_instance = Insults(shared_insults)
+    insults_service_instance = Insults(shared_insults, args.counter_shards)
 
     # --- Set up Pyro server ---
     print("Starting Pyro Insult Service for remote access...")
@@ -100,7 +112,7 @@ if __name__ == "__main__":
 
 
     print("InsultService: Clearing initial Redis keys (INSULTS_COUNTER)...")
-    insults_service_instance.client.delete(insults_service_instance.counter_key)
+    reset_counter(insults_service_instance.client, insults_service_instance.counter_key)
     print("Redis keys cleared.")
 
     # --- Set up worker processes (RabbitMQ consumers/notifier) ---
@@ -7,6 +7,9 @@ import sys
 import os
 import redis
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from RedisCounter import read_counter, read_counter_exact
+
 # --- Configuration  ---
 DEFAULT_RABBIT_HOST = 'localhost'
 DEFAULT_INSULT_QUEUE = 'add_insult_queue'    # Default RabbitMQ queue for adding insults
@@ -140,14 +143,14 @@ def run_stress_test(mode, host, insult_exchange, work_queue, messages, num_servi
 
     # We wait for the instances of the service to finish processing all the messages.
     total_messages = n_messages * DEFAULT_CONCURRENCY
-    while int(redis_client.get(REDIS_COUNTER)) < total_messages:
+    while read_counter(redis_client, REDIS_COUNTER) < total_messages:
         time.sleep(0.001)
 
     actual_duration_server = time.time() - start_time
     print("-" * 30)
 
     # --- Phase 2: Get statistics from the service ---
-    total_processed_count = int(redis_client.get(REDIS_COUNTER))
+    total_processed_count = read_counter_exact(redis_client, REDIS_COUNTER)
 
     # --- Phase 3: Display results ---
     print("-" * 30)
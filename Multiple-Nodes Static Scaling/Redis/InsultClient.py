@@ -1,8 +1,13 @@
+import os
+import sys
 import redis
 import random
 import time
 import multiprocessing
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from Pagination import DEFAULT_PAGE_SIZE
+
 # Connect to Redis
 client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
 
@@ -50,9 +55,12 @@ if __name__ == "__main__":
         while True:
             t = input()
             if t == "I":
-                print(f"Insult list:", client.smembers(insultSet))
+                # First SSCAN page only, so a large set is never sent in one reply
+                cursor, page = client.sscan(insultSet, 0, count=DEFAULT_PAGE_SIZE)
+                print(f"Insult list ({client.scard(insultSet)} stored):", page)
             elif t == "T":
-                print(f"Text list:", client.smembers(censoredTextsSet))
+                cursor, page = client.sscan(censoredTextsSet, 0, count=DEFAULT_PAGE_SIZE)
+                print(f"Text list ({client.scard(censoredTextsSet)} stored):", page)
             elif t == "K":
                 print("Stopping services...")
                 pr_send_text.terminate()
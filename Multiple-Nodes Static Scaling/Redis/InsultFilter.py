@@ -1,63 +1,111 @@
 import Pyro4
 import redis
 import argparse
+import os
+import sys
 from multiprocessing import Process
 import time
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from InsultSetCache import InsultSetCache, add_to_insult_set, bump_version
+from RedisStreamQueue import StreamConsumer, TEXT_FIELD
+from RedisLuaFilter import LuaInsultFilter
+from Pagination import DEFAULT_PAGE_SIZE, TAIL_SIZE
+from ResultsStore import RedisResults
+from RedisCounter import DEFAULT_SHARDS, MAX_SHARDS, BufferedCounter, read_counter_exact, reset_counter
+
 
 class InsultFilter:
-    def __init__(self, redis_host, redis_port):
+    def __init__(self, redis_host, redis_port, filter_mode="client", counter_shards=DEFAULT_SHARDS):
         self.insultSet = "INSULTS"
         self.censoredTextsSet = "RESULTS"
         self.workQueue = "Work_queue"
+        self.workStream = "Work_stream"
+        self.consumerGroup = "filters"
         self.counter_key = "COUNTER"
         self.client = redis.Redis(host=redis_host, port=redis_port, db=0, decode_responses=True)
+        self.results = RedisResults(self.client, self.censoredTextsSet, kind="set")  # Deduplicated and capped
+        self.counter = BufferedCounter(self.client, self.counter_key, shards=counter_shards)
+        self.insult_cache = None # Local versioned snapshot of INSULTS (see get_insult_matcher)
+        # Server mode censors, stores and counts inside Redis with one EVALSHA per call
+        self.lua_filter = LuaInsultFilter(self.client, self.insultSet, self.censoredTextsSet, self.counter_key,
+                                          results_type="set") if filter_mode == "server" else None
 
     def add_insult(self, insult):
-        self.client.incr(self.counter_key)
-        self.client.sadd(self.insultSet, insult)
+        self.counter.incr()
+        add_to_insult_set(self.client, self.insultSet, insult)
         # print(f"InsultFilter: Insult added (internal): {insult}")
         return f"Insult added (internal): {insult}"
 
     def filter_text(self, text):
         # print(f"InsultFilter: Received text to filter: {text}")
-        censored_text = ""
-        if text is not None:
-            insults = self.client.smembers(self.insultSet)
-            for word in text.split():
-                if word.lower() in insults:
-                    censored_text += "CENSORED "
-                else:
-                    censored_text += word + " "
-        return censored_text.strip() # Remove trailing space
+        if text is None:
+            return ""
+        return self.get_insult_matcher().censor(text)
+
+    def get_insult_matcher(self):
+        # The cache subscribes to Redis from a background thread, so it is created lazily
+        # inside the filter_service process instead of being inherited through fork
+        if self.insult_cache is None:
+            self.insult_cache = InsultSetCache(self.client, self.insultSet)
+        return self.insult_cache.get_matcher()
 
     def get_censored_texts(self):
         results = self.client.smembers(self.censoredTextsSet)
         return f"Censored texts:{results}"
 
+    def get_censored_texts_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, censored texts] from one SSCAN step; next_cursor is 0 once the scan is complete
+        return self.results.page(cursor, limit)
+
     def filter_service(self):
         print("InsultFilter Service: Starting filter_service...")
         try:
             while True:
                 item = self.client.blpop(self.workQueue)     # Blocking pop from the work queue
-                if item:
+                if item and self.lua_filter:
+                    self.lua_filter.filter_text(item[1])
+                elif item:
                     queue_name, text = item
                     # print(f"InsultFilter Worker: Processing text from {queue_name}: Text: {text}")
-                    self.client.incr(self.counter_key)
+                    self.counter.incr()
                     filtered_text = self.filter_text(text)
                     # print(f"InsultFilter Worker: Filtered text: {filtered_text} (Counter: {self.counter.value})")
-                    self.client.sadd(self.censoredTextsSet, filtered_text)
+                    self.results.add(filtered_text)
         except KeyboardInterrupt:
             print("\nInsultFilter Service: Stopping filter_service...")
             exit(1)
 
+    def filter_stream_service(self, consumer_name, batch_size):
+        # Entries stay pending in the group until the EXEC that stores their results, so a filter that
+        # dies mid-batch loses nothing: another instance claims them once they have been idle long enough
+        print(f"InsultFilter Service: Starting filter_stream_service as '{consumer_name}'...")
+        consumer = StreamConsumer(self.client, self.workStream, self.consumerGroup, consumer_name, count=batch_size)
+        try:
+            while True:
+                entries = consumer.read()
+                if not entries:
+                    continue
+                pipe = self.client.pipeline(transaction=True)
+                if self.lua_filter:
+                    self.lua_filter.filter_texts([fields.get(TEXT_FIELD, "") for _, fields in entries], pipe)
+                else:
+                    filtered_texts = [self.filter_text(fields.get(TEXT_FIELD)) for _, fields in entries]
+                    self.results.add_many(filtered_texts, pipe)
+                    pipe.incrby(self.counter_key, len(entries))
+                consumer.ack([entry_id for entry_id, _ in entries], pipe)
+                pipe.execute()
+        except KeyboardInterrupt:
+            print("\nInsultFilter Service: Stopping filter_stream_service...")
+            exit(1)
+
     def get_status_daemon(self):
         print("InsultFilter Worker: Starting get_status_daemon...")
         try:
             while True:
                 print("\n--- InsultFilter Status ---")
-                print(self.get_censored_texts())
+                print(f"Censored texts stored: {self.results.count()}, sample: {self.results.tail(TAIL_SIZE)}")
                 print(f"InsultFilter processed count: {self.get_processed_count()}")
                 print("------------------------------\n")
                 time.sleep(10)
@@ -65,8 +113,7 @@ class InsultFilter:
             print("\nInsultFilter Worker: Stopping get_status_daemon...")
 
     def get_processed_count(self):
-        count = self.client.get(self.counter_key)
-        return int(count) if count else 0
+        return read_counter_exact(self.client, self.counter_key)
 
 # --- Main execution block for InsultFilter ---
 if __name__ == "__main__":
@@ -74,10 +121,17 @@ if __name__ == "__main__":
     parser.add_argument("--redis-host", default="localhost", help="Redis host")
     parser.add_argument("--redis-port", type=int, default=6379, help="Redis port")
     parser.add_argument("-id", "--instance-id", type=int, default=1, help="Service instance ID", required=True)
+    parser.add_argument("--transport", choices=["list", "stream"], default="list",
+                        help="Read work from the Work_queue list (BLPOP) or the Work_stream consumer group (default: list)")
+    parser.add_argument("--filter-mode", choices=["client", "server"], default="client",
+                        help="Censor texts here with the cached insult set, or inside Redis with a Lua script (default: client)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Stream entries read per XREADGROUP (default: 100)")
+    parser.add_argument("--counter-shards", type=int, choices=range(1, MAX_SHARDS + 1), default=DEFAULT_SHARDS,
+                        metavar="N", help=f"Redis keys COUNTER is spread over, 1-{MAX_SHARDS}; more keys spare one hot key when many processes count (default: {DEFAULT_SHARDS})")
     args = parser.parse_args()
     print("Starting InsultFilter...")
 
-    insult_filter = InsultFilter(args.redis_host, args.redis_port)     # Create the InsultFilter instance
+    insult_filter = InsultFilter(args.redis_host, args.redis_port, args.filter_mode, args.counter_shards)     # Create the InsultFilter instance
 
     # --- Set up Pyro server ---
     print("Starting Pyro InsultFilter for remote access...")
@@ -101,16 +155,23 @@ if __name__ == "__main__":
         print(f"Error registering the service with the name server: {e}")
         exit(1)
 
-    print("InsultFilter: Clearing initial Redis keys (INSULTS, RESULTS, Work_queue)...")
+    print("InsultFilter: Clearing initial Redis keys (INSULTS, RESULTS, Work_queue, Work_stream)...")
     insult_filter.client.delete(insult_filter.insultSet)
+    bump_version(insult_filter.client, insult_filter.insultSet)
     insult_filter.client.delete(insult_filter.censoredTextsSet)
     insult_filter.client.delete(insult_filter.workQueue)
-    insult_filter.client.delete(insult_filter.counter_key)
+    insult_filter.client.delete(insult_filter.workStream)
+    reset_counter(insult_filter.client, insult_filter.counter_key)
     print("Redis keys cleared.")
 
     # --- Start background processes for InsultFilter ---
     print("InsultFilter: Starting worker processes...")
-    process_filter_service = Process(target=insult_filter.filter_service)
+    if args.transport == "stream":
+        # A stable consumer name lets a restarted instance pick up the entries it left pending
+        process_filter_service = Process(target=insult_filter.filter_stream_service,
+                                         args=(f"filter-{args.instance_id}", args.batch_size))
+    else:
+        process_filter_service = Process(target=insult_filter.filter_service)
     process_service_status = Process(target=insult_filter.get_status_daemon)
 
     process_filter_service.start()
@@ -1,22 +1,30 @@
 import Pyro4
 import redis
 import argparse
+import os
+import sys
 import time
 from multiprocessing import Process
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from InsultSetCache import add_to_insult_set, bump_version
+from Pagination import DEFAULT_PAGE_SIZE, TAIL_SIZE, clamp_limit
+from RedisCounter import DEFAULT_SHARDS, MAX_SHARDS, BufferedCounter, read_counter_exact, reset_counter
+
 
 class InsultService:
-    def __init__(self, redis_host, redis_port):
+    def __init__(self, redis_host, redis_port, counter_shards=DEFAULT_SHARDS):
         self.queue_insults = "Insults_queue"
         self.channel_broadcast = "Insults_broadcast"
         self.insultSet = "INSULTS"
         self.counter_key = "COUNTER"  # Key for Redis counter
         self.client = redis.Redis(host=redis_host, port=redis_port, db=0, decode_responses=True)
+        self.counter = BufferedCounter(self.client, self.counter_key, shards=counter_shards)
 
     def add_insult(self, insult):
-        self.client.incr(self.counter_key)  # INCR Redis Counter
-        self.client.sadd(self.insultSet, insult)
+        self.counter.incr()
+        add_to_insult_set(self.client, self.insultSet, insult)  # Bumps the set version read by the filters
         # print(f"InsultService added: {insult} (Counter: {self.get_processed_count()})")
         return f"Insult added: {insult}"
 
@@ -24,6 +32,11 @@ class InsultService:
         insults_list = self.client.smembers(self.insultSet)
         return f"Insult list: {insults_list}"
 
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, insults] from one SSCAN step; next_cursor is 0 once the scan is complete
+        cursor, insults = self.client.sscan(self.insultSet, int(cursor), count=clamp_limit(limit))
+        return [cursor, insults]
+
     def insult_me(self):
         if self.client.scard(self.insultSet) != 0:
             insult = self.client.srandmember(self.insultSet)
@@ -61,7 +74,7 @@ class InsultService:
         try:
             while True:
                 print("\n--- InsultService Status ---")
-                print(self.get_insults())
+                print(f"Insults stored: {self.client.scard(self.insultSet)}, sample: {self.client.srandmember(self.insultSet, TAIL_SIZE)}")
                 print(f"InsultService processed count: {self.get_processed_count()}")
                 print("------------------------------\n")
                 time.sleep(10)
@@ -69,8 +82,7 @@ class InsultService:
             print("\nInsultService Worker: Stopping get_status_daemon...")
 
     def get_processed_count(self):
-        count = self.client.get(self.counter_key)
-        return int(count) if count else 0
+        return read_counter_exact(self.client, self.counter_key)
 
 # --- Main execution block for InsultService ---
 if __name__ == "__main__":
@@ -78,11 +90,13 @@ if __name__ == "__main__":
     parser.add_argument("--redis-host", default="localhost", help="Redis host")
     parser.add_argument("--redis-port", type=int, default=6379, help="Redis port")
     parser.add_argument("-id", "--instance-id", type=int, default=1, help="Service instance ID", required=True)
+    parser.add_argument("--counter-shards", type=int, choices=range(1, MAX_SHARDS + 1), default=DEFAULT_SHARDS,
+                        metavar="N", help=f"Redis keys COUNTER is spread over, 1-{MAX_SHARDS}; more keys spare one hot key when many processes count (default: {DEFAULT_SHARDS})")
     args = parser.parse_args()
 
     print("Starting InsultService...")
 
-    insults_service = InsultService(args.redis_host, args.redis_port)
+    insults_service = InsultService(args.redis_host, args.redis_port, args.counter_shards)
 
     # --- Set up Pyro server ---
     print("Starting Pyro InsultService for remote access...")
@@ -107,7 +121,8 @@ if __name__ == "__main__":
 
     print("InsultService: Clearing initial Redis keys (INSULTS, INSULTS_COUNTER)...")
     insults_service.client.delete(insults_service.insultSet)
-    insults_service.client.delete(insults_service.counter_key)
+    bump_version(insults_service.client, insults_service.insultSet)
+    reset_counter(insults_service.client, insults_service.counter_key)
     print("Redis keys cleared.")
 
     # --- Start background processes for InsultService ---
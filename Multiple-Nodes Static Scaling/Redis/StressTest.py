@@ -6,11 +6,16 @@ import argparse
 import sys
 import os
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from RedisStreamQueue import TEXT_FIELD
+from RedisCounter import read_counter, read_counter_exact
+
 # --- Configuration ---
 DEFAULT_REDIS_HOST = 'localhost'
 DEFAULT_REDIS_PORT = 6379
 DEFAULT_INSULT_QUEUE = 'Insults_queue'
 DEFAULT_WORK_QUEUE = 'Work_queue'         # List (queue) where texts to filter are sent
+DEFAULT_WORK_STREAM = 'Work_stream'       # Stream read by the filters' consumer group (--transport stream)
 REDIS_COUNTER = 'COUNTER'
 
 
@@ -68,7 +73,7 @@ def worker_add_insult(host, port, queue_name, results_queue, n_msg):
             redis_client.close()
             # print(f"[Procés {pid}] Connexió Redis tancada.")
 
-def worker_filter_text(host, port, queue_name, results_queue, n_msg):
+def worker_filter_text(host, port, queue_name, results_queue, n_msg, transport='list'):
     local_request_count = 0
     local_error_count = 0
     redis_client = None
@@ -82,7 +87,10 @@ def worker_filter_text(host, port, queue_name, results_queue, n_msg):
         while local_request_count < n_msg:
             try:
                 text = random.choice(TEXTS_TO_FILTER)
-                redis_client.rpush(queue_name, text) # RPUSH adds to the end of the list
+                if transport == 'stream':
+                    redis_client.xadd(queue_name, {TEXT_FIELD: text})
+                else:
+                    redis_client.rpush(queue_name, text) # RPUSH adds to the end of the list
                 local_request_count += 1
             except redis.exceptions.ConnectionError as e:
                 print(f"[Process {pid}] Redis connection error sending to queue: {e}", file=sys.stderr)
@@ -101,20 +109,23 @@ def worker_filter_text(host, port, queue_name, results_queue, n_msg):
             # print(f"[Procés {pid}] Connexió Redis tancada.")  # TODO: Uncomment this line to see the Redis connection close message
 
 # --- Main Test Function ---
-def run_stress_test(mode, host, port, insult_queue, work_queue, messages, num_service_instances):
+def run_stress_test(mode, host, port, insult_queue, work_queue, messages, num_service_instances,
+                    transport='list', work_stream=DEFAULT_WORK_STREAM):
     print(f"Starting stress test (Redis) in mode '{mode}'...")
     print(f"Redis Host: {host}:{port}")
     print(f"Insult Queue (for add_insult mode): {insult_queue}")
-    print(f"Filter Queue (for filter_text mode): {work_queue}")
+    print(f"Filter {'Stream' if transport == 'stream' else 'Queue'} (for filter_text mode): {work_stream if transport == 'stream' else work_queue}")
     print(f"Number of messages to send: {messages}")
     print("-" * 30)
 
     if mode == 'add_insult':
         worker_function = worker_add_insult
+        worker_args = ()
         target = insult_queue
     elif mode == 'filter_text':
         worker_function = worker_filter_text
-        target = work_queue
+        target = work_stream if transport == 'stream' else work_queue
+        worker_args = (transport,)
     else:
         print(f"Error: Mode '{mode}' not recognized.\nOptions: 'add_insult', 'filter_service'.", file=sys.stderr)
         return
@@ -134,7 +145,7 @@ def run_stress_test(mode, host, port, insult_queue, work_queue, messages, num_se
     # Create and start processes
     for _ in range(DEFAULT_CONCURRENCY):
         # Pass host and port to the worker to create the client inside the process
-        process = Process(target=worker_function, args=(host, port, target, results_queue, n_messages))
+        process = Process(target=worker_function, args=(host, port, target, results_queue, n_messages, *worker_args))
         processes.append(process)
         process.start()
 
@@ -158,7 +169,7 @@ def run_stress_test(mode, host, port, insult_queue, work_queue, messages, num_se
 
     # We wait for the instances of the service to finish processing all the messages.
     total_messages = n_messages * DEFAULT_CONCURRENCY
-    while int(redis_client.get(REDIS_COUNTER)) < total_messages:
+    while read_counter(redis_client, REDIS_COUNTER) < total_messages:
         time.sleep(0.001)
 
     actual_duration_server = time.time() - start_time
@@ -166,7 +177,7 @@ def run_stress_test(mode, host, port, insult_queue, work_queue, messages, num_se
     print("-" * 30)
 
     # --- Phase 2: Get statistics from the service ---
-    total_processed_count = int(redis_client.get(REDIS_COUNTER))
+    total_processed_count = read_counter_exact(redis_client, REDIS_COUNTER)
 
     # --- Phase 3: Display results ---
     print("Stress Test (Redis with Multiprocessing) Finished")
@@ -217,6 +228,10 @@ if __name__ == "__main__":
                         help=f"Name of the Redis queue for publishing insults (default: {DEFAULT_INSULT_QUEUE})")
     parser.add_argument("--work-queue", default=DEFAULT_WORK_QUEUE,
                         help=f"Name of the Redis list/queue for filtering texts (default: {DEFAULT_WORK_QUEUE})")
+    parser.add_argument("--work-stream", default=DEFAULT_WORK_STREAM,
+                        help=f"Name of the Redis stream for filtering texts with --transport stream (default: {DEFAULT_WORK_STREAM})")
+    parser.add_argument("--transport", choices=['list', 'stream'], default='list',
+                        help="Send texts to filter to the list (RPUSH) or the stream (XADD); must match the filters (default: list)")
     parser.add_argument("-m", "--messages", type=int, required=True,
                         help=f"Number of messages to send")
     parser.add_argument("-n", "--num-instances", type=int, default=1,
@@ -225,4 +240,4 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     run_stress_test(args.mode, args.host, args.port, args.insult_queue, args.work_queue,
-                                args.messages, args.num_instances)
\ No newline at end of file
+                                args.messages, args.num_instances, args.transport, args.work_stream)
\ No newline at end of file
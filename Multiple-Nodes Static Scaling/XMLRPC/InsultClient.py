@@ -83,12 +83,14 @@ try:
         t = input()
         if t == "I":
             try:
-                print("Insult list:", load_balancer_proxy.get_insults())
+                cursor, insults = load_balancer_proxy.get_insults_page(0)
+                print(f"Insult list (first {len(insults)}{', more available' if cursor else ''}):", insults)
             except Exception as e:
                 print(f"Communication error: {e}.")
         elif t == "T":
             try:
-                print("Censored texts:", load_balancer_proxy.get_results())
+                cursor, censored_texts = load_balancer_proxy.get_results_page(0)
+                print(f"Censored texts (first {len(censored_texts)}{', more available' if cursor else ''}):", censored_texts)
             except Exception as e:
                 print(f"Communication error: {e}.")
         elif t == "K":
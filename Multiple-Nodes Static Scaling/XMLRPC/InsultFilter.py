@@ -1,61 +1,99 @@
-from xmlrpc.server import SimpleXMLRPCRequestHandler
-from xmlrpc.server import SimpleXMLRPCServer
 import argparse
+import os
 import sys
 
 import redis
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from InsultMatcher import InsultMatcher
+from Pagination import DEFAULT_PAGE_SIZE
+from ResultsStore import BoundedResults, ResultsManager
+from XmlRpcServer import KeepAliveRequestHandler, XMLRPCServer, serve
+from RedisCounter import DEFAULT_SHARDS, MAX_SHARDS, BufferedCounter
+from Registry import FILTER_KIND, Registration
+
 
 # Restrict to a particular path.
-class RequestHandler(SimpleXMLRPCRequestHandler):
+class RequestHandler(KeepAliveRequestHandler):
     rpc_paths = ('/RPC2',)
 
 # Add argument parsing
 parser = argparse.ArgumentParser(description="Insult Filter XML-RPC Server")
 parser.add_argument("-p", "--port", type=int, default=8000,
                     help="Port number to listen on (default: 8000)")
+parser.add_argument("-t", "--threads", type=int, default=1,
+                    help="Threads serving requests in each process (default: 1)")
+parser.add_argument("-w", "--workers", type=int, default=1,
+                    help="Pre-forked processes sharing the port through SO_REUSEPORT (default: 1)")
+parser.add_argument("--register", action="store_true",
+                    help="Announce this instance in Redis to load balancers started with --discover")
+parser.add_argument("--counter-shards", type=int, choices=range(1, MAX_SHARDS + 1), default=DEFAULT_SHARDS,
+                    metavar="N", help=f"Redis keys COUNTER is spread over, 1-{MAX_SHARDS}; more keys spare one hot key when many processes count (default: {DEFAULT_SHARDS})")
 args = parser.parse_args()
 
 port = args.port
 
 class InsultFilter:
-    def __init__(self):
-        self.insults = ["tonto", "lleig", "boig", "idiota", "estúpid", "inútil", "desastre", "fracassat", "covard", "mentider"]
-        self.results = []   # censored text results
+    def __init__(self, insults, results, counter_shards=DEFAULT_SHARDS):
+        self.insults = insults   # insults (append-only)
+        self.insults.extend(["tonto", "lleig", "boig", "idiota", "estúpid", "inútil", "desastre", "fracassat", "covard", "mentider"])
+        self.matcher = InsultMatcher()   # this process' compiled copy of insults
+        self.results = results   # newest distinct censored texts (BoundedResults)
         self.counter_key = "COUNTER"
         self.client = redis.Redis(db=0, decode_responses=True)
+        self.counter = BufferedCounter(self.client, self.counter_key, shards=counter_shards)
 
     def filter(self, text):
-        censored_text = ""
-        for word in text.split():
-            if word in self.insults:
-                censored_text += "CENSORED "
-            else:
-                censored_text += word + " "
-        if censored_text not in self.results:
-            self.results.append(censored_text)
-        self.client.incr(self.counter_key)
+        self.matcher.sync(self.insults)
+        censored_text = self.matcher.censor(text)
+        self.results.add(censored_text)
+        self.counter.incr()
         return censored_text
 
+    def filter_many(self, texts):
+        # Batch version of filter: one call, results returned in the same order as texts
+        self.matcher.sync(self.insults)
+        censored_texts = [self.matcher.censor(text) for text in texts]
+        self.results.add_many(censored_texts)
+        self.counter.incr(len(texts))
+        return censored_texts
+
     def add_insult(self, insult):
         self.insults.append(insult)
         return f"Insult added: {insult}"
 
     def get_results(self):
-        return self.results
+        return self.results.items()
+
+    def get_results_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, censored texts]; next_cursor is 0 once every stored text has been returned
+        return self.results.page(cursor, limit)
 
 # Create server
+def build_server():
+    server = XMLRPCServer(('localhost', port), threads=args.threads, reuse_port=args.workers > 1,
+                          requestHandler=RequestHandler)
+    server.register_introspection_functions()
+    server.register_instance(insult_filter)
+    return server
+
+registration = None
 try:
-    with SimpleXMLRPCServer(('localhost', port),
-                        requestHandler=RequestHandler) as server:
-        server.register_introspection_functions()
+    if args.workers > 1:
+        # Pre-forked processes share the insults and results through a manager process
+        manager = ResultsManager()
+        manager.start()
+        insult_filter = InsultFilter(manager.list(), manager.BoundedResults(), args.counter_shards)
+    else:
+        insult_filter = InsultFilter([], BoundedResults(), args.counter_shards)
 
-        insult_filter = InsultFilter()
-        server.register_instance(insult_filter)
+    if args.register:
+        registration = Registration(redis.Redis(db=0, decode_responses=True), FILTER_KIND,
+                                    f"http://localhost:{port}/RPC2").start()
 
-        # Run the server's main loop
-        print(f"Insult Filter Server is running on port {port}...")
-        server.serve_forever()
+    # Run the server's main loop
+    print(f"Insult Filter Server is running on port {port} ({args.workers} process(es), {args.threads} thread(s) each)...")
+    serve(build_server, args.workers)
 except KeyboardInterrupt:
     print("\nShutting down InsultFilter...")
     sys.exit(0)
@@ -64,4 +102,7 @@ except PermissionError:
     sys.exit(1)
 except Exception as e:
     print(f"An error occurred: {e}", file=sys.stderr)
-    sys.exit(1)
\ No newline at end of file
+    sys.exit(1)
+finally:
+    if registration is not None:
+        registration.stop()  # Load balancers drop this instance at their next discovery
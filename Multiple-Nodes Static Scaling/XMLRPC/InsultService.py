@@ -1,59 +1,110 @@
 import random
-import xmlrpc.client
-from xmlrpc.server import SimpleXMLRPCRequestHandler
-from xmlrpc.server import SimpleXMLRPCServer
+from multiprocessing import Manager, Value
 import argparse
+import os
 import sys
+import threading
 
 import redis
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from FanOut import Broadcaster, xmlrpc_sender
+from Pagination import DEFAULT_PAGE_SIZE, page
+from XmlRpcServer import KeepAliveRequestHandler, XMLRPCServer, serve
+from RedisCounter import DEFAULT_SHARDS, MAX_SHARDS, BufferedCounter
+from Registry import SERVICE_KIND, Registration
+
 
 # Restrict to a particular path.
-class RequestHandler(SimpleXMLRPCRequestHandler):
+class RequestHandler(KeepAliveRequestHandler):
     rpc_paths = ('/RPC2',)
 
 # Add argument parsing
 parser = argparse.ArgumentParser(description="Insult Service XML-RPC Server")
 parser.add_argument("-p", "--port", type=int, default=8000,
                     help="Port number to listen on (default: 8000)")
+parser.add_argument("-t", "--threads", type=int, default=1,
+                    help="Threads serving requests in each process (default: 1)")
+parser.add_argument("-w", "--workers", type=int, default=1,
+                    help="Pre-forked processes sharing the port through SO_REUSEPORT (default: 1)")
+parser.add_argument("--register", action="store_true",
+                    help="Announce this instance in Redis to load balancers started with --discover")
+parser.add_argument("--counter-shards", type=int, choices=range(1, MAX_SHARDS + 1), default=DEFAULT_SHARDS,
+                    metavar="N", help=f"Redis keys COUNTER is spread over, 1-{MAX_SHARDS}; more keys spare one hot key when many processes count (default: {DEFAULT_SHARDS})")
 args = parser.parse_args()
 
 port = args.port
 
 class Insults:
-    def __init__(self):
-        self.insults = []   # received insults
-        self.subscribers = [] # Subscribers for this specific instance
+    def __init__(self, insults, subscribers, counter_shards=DEFAULT_SHARDS):
+        self.insults = insults   # received insults
+        self.subscribers = subscribers # Subscribers for this specific instance
         self.counter_key = "COUNTER"
         self.client = redis.Redis(db=0, decode_responses=True)
+        self.counter = BufferedCounter(self.client, self.counter_key, shards=counter_shards)
+        self.fanout = None  # Created by the first broadcast of each (forked) process
+        self.fanout_lock = threading.Lock()  # Never held before the workers are forked
+        self.subscribers_version = Value('i', 0)  # Bumped on every change to subscribers, seen by every process
+        self.synced_version = 0  # subscribers_version when fanout was last synced with subscribers
 
     def add_subscriber(self, url):
         if url not in self.subscribers:
             self.subscribers.append(url)
+            self.subscribers_changed()
+            self.get_fanout().subscribe(url)
             print(f"Subscriber {url} added to instance on port {port}.")
             return f"Subscriber {url} added to instance on port {port}."
         print(f"Subscriber {url} already exists on instance on port {port}.")
         return f"Subscriber {url} already exists on instance on port {port}."
 
+    def get_fanout(self):
+        if self.fanout is None:
+            with self.fanout_lock:
+                if self.fanout is None:
+                    self.fanout = Broadcaster(xmlrpc_sender, on_evict=self.remove_subscriber)
+        # Copying a Manager list is a round trip, so it is only read again after a change
+        version = self.subscribers_version.value
+        if version != self.synced_version:
+            self.synced_version = version  # Before the read: a change made meanwhile bumps the version again
+            self.fanout.sync(list(self.subscribers))  # Changes made through the other processes
+        return self.fanout
+
+    def subscribers_changed(self):
+        with self.subscribers_version.get_lock():
+            self.subscribers_version.value += 1
+
+    def remove_subscriber(self, url):
+        try:
+            self.subscribers.remove(url)
+            self.subscribers_changed()
+            print(f"Subscriber {url} removed from instance on port {port}.")
+        except ValueError:
+            pass
+
     def notify_subscribers(self, insult):
-        print(f"Instance on port {port} notifying {len(self.subscribers)} subscribers.")
-        for subscriber_url in self.subscribers:
-            try:
-                proxy = xmlrpc.client.ServerProxy(subscriber_url)
-                proxy.notify(insult)
-                print(f"Subscriber {subscriber_url} notified by instance on port {port}. Insult: {insult}")
-            except Exception as exception:
-                print(f"Error notifying {subscriber_url} from instance on port {port}: {exception}", file=sys.stderr)
+        # Queued for every subscriber; the deliveries run on the fan-out pool
+        self.get_fanout().publish(insult)
         return f"Subscribers of instance on port {port} notified."
 
+    def notify_many(self, insults):
+        self.get_fanout().publish_many(insults)
+        return f"{len(insults)} insults queued for the subscribers of instance on port {port}."
+
+    def get_fanout_stats(self):
+        return self.get_fanout().stats()
+
     def add_insult(self, insult):
         self.insults.append(insult)
-        self.client.incr(self.counter_key)
+        self.counter.incr()
         # print(f"Instance on port {port} added insult: {insult}. Count: {self.counter.value}")
         return f"Insult added by instance on port {port}: {insult}"
 
     def get_insults(self):
-        return self.insults
+        return list(self.insults)
+
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, insults]; next_cursor is 0 once every insult has been returned
+        return page(self.insults, cursor, limit)
 
     def insult_me(self):
         if len(self.insults) == 0:
@@ -65,17 +116,29 @@ class Insults:
         return chosen_insult
 
 # Create server
+def build_server():
+    server = XMLRPCServer(('localhost', port), threads=args.threads, reuse_port=args.workers > 1,
+                          requestHandler=RequestHandler)
+    server.register_introspection_functions()
+    server.register_instance(insults_instance)
+    return server
+
+registration = None
 try:
-    with SimpleXMLRPCServer(('localhost', port),
-                            requestHandler=RequestHandler) as server:
-        server.register_introspection_functions()
+    if args.workers > 1:
+        # Pre-forked processes share the insults and subscribers through a manager process
+        manager = Manager()
+        insults_instance = Insults(manager.list(), manager.list(), args.counter_shards)
+    else:
+        insults_instance = Insults([], [], args.counter_shards)
 
-        insults_instance = Insults()
-        server.register_instance(insults_instance)
+    if args.register:
+        registration = Registration(redis.Redis(db=0, decode_responses=True), SERVICE_KIND,
+                                    f"http://localhost:{port}/RPC2").start()
 
-        # Run the server's main loop
-        print(f"Insult Service Server is running on port {port}...")
-        server.serve_forever()
+    # Run the server's main loop
+    print(f"Insult Service Server is running on port {port} ({args.workers} process(es), {args.threads} thread(s) each)...")
+    serve(build_server, args.workers)
 except KeyboardInterrupt:
     print("\nShutting down InsultService...")
     sys.exit(0)
@@ -84,4 +147,7 @@ except PermissionError:
     sys.exit(1)
 except Exception as e:
     print(f"An error occurred: {e}", file=sys.stderr)
-    sys.exit(1)
\ No newline at end of file
+    sys.exit(1)
+finally:
+    if registration is not None:
+        registration.stop()  # Load balancers drop this instance at their next discovery
@@ -14,6 +14,12 @@ class Subscriber:
         print(f"New insult received: {insult}")
         return "Insult received."
 
+    def notify_many(self, insults):
+        # Insults that queued up for this subscriber at the service, delivered in one call
+        for insult in insults:
+            self.notify(insult)
+        return f"{len(insults)} insults received."
+
 
 parser = argparse.ArgumentParser(description="XML-RPC InsultSubscriber")
 parser.add_argument("-sb_port", "--subscriber-port", type=int, required=True, help="Port to bind the subscriber to")
@@ -24,6 +30,7 @@ server = SimpleXMLRPCServer(('localhost', args.subscriber_port), requestHandler=
 subscriber_service = Subscriber()
 
 server.register_function(subscriber_service.notify, "notify")
+server.register_function(subscriber_service.notify_many, "notify_many")
 
 print(f"Subscriber running on port {args.subscriber_port}...")
 try:
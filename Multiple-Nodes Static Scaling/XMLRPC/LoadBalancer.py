@@ -1,132 +1,255 @@
-import xmlrpc.client
-from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
 import argparse
-import threading
+import os
 import sys
+import threading
+import time
+import xmlrpc.client
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import redis
 
-class RequestHandler(SimpleXMLRPCRequestHandler):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from Balancer import DEFAULT_PROBE_INTERVAL, DEFAULT_STRATEGY, STRATEGIES, Balancer
+from BatchSplit import MAX_BATCH_PARTS, batch_parts, split_batch
+from Pagination import DEFAULT_PAGE_SIZE, fan_out_page
+from Registry import FILTER_KIND, SERVICE_KIND, discover
+from ScatterGather import DEFAULT_WORKERS, gather_lists, scatter
+from XmlRpcPool import ServerProxyPool
+from XmlRpcServer import KeepAliveRequestHandler, XMLRPCServer
+from RedisCounter import DEFAULT_SHARDS, MAX_SHARDS, BufferedCounter, read_counter_exact, reset_counter
+
+class RequestHandler(KeepAliveRequestHandler):
     rpc_paths = ('/RPC2',)
 
+BACKEND_TIMEOUT = 5  # s per backend call
+
+def is_backend_failure(error):
+    # A Fault comes from the backend's own method: the backend is up
+    return not isinstance(error, xmlrpc.client.Fault)
+
+def is_unsent(error):
+    # Refused while connecting: the backend never got the request, so another one can run it
+    return isinstance(error, ConnectionRefusedError)
+
+def probe_backend(pool):
+    # Over a pooled connection, which already has a backend thread, so a busy backend still answers it
+    try:
+        with pool.proxy() as proxy:
+            proxy.system.listMethods()
+    except xmlrpc.client.Fault:
+        pass
+
 class XmlrpcLoadBalancer:
-    def __init__(self, service_urls, filter_urls):
-        self.service_proxies = [xmlrpc.client.ServerProxy(url, allow_none=True) for url in service_urls]
-        self.filter_proxies = [xmlrpc.client.ServerProxy(url, allow_none=True) for url in filter_urls]
-        self.num_services = len(self.service_proxies)
-        self.num_filters = len(self.filter_proxies)
-        self.current_service_index = 0
-        self.current_filter_index = 0
-        self.service_lock = threading.Lock()
-        self.filter_lock = threading.Lock()  # Lock to protect the index in round-robin
+    def __init__(self, service_urls, filter_urls, pool_size=8, strategy=DEFAULT_STRATEGY,
+                 probe_interval=DEFAULT_PROBE_INTERVAL, counter_shards=DEFAULT_SHARDS):
+        # One pool of keep-alive connections per backend, shared by the LB threads
+        self.create_pool = partial(ServerProxyPool, size=pool_size, timeout=BACKEND_TIMEOUT)
+        self.static_urls = set(service_urls) | set(filter_urls)  # Kept whatever the registry says
+        self.subscribers = []  # Also added to services discovered later
+        self.service_balancer = Balancer([self.create_pool(url) for url in service_urls], strategy, "InsultService",
+                                         label=lambda pool: pool.url, is_failure=is_backend_failure,
+                                         is_unsent=is_unsent)
+        self.filter_balancer = Balancer([self.create_pool(url) for url in filter_urls], strategy, "InsultFilter",
+                                        label=lambda pool: pool.url, is_failure=is_backend_failure,
+                                        is_unsent=is_unsent)
+        if probe_interval > 0:
+            self.service_balancer.start_health_checks(probe_backend, probe_interval)
+            self.filter_balancer.start_health_checks(probe_backend, probe_interval)
         self.counter_key = "COUNTER"  # Key for Redis counter
         self.client = redis.Redis(db=0, decode_responses=True)
+        self.counter = BufferedCounter(self.client, self.counter_key, shards=counter_shards)
+        self.batch_executor = ThreadPoolExecutor(max_workers=MAX_BATCH_PARTS)  # Runs filter_many chunks in parallel
+        self.scatter_executor = ThreadPoolExecutor(max_workers=DEFAULT_WORKERS)  # Calls every backend at once
 
+    # The backends change when --discover is on, so they are always read from the balancers
+    @property
+    def service_pools(self):
+        return self.service_balancer.targets()
 
-    def get_next_service_proxy(self):
-        with self.service_lock:
-            if not self.service_proxies:
-                raise Exception("No InsultService backends available.")
-            proxy = self.service_proxies[self.current_service_index]
-            self.current_service_index = (self.current_service_index + 1) % self.num_services
-            return proxy
+    @property
+    def filter_pools(self):
+        return self.filter_balancer.targets()
 
-    def get_next_filter_proxy(self):
-        with self.filter_lock:
-            if not self.filter_proxies:
-                raise Exception("No InsultFilter backends available.")
-            proxy = self.filter_proxies[self.current_filter_index]
-            self.current_filter_index = (self.current_filter_index + 1) % self.num_filters
-            return proxy
+    @property
+    def num_services(self):
+        return len(self.service_balancer)
+
+    @property
+    def num_filters(self):
+        return len(self.filter_balancer)
+
+    def watch_registry(self, interval):
+        threading.Thread(target=self.discovery_loop, args=(interval,), daemon=True, name="discovery").start()
+
+    def discovery_loop(self, interval):
+        while True:
+            try:
+                self.discover_backends()
+            except Exception as error:
+                print(f"LB: Error discovering backends: {error}", file=sys.stderr)
+            time.sleep(interval)
+
+    def discover_backends(self):
+        # Backends announce themselves in Redis (InsultService.py / InsultFilter.py --register)
+        added, removed = self.service_balancer.sync(discover(self.client, SERVICE_KIND), self.create_pool,
+                                                    keep=self.static_urls)
+        for pool in added:
+            for url in list(self.subscribers):
+                try:
+                    self.call_backend(pool, "add_subscriber", (url,))
+                except Exception as error:
+                    print(f"LB: Error adding subscriber {url} to {pool.url}: {error}", file=sys.stderr)
+        for pool in removed:
+            pool.close()
+        added, removed = self.filter_balancer.sync(discover(self.client, FILTER_KIND), self.create_pool,
+                                                   keep=self.static_urls)
+        for pool in removed:
+            pool.close()
+
+
+    def get_balancer_stats(self):
+        # Per-backend health, requests in flight, totals, errors and smoothed response time
+        return {"services": self.service_balancer.stats(), "filters": self.filter_balancer.stats()}
 
     # --- Methods for the InsultService ---
     def add_insult(self, insult):
         try:
-            proxy = self.get_next_service_proxy()
-            self.client.incr(self.counter_key)  # INCR Redis Counter
-            # print(f"LB: Add insult '{insult}' to service: {proxy._XmlRpcClient__host_port_path}")
-            return proxy.add_insult(insult)
+            self.counter.incr()
+            # A backend that cannot be reached is retried on the next one
+            return self.service_balancer.call(partial(self.call_backend, method="add_insult", args=(insult,)))
         except Exception as error:
             print(f"ERROR on LB add_insult: {error}", file=sys.stderr)
             raise
 
     def insult_me(self):
         try:
-            proxy = self.get_next_service_proxy()
-            self.client.incr(self.counter_key)  # INCR Redis Counter
-            # print(f"LB: Requesting insult from service: {proxy._XmlRpcClient__host_port_path}")
-            return proxy.insult_me()  # L'InsultService escollit notificarà els seus subscriptors.
+            self.counter.incr()
+            return self.service_balancer.call(partial(self.call_backend, method="insult_me"), idempotent=True)  # L'InsultService escollit notificarà els seus subscriptors.
         except Exception as error:
             print(f"ERROR on LB insult_me: {error}", file=sys.stderr)
             raise
 
     def get_insults(self):
-        if self.num_services > 0:
-            try:
-                response = []
-                for proxy in self.service_proxies:
-                    response.extend(proxy.get_insults())
-                return response
-            except Exception as error:
-                print(f"ERROR obtaining results from service backend: {error}", file=sys.stderr)
-                raise
-        return []
+        # Every service is asked at once; the ones that fail or time out are left out of the response
+        response, failures = gather_lists(self.scatter_executor, self.service_pools,
+                                          partial(self.call_backend, method="get_insults"),
+                                          timeout=BACKEND_TIMEOUT, label=lambda pool: pool.url)
+        for failure in failures:
+            print(f"ERROR obtaining results from service backend {failure}", file=sys.stderr)
+        return response
+
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # The cursor is [backend index, backend cursor]; the backends are read one after the other
+        try:
+            return fan_out_page([partial(self.page_backend, pool, "get_insults_page") for pool in self.service_pools],
+                                cursor, limit)
+        except Exception as error:
+            print(f"ERROR obtaining a page from service backend: {error}", file=sys.stderr)
+            raise
+
+    def page_backend(self, pool, method, cursor, limit):
+        return self.call_backend(pool, method, (cursor, limit))
+
+    @staticmethod
+    def call_backend(pool, method, args=()):
+        with pool.proxy() as proxy:
+            return getattr(proxy, method)(*args)
 
     # --- Method for the InsultFilter ---
     def filter(self, text):
         try:
-            proxy = self.get_next_filter_proxy()
-            self.client.incr(self.counter_key)  # INCR Redis Counter
-            # print(f"LB: Filtering text '{text}' via filter: {proxy._XmlRpcClient__host_port_path}")
-            return proxy.filter(text)
+            self.counter.incr()
+            return self.filter_balancer.call(partial(self.call_backend, method="filter", args=(text,)))
         except Exception as error:
             print(f"ERROR on LB filter: {error}", file=sys.stderr)
             raise
 
+    def filter_many(self, texts):
+        if not texts:
+            return []
+        try:
+            # Large batches are split into one chunk per filter and censored in parallel
+            parts = batch_parts(len(texts), self.num_filters)
+            chunks = split_batch(texts, parts)
+            self.counter.incr(len(texts))
+            if parts == 1:
+                return self.filter_chunk(chunks[0])
+            results = []
+            for censored_texts in self.batch_executor.map(self.filter_chunk, chunks):
+                results.extend(censored_texts)
+            return results
+        except Exception as error:
+            print(f"ERROR on LB filter_many: {error}", file=sys.stderr)
+            raise
+
+    def filter_chunk(self, texts):
+        # Each chunk picks its filter when it is sent, seeing the chunks already in flight
+        return self.filter_balancer.call(partial(self.call_backend, method="filter_many", args=(texts,)))
+
     def get_results(self):
-        if self.num_filters > 0:
-            try:
-                response = []
-                for proxy in self.filter_proxies:
-                    response.extend(proxy.get_results())
-                return response
-            except Exception as error:
-                print(f"ERROR obtaining results from filter backend: {error}", file=sys.stderr)
-                raise
-        return []
+        response, failures = gather_lists(self.scatter_executor, self.filter_pools,
+                                          partial(self.call_backend, method="get_results"),
+                                          timeout=BACKEND_TIMEOUT, label=lambda pool: pool.url)
+        for failure in failures:
+            print(f"ERROR obtaining results from filter backend {failure}", file=sys.stderr)
+        return response
+
+    def get_results_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        try:
+            return fan_out_page([partial(self.page_backend, pool, "get_results_page") for pool in self.filter_pools],
+                                cursor, limit)
+        except Exception as error:
+            print(f"ERROR obtaining a page from filter backend: {error}", file=sys.stderr)
+            raise
+
     # --- Method to add a subscriber to all backends ---
     def add_subscriber(self, url):
         print(f"LB: Adding subscriber {url} to all InsultService backends.")
+        if url not in self.subscribers:
+            self.subscribers.append(url)
         errors = 0
-        for proxy in self.service_proxies:
-            try:
-                proxy.add_subscriber(url)
-                print(f"LoadBalancer: Subscriber added via {proxy._XmlRpcClient__host_port_path}")
-            except Exception as error:
-                errors += 1
-                print(f"LoadBalancer: Error adding subscriber via {proxy._XmlRpcClient__host_port_path}: {error}",
-                      file=sys.stderr)
+        for pool, _, error in scatter(self.scatter_executor, self.service_pools,
+                                      partial(self.call_backend, method="add_subscriber", args=(url,)),
+                                      timeout=BACKEND_TIMEOUT):
+            if error is None:
+                print(f"LoadBalancer: Subscriber added via {pool.url}")
+                continue
+            errors += 1
+            print(f"LoadBalancer: Error adding subscriber via {pool.url}: {error}",
+                  file=sys.stderr)
         if errors > 0:
 
             raise Exception(f"Errors adding subscribers on {errors} services.")
         return "Subscriber added to all services."
 
-    def notify_subscribers(self, insult):
-        print(f"LB: Forwarding notify_subscribers for insult '{insult}' to all insult services.")
+    def _broadcast(self, method, *args):
+        # Calls method on every InsultService at once; returns the number of services that failed
         errors = 0
-        for proxy in self.service_proxies:
-            try:
-                proxy.notify_subscribers(insult)  # Each InsultService notifies its subscribers
-            except Exception as error:
+        for pool, _, error in scatter(self.scatter_executor, self.service_pools,
+                                      partial(self.call_backend, method=method, args=args),
+                                      timeout=BACKEND_TIMEOUT):
+            if error is not None:
                 errors += 1
-                print(f"LB: Error notifying subscribers via {proxy._pyroUri}: {error}", file=sys.stderr)
+                print(f"LB: Error notifying subscribers via {pool.url}: {error}", file=sys.stderr)
+        return errors
+
+    def notify_subscribers(self, insult):
+        print(f"LB: Forwarding notify_subscribers for insult '{insult}' to all insult services.")
+        errors = self._broadcast("notify_subscribers", insult)  # Each InsultService notifies its subscribers
         if errors > 0:
             print(f"LB: {errors} errors occurred during notify_subscribers_balanced.", file=sys.stderr)
 
+    def notify_many(self, insults):
+        errors = self._broadcast("notify_many", insults)  # One call per service for the whole batch
+        if errors > 0:
+            print(f"LB: {errors} errors occurred during notify_many.", file=sys.stderr)
+
     # --- Method to get the total request count ---
     def get_processed_count(self):
-        count = self.client.get(self.counter_key)
+        self.counter.flush()
+        count = read_counter_exact(self.client, self.counter_key)  # Also waits for the backends' flushes
         print(f"Load Balancer returning processed count: {count}")
-        return int(count) if count else 0
+        return count
 
 # --- Load Balancer Server Configuration and Execution ---
 if __name__ == "__main__":
@@ -136,16 +259,32 @@ if __name__ == "__main__":
                         help="List of URLs of instances of InsultService (e.g., http://localhost:8001/RPC2 http://localhost:8002/RPC2)")
     parser.add_argument("--filter_urls", nargs='+', default=[],
                         help="List of URLs of instances of InsultFilter (e.g., http://localhost:8011/RPC2 http://localhost:8012/RPC2)")
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="Threads serving requests; also the number of idle connections kept per backend (default: 1)")
+    parser.add_argument("-s", "--strategy", choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help=f"How each request picks its backend (default: {DEFAULT_STRATEGY})")
+    parser.add_argument("--probe-interval", type=float, default=DEFAULT_PROBE_INTERVAL,
+                        help=f"Seconds between backend health checks, 0 disables them (default: {DEFAULT_PROBE_INTERVAL})")
+    parser.add_argument("--discover", action="store_true",
+                        help="Also use the services and filters started with --register, adding and removing them as they come and go")
+    parser.add_argument("--discovery-interval", type=float, default=2.0,
+                        help="Seconds between two reads of the backend registry (default: 2.0)")
+    parser.add_argument("--counter-shards", type=int, choices=range(1, MAX_SHARDS + 1), default=DEFAULT_SHARDS,
+                        metavar="N", help=f"Redis keys COUNTER is spread over, 1-{MAX_SHARDS}; more keys spare one hot key when many processes count (default: {DEFAULT_SHARDS})")
 
     args = parser.parse_args()
 
-    lb_instance = XmlrpcLoadBalancer(args.service_urls, args.filter_urls)
+    lb_instance = XmlrpcLoadBalancer(args.service_urls, args.filter_urls, pool_size=args.threads,
+                                      strategy=args.strategy, probe_interval=args.probe_interval,
+                                      counter_shards=args.counter_shards)
+    if args.discover:
+        lb_instance.watch_registry(args.discovery_interval)
 
-    print(f"llsita proxies: {lb_instance.service_proxies}")
+    print(f"llsita proxies: {[pool.url for pool in lb_instance.service_pools]}")
 
     # Create server
     try:
-        with SimpleXMLRPCServer(('localhost', args.port), requestHandler=RequestHandler, allow_none=True) as server:
+        with XMLRPCServer(('localhost', args.port), threads=args.threads, requestHandler=RequestHandler, allow_none=True) as server:
             server.register_introspection_functions()
 
             # Register the load balancer instance
@@ -155,12 +294,13 @@ if __name__ == "__main__":
             server.register_function(lb_instance.get_processed_count, "get_processed_count")
 
             print("LoadBalancer: Clearing initial Redis key (COUNTER)...")
-            lb_instance.client.delete(lb_instance.counter_key)
+            reset_counter(lb_instance.client, lb_instance.counter_key)
             print("Redis keys cleared.")
 
             print(f"Load Balancer running on localhost:{args.port}...")
             print(f"Filter servers: {args.filter_urls}")
             print(f"Service servers: {args.service_urls}")
+            print(f"Balancing strategy: {args.strategy}")
             server.serve_forever()
     except KeyboardInterrupt:
         print("\nShutting down LoadBalancer...")
@@ -6,6 +6,9 @@ import argparse
 import sys
 import os
 import redis
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from RedisCounter import read_counter, read_counter_exact, reset_counter
 # Default URL for the Load Balancer
 LOAD_BALANCER_URL = "http://localhost:9000/RPC2"
 REDIS_COUNTER = 'COUNTER'
@@ -67,7 +70,7 @@ def worker_add_insult(urls, results_queue, n_msg):
     finally:
         results_queue.put((local_request_count, local_error_count))
 
-def worker_filter_text(urls, results_queue, n_msg):
+def worker_filter_text(urls, results_queue, n_msg, batch_size=1):
     local_request_count = 0
     local_error_count = 0
     pid = os.getpid()
@@ -83,11 +86,16 @@ def worker_filter_text(urls, results_queue, n_msg):
 
         while local_request_count < n_msg:
             try:
-                text = random.choice(TEXTS_TO_FILTER)
                 actual = services[local_request_count % len(servers)]
-                actual.filter(text)
-
-                local_request_count += 1
+                if batch_size > 1:
+                    # One call censors a whole batch, amortising the per-call overhead
+                    batch = random.choices(TEXTS_TO_FILTER, k=min(batch_size, n_msg - local_request_count))
+                    actual.filter_many(batch)
+                    local_request_count += len(batch)
+                else:
+                    text = random.choice(TEXTS_TO_FILTER)
+                    actual.filter(text)
+                    local_request_count += 1
             except Exception as e:
                 # print(f"[Process {pid}] Error filtering text (XML-RPC via LB): {e}", file=sys.stderr)
                 local_error_count += 1
@@ -102,8 +110,10 @@ def worker_filter_text(urls, results_queue, n_msg):
         results_queue.put((local_request_count, local_error_count))
 
 # --- Main Test Function ---
-def run_stress_test(mode, messages, service_url, filter_url):
+def run_stress_test(mode, messages, service_url, filter_url, batch_size=1):
     print(f"Starting XML-RPC stress test in mode '{mode}' via Load Balancer...")
+    if mode == 'filter_text':
+        print(f"Batch size: {batch_size} texts per call")
     print("-" * 30)
 
     num_service_instances = 0
@@ -111,7 +121,6 @@ def run_stress_test(mode, messages, service_url, filter_url):
 
 
     worker_function = None
-    get_count_method_name = "get_processed_count"  # To store the name of the method to get counts from LB
 
     if mode == 'add_insult':
         worker_function = worker_add_insult
@@ -135,7 +144,7 @@ def run_stress_test(mode, messages, service_url, filter_url):
         print(f"Severe error connecting to Redis in run_stress_test: {e}", file=sys.stderr)
         exit(1)
 
-    redis_client.set(REDIS_COUNTER, 0)
+    reset_counter(redis_client, REDIS_COUNTER)
 
     n_messages = messages // DEFAULT_CONCURRENCY
     results_queue = Queue()
@@ -143,9 +152,12 @@ def run_stress_test(mode, messages, service_url, filter_url):
     start_time = time.time()
 
     # Create and start worker processes
+    worker_args = (url, results_queue, n_messages)
+    if mode == 'filter_text':
+        worker_args += (batch_size,)
     print(f"Launching {DEFAULT_CONCURRENCY} worker processes for mode '{mode}'...")
     for _ in range(DEFAULT_CONCURRENCY):
-        process = Process(target=worker_function, args=(url, results_queue, n_messages))
+        process = Process(target=worker_function, args=worker_args)
         processes.append(process)
         process.start()
 
@@ -166,32 +178,13 @@ def run_stress_test(mode, messages, service_url, filter_url):
 
     total_messages = n_messages * DEFAULT_CONCURRENCY
     # We wait for the instances of the service to finish processing all the messages.
-    while int(redis_client.get(REDIS_COUNTER)) < total_messages:
+    while read_counter(redis_client, REDIS_COUNTER) < total_messages:
         time.sleep(0.001)
 
     actual_duration_server = time.time() - start_time
 
-    # Get the total number of requests processed by the servers via the LB
-    total_server_processed_count = -1  # Default to an error value
-    if lb_main_proxy and get_count_method_name:
-        try:
-            # Dynamically get the correct count method from the LB proxy
-            get_total_processed_count_func = getattr(lb_main_proxy, get_count_method_name)
-            total_server_processed_count = get_total_processed_count_func()
-            print(f"Successfully retrieved total processed count ({total_server_processed_count}) from LB using '{get_count_method_name}'.")
-        except xmlrpc.client.Fault as f:
-            print(f"XML-RPC Fault when calling '{get_count_method_name}' on Load Balancer: {f.faultString} (Code: {f.faultCode})",
-                file=sys.stderr)
-        except AttributeError:
-            print(f"Error: The method '{get_count_method_name}' was not found on the Load Balancer proxy.",
-                  file=sys.stderr)
-            print("Please ensure the Load Balancer exposes this method.", file=sys.stderr)
-        except Exception as e:
-            print(f"Error getting total processed count from Load Balancer using '{get_count_method_name}': {e}",
-                  file=sys.stderr)
-    else:
-        print("Load Balancer proxy not available or method name for counts not set; cannot get server counts.",
-              file=sys.stderr)
+    # The workers call the backends directly, so the processed count is read from the shared Redis counter
+    total_server_processed_count = read_counter_exact(redis_client, REDIS_COUNTER)
 
 
     print("-" * 30)
@@ -203,10 +196,7 @@ def run_stress_test(mode, messages, service_url, filter_url):
     print(f"Total Client Requests Sent (by workers): {total_client_requests_sent}")
     print(f"Total Client Errors (encountered by workers): {total_client_errors}")
 
-    if total_server_processed_count != -1:
-        print(f"Total Server Processed Requests (summed via LB from backends): {total_server_processed_count}")
-    else:
-        print("Could not reliably get total server processed count from Load Balancer.")
+    print(f"Total Server Processed Requests (shared Redis counter): {total_server_processed_count}")
 
     print("-" * 30)
     if actual_duration_client > 0:
@@ -242,7 +232,9 @@ if __name__ == "__main__":
                         help="List of URLs of instances of InsultService (e.g., localhost:8000 localhost:8001)")
     parser.add_argument("--filter_urls", nargs='+', default=[],
                         help="List of URLs of instances of InsultFilter (e.g., localhost:8010 localhost:8011)")
+    parser.add_argument("-b", "--batch-size", type=int, default=1,
+                        help="Texts sent per call in filter_text mode; above 1 uses filter_many")
 
     args = parser.parse_args()
 
-    run_stress_test(args.mode, args.messages, args.service_urls, args.filter_urls)
\ No newline at end of file
+    run_stress_test(args.mode, args.messages, args.service_urls, args.filter_urls, args.batch_size)
\ No newline at end of file
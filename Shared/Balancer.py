@@ -0,0 +1,269 @@
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ROUND_ROBIN = "round_robin"
+LEAST_OUTSTANDING = "least_outstanding"  # Fewest requests in flight
+EWMA = "ewma"  # Lowest smoothed response time, weighted by the requests in flight
+P2C = "p2c"  # Power of two choices: the less loaded of two random backends
+STRATEGIES = (ROUND_ROBIN, LEAST_OUTSTANDING, EWMA, P2C)
+
+DEFAULT_STRATEGY = ROUND_ROBIN  # The others are opted into with -s/--strategy
+DEFAULT_ALPHA = 0.3  # Weight of the newest response time in the EWMA
+DEFAULT_MAX_FAILURES = 3  # Consecutive failures before a backend is ejected
+DEFAULT_EJECTION_TIME = 2.0  # s of the first ejection; doubles with every ejection in a row
+MAX_EJECTION_TIME = 60.0
+DEFAULT_ATTEMPTS = 3  # Backends a request is tried on by call()
+DEFAULT_PROBE_INTERVAL = 2.0  # s between active health checks
+
+HEALTHY = "healthy"
+EJECTED = "ejected"
+HALF_OPEN = "half_open"  # Ejection over: one trial request decides whether the backend is back
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+class Backend:
+    def __init__(self, target, label):
+        self.target = target  # What the caller gets back, e.g. a ServerProxyPool or a PyroProxyPool
+        self.label = label
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.ewma = 0.0  # s; 0 until the first response, so new backends are tried first
+        self.failures = 0  # In a row
+        self.ejections = 0  # In a row
+        self.ejected_until = 0.0  # time.monotonic(); 0 while healthy
+        self.trial = False  # A half-open trial request is in flight
+        self.succeeded_at = 0.0  # time.monotonic() of the last request or probe it answered
+
+    def state(self, now) -> str:
+        if not self.ejected_until:
+            return HEALTHY
+        return EJECTED if now < self.ejected_until else HALF_OPEN
+
+    def available(self, now) -> bool:
+        state = self.state(now)
+        return state == HEALTHY or (state == HALF_OPEN and not self.trial)
+
+    def cost(self) -> float:
+        # Expected wait of one more request: every request in flight ahead of it takes about ewma
+        return (self.in_flight + 1) * self.ewma
+
+    def stats(self, now) -> dict:
+        return {
+            "backend": self.label,
+            "state": self.state(now),
+            "ejections": self.ejections,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ewma_ms": round(self.ewma * 1000, 3),
+        }
+
+
+class Balancer:
+    """Picks the backend for each request and keeps per-backend load, latency and health.
+
+    acquire() counts the request as in flight from the moment it is chosen, so concurrent choices already
+    see it, and feeds its response time into the backend's EWMA when it completes. Round robin ignores the
+    statistics; the other strategies steer requests away from a backend that is slow or has a queue.
+
+    A backend that fails max_failures requests (or health probes) in a row is ejected: no request is sent
+    to it until the ejection ends, and the ejection doubles each time the backend fails again right after
+    it. When it ends the backend is half-open and a single trial request, or a successful probe, decides
+    whether it is healthy again. is_failure tells backend failures (e.g. a refused connection) from errors
+    raised by the remote method, which say nothing about the backend's health. is_unsent tells the
+    failures that happened before the request reached the backend, after which call() may safely send it
+    to another one.
+    """
+    def __init__(self, targets, strategy=DEFAULT_STRATEGY, name="backend", label=str, alpha=DEFAULT_ALPHA,
+                 is_failure=lambda error: True, is_unsent=lambda error: False, max_failures=DEFAULT_MAX_FAILURES,
+                 ejection_time=DEFAULT_EJECTION_TIME):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}")
+        self.strategy = strategy
+        self.name = name
+        self.alpha = alpha
+        self.is_failure = is_failure
+        self.is_unsent = is_unsent
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.label = label
+        self.backends = [Backend(target, label(target)) for target in targets]
+        self.next_index = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    def targets(self) -> list:
+        with self.lock:
+            return [backend.target for backend in self.backends]
+
+    def sync(self, labels, create, keep=()):
+        """Adds create(label) for every new label and removes the backends whose label is missing (unless
+        it is in keep). Returns the added and the removed targets; requests in flight on a removed backend
+        complete normally."""
+        labels = set(labels)
+        with self.lock:
+            current = {backend.label for backend in self.backends}
+        added = [Backend(create(label), label) for label in labels - current]  # Outside the lock: may connect
+        with self.lock:
+            removed = [backend for backend in self.backends
+                       if backend.label not in labels and backend.label not in keep]
+            current = {backend.label for backend in self.backends}
+            added = [backend for backend in added if backend.label not in current]
+            # A new list rather than in-place changes: the health checks iterate over the old one
+            self.backends = [backend for backend in self.backends if backend not in removed] + added
+        for backend in added:
+            print(f"Balancer: Added {self.name} backend {backend.label}")
+        for backend in removed:
+            print(f"Balancer: Removed {self.name} backend {backend.label}")
+        return [backend.target for backend in added], [backend.target for backend in removed]
+
+    def _choose(self, exclude=()) -> Backend:
+        """Called with self.lock held."""
+        now = time.monotonic()
+        backends = [backend for backend in self.backends if backend.available(now) and backend not in exclude]
+        if not backends:
+            raise NoBackendAvailable(f"No healthy {self.name} backends available.")
+        if self.strategy == ROUND_ROBIN or len(backends) == 1:
+            backend = backends[self.next_index % len(backends)]
+            self.next_index = (self.next_index + 1) % len(self.backends)
+        elif self.strategy == P2C:
+            first, second = random.sample(backends, 2)
+            backend = min(first, second, key=lambda backend: (backend.in_flight, backend.ewma))
+        else:
+            # Rotating the start of the scan spreads ties instead of always picking the first backend
+            start = self.next_index = (self.next_index + 1) % len(backends)
+            candidates = backends[start:] + backends[:start]
+            if self.strategy == LEAST_OUTSTANDING:
+                backend = min(candidates, key=lambda backend: backend.in_flight)
+            else:
+                backend = min(candidates, key=Backend.cost)
+        if backend.state(now) == HALF_OPEN:
+            backend.trial = True
+        return backend
+
+    @contextmanager
+    def _track(self, exclude=()):
+        with self.lock:
+            backend = self._choose(exclude)
+            backend.in_flight += 1
+        start = time.perf_counter()
+        error = None
+        try:
+            yield backend
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            failed = error is not None and self.is_failure(error)
+            with self.lock:
+                backend.in_flight -= 1
+                backend.requests += 1
+                if error is not None:
+                    backend.errors += 1
+                if not failed:  # A refused connection fails at once and would make the backend look fastest
+                    backend.ewma = elapsed if backend.ewma == 0.0 else \
+                        self.alpha * elapsed + (1 - self.alpha) * backend.ewma
+            if failed:
+                self._failed(backend, error)
+            else:
+                self._succeeded(backend)
+
+    @contextmanager
+    def acquire(self):
+        """Chooses a backend and yields its target, tracking the request until the block exits."""
+        with self._track() as backend:
+            yield backend.target
+
+    def call(self, function, attempts=DEFAULT_ATTEMPTS, idempotent=False):
+        """Returns function(target), trying up to `attempts` different backends while it fails.
+
+        A request is only tried again if the failed backend never received it, unless it is idempotent: a
+        request that timed out or lost its connection may already have run, and running it twice must then
+        be harmless.
+        """
+        tried = []
+        while True:
+            try:
+                with self._track(tried) as backend:
+                    return function(backend.target)
+            except NoBackendAvailable:
+                if not tried:
+                    raise
+                raise last_error
+            except Exception as error:
+                retry = self.is_failure(error) and (idempotent or self.is_unsent(error))
+                if not retry or len(tried) + 1 >= attempts:
+                    raise
+                tried.append(backend)
+                last_error = error
+
+    def _succeeded(self, backend):
+        with self.lock:
+            backend.succeeded_at = time.monotonic()
+            backend.failures = 0
+            backend.trial = False
+            if backend.ejected_until:
+                backend.ejected_until = 0.0
+                backend.ejections = 0
+                print(f"Balancer: {self.name} backend {backend.label} is healthy again")
+
+    def _failed(self, backend, error):
+        with self.lock:
+            backend.failures += 1
+            now = time.monotonic()
+            if backend.state(now) == EJECTED:
+                return  # Requests that were in flight when it was ejected
+            if backend.state(now) == HEALTHY and backend.failures < self.max_failures:
+                return
+            backend.ejections += 1
+            ejection_time = min(MAX_EJECTION_TIME, self.ejection_time * 2 ** (backend.ejections - 1))
+            backend.ejected_until = now + ejection_time
+            backend.failures = 0
+            backend.trial = False
+        print(f"Balancer: Ejected {self.name} backend {backend.label} for {ejection_time:.1f}s: {error}",
+              file=sys.stderr)
+
+    def start_health_checks(self, probe, interval=DEFAULT_PROBE_INTERVAL):
+        """Runs probe(target), which raises if the backend is down, on every backend each `interval` s.
+
+        A failed probe is ignored while the backend is still answering requests: a busy backend may be too
+        slow for the probe without being down.
+        """
+        thread = threading.Thread(target=self._health_loop, args=(probe, interval), daemon=True,
+                                  name=f"health-{self.name}")
+        thread.start()
+        return thread
+
+    def _health_loop(self, probe, interval):
+        while not self.stop_event.wait(interval):
+            for backend in list(self.backends):
+                with self.lock:
+                    if backend.state(time.monotonic()) == EJECTED:
+                        continue  # Left alone until its ejection ends
+                try:
+                    probe(backend.target)
+                except Exception as error:
+                    if time.monotonic() - backend.succeeded_at > interval:
+                        self._failed(backend, error)
+                else:
+                    if backend.failures or backend.ejected_until:
+                        self._succeeded(backend)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            return {"strategy": self.strategy, "backends": [backend.stats(now) for backend in self.backends]}
+
+    def close(self):
+        self.stop_event.set()
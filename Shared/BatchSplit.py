@@ -0,0 +1,18 @@
+MIN_TEXTS_PER_BACKEND = 16  # Batches are only split across filters when every part gets at least this many texts
+MAX_BATCH_PARTS = 32
+
+
+def batch_parts(size: int, backends: int) -> int:
+    """Parts a batch of `size` texts is split into: one per backend, as long as each part stays large enough."""
+    return max(1, min(backends, MAX_BATCH_PARTS, size // MIN_TEXTS_PER_BACKEND))
+
+
+def split_batch(texts, parts):
+    """Contiguous, order-preserving chunks whose sizes differ by at most one."""
+    size, extra = divmod(len(texts), parts)
+    chunks, start = [], 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(texts[start:end])
+        start = end
+    return chunks
@@ -0,0 +1,364 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import xmlrpc.client
+from multiprocessing import Process, Queue
+
+import pika
+import Pyro4
+import redis
+
+from LatencyHistogram import LatencyHistogram
+from LoadProfile import ARRIVALS, PROFILES, schedule
+from RedisStreamQueue import add_to_stream
+
+INSULTS_TO_ADD = ["tonto", "lleig", "boig", "idiota", "estúpid", "inútil", "desastre", "fracassat", "covard", "mentider",
+                  "beneit", "capsigrany", "ganàpia", "nyicris", "gamarús", "bocamoll", "murri", "dropo", "bleda", "xitxarel·lo"]
+TEXTS_TO_FILTER = [
+    "ets tonto i estas boig", "ets molt inútil", "ets una mica desastre", "ets massa fracassat",
+    "ets un poc covard", "ets molt molt mentider", "ets super estúpid", "ets bastant idiota",
+    "Ets un beneit de cap a peus.", "No siguis capsigrany i pensa abans de parlar.",
+    "Aquest ganàpia no sap el que fa.", "Sempre estàs tan nyicris.", "Quin gamarús !",
+    "No siguis bocamoll.", "És un murri.", "No siguis dropo.", "Ets una mica bleda.",
+    "Aquest xitxarel·lo es pensa que ho sap tot."
+]
+
+# Where each middleware/topology receives every mode, as deployed by the README.
+# XML-RPC entries are host:port, Pyro entries are Name Server names, Redis entries are keys
+# ("channel:" publishes, "stream:" XADDs for filters started with --transport stream, anything else is RPUSHed) and RabbitMQ entries are queues ("exchange:" publishes to a fanout exchange).
+TARGETS = {
+    "xmlrpc": {
+        "single": {"add_insult": ["localhost:8000"], "filter_text": ["localhost:8010"]},
+        "static": {"add_insult": ["localhost:9000"], "filter_text": ["localhost:9000"]},  # The LoadBalancer
+    },
+    "pyro": {
+        "single": {"add_insult": ["pyro.service"], "filter_text": ["pyro.filter"]},
+        "static": {"add_insult": ["pyro.loadbalancer"], "filter_text": ["pyro.loadbalancer"]},
+    },
+    "redis": {
+        "single": {"add_insult": ["channel:Insults_channel"], "filter_text": ["Work_queue"]},
+        "static": {"add_insult": ["Insults_queue"], "filter_text": ["Work_queue"]},
+    },
+    "rabbitmq": {
+        "single": {"add_insult": ["exchange:insults_exchange"], "filter_text": ["text_queue"]},
+        "static": {"add_insult": ["add_insult_queue"], "filter_text": ["text_queue"]},
+        "dynamic": {"add_insult": ["add_insult_queue"], "filter_text": ["text_queue"]},
+    },
+}
+
+# Middlewares whose filtering happens after the request returns: their latency only covers the hand-off
+ASYNC_MIDDLEWARES = ("redis", "rabbitmq")
+
+DEFAULT_DURATION = 10  # Seconds
+DEFAULT_CONCURRENCY = 10  # Number of concurrent processes/clients
+OPEN_LOOP_START_DELAY = 1.0  # s for every process to connect before the shared schedule starts
+
+
+# --- Clients: one per worker process, all with the same send(items) interface ---
+class XmlRpcClient:
+    def __init__(self, mode, targets, topology):
+        self.mode = mode
+        self.proxies = itertools.cycle([xmlrpc.client.ServerProxy(f"http://{target}/RPC2", allow_none=True)
+                                        for target in targets])
+
+    def send(self, items):
+        proxy = next(self.proxies)
+        if self.mode == "add_insult":
+            proxy.add_insult(items[0])
+        elif len(items) > 1:
+            proxy.filter_many(items)
+        else:
+            proxy.filter(items[0])
+
+    def close(self):
+        pass
+
+
+class PyroClient:
+    def __init__(self, mode, targets, topology):
+        self.mode = mode
+        self.proxies = [Pyro4.Proxy(f"PYRONAME:{target}") for target in targets]
+        for proxy in self.proxies:
+            proxy._pyroTimeout = 5
+        self.next_proxy = itertools.cycle(self.proxies)
+
+    def send(self, items):
+        proxy = next(self.next_proxy)
+        if self.mode == "add_insult":
+            proxy.add_insult(items[0])
+        elif len(items) > 1:
+            proxy.filter_many(items)
+        else:
+            proxy.filter_service(items[0])
+
+    def close(self):
+        for proxy in self.proxies:
+            proxy._pyroRelease()
+
+
+class RedisClient:
+    def __init__(self, mode, targets, topology, host="localhost", port=6379):
+        self.client = redis.Redis(host=host, port=port, db=0, decode_responses=True,
+                                  socket_connect_timeout=5, socket_timeout=5)
+        self.client.ping()
+        self.targets = itertools.cycle(targets)
+
+    def send(self, items):
+        target = next(self.targets)
+        if target.startswith("channel:"):
+            for item in items:
+                self.client.publish(target[len("channel:"):], item)
+        elif target.startswith("stream:"):
+            add_to_stream(self.client, target[len("stream:"):], items)
+        else:
+            self.client.rpush(target, *items)  # A batch is a single multi-value RPUSH
+
+    def close(self):
+        self.client.close()
+
+
+class RabbitMQClient:
+    def __init__(self, mode, targets, topology, host="localhost"):
+        self.connection = pika.BlockingConnection(pika.ConnectionParameters(host))
+        self.channel = self.connection.channel()
+        # With confirms, a publish returns once the broker has taken the message, so its latency is measurable
+        self.channel.confirm_delivery()
+        self.routes = []
+        for target in targets:
+            if target.startswith("exchange:"):
+                exchange = target[len("exchange:"):]
+                self.channel.exchange_declare(exchange=exchange, exchange_type='fanout')
+                self.routes.append((exchange, ''))
+            else:
+                # The Dynamic workers declare their queues durable; the other topologies do not
+                self.channel.queue_declare(queue=target, durable=topology == "dynamic")
+                self.routes.append(('', target))
+        self.next_route = itertools.cycle(self.routes)
+
+    def send(self, items):
+        exchange, routing_key = next(self.next_route)
+        for item in items:
+            self.channel.basic_publish(exchange=exchange, routing_key=routing_key, body=item.encode('utf-8'))
+
+    def close(self):
+        if self.connection.is_open:
+            self.connection.close()
+
+
+CLIENTS = {"xmlrpc": XmlRpcClient, "pyro": PyroClient, "redis": RedisClient, "rabbitmq": RabbitMQClient}
+
+
+def make_items(mode, count):
+    if mode == "add_insult":
+        return [random.choice(INSULTS_TO_ADD) + str(random.randint(1, 10000))]
+    return random.choices(TEXTS_TO_FILTER, k=count)
+
+
+def send_timed(client, items, histogram, errors):
+    """Sends one request, recording its duration; returns the updated error count."""
+    start = time.perf_counter()
+    try:
+        client.send(items)
+    except Exception as e:
+        if errors == 0:
+            print(f"[Process {os.getpid()}] Error sending request: {e}", file=sys.stderr)
+        return errors + 1
+    histogram.record(time.perf_counter() - start)
+    return errors
+
+
+def open_loop_worker(client, mode, batch_size, load, histogram, service_histogram):
+    """Sends at the intended times of the load schedule; latency is measured from the intended time."""
+    sent = 0
+    errors = 0
+    for offset in schedule(load['profile'], load['rate'], load['duration'], load['arrivals'], load['seed'],
+                           load['phase']):
+        intended = load['start_time'] + offset
+        delay = intended - time.time()
+        if delay > 0:
+            time.sleep(delay)  # Never waits for a late request: the next one is already due
+        items = make_items(mode, batch_size)
+        previous_errors = errors
+        errors = send_timed(client, items, service_histogram, errors)
+        if errors == previous_errors:
+            histogram.record(time.time() - intended)
+            sent += len(items)
+    return sent, errors
+
+
+def benchmark_worker(middleware, topology, mode, targets, batch_size, end_time, n_requests, load, results_queue):
+    """Sends requests until end_time (or n_requests), or along the open-loop `load` schedule if given,
+    and reports (sent, errors, latency histogram, service time histogram).
+    """
+    histogram = LatencyHistogram()
+    service_histogram = LatencyHistogram() if load else None  # Closed loop: both are the same
+    sent = 0
+    attempted = 0  # Failed requests count too, so a fixed-count run always ends
+    errors = 0
+    client = None
+    try:
+        client = CLIENTS[middleware](mode, targets, topology)
+        if load:
+            sent, errors = open_loop_worker(client, mode, batch_size, load, histogram, service_histogram)
+        while not load and ((time.time() < end_time) if n_requests is None else (attempted < n_requests)):
+            items = make_items(mode, batch_size if n_requests is None else min(batch_size, n_requests - attempted))
+            attempted += len(items)
+            previous_errors = errors
+            errors = send_timed(client, items, histogram, errors)
+            if errors == previous_errors:
+                sent += len(items)
+    except Exception as e:
+        print(f"[Process {os.getpid()}] Error connecting to {middleware}: {e}", file=sys.stderr)
+        errors += 1
+    finally:
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+        results_queue.put((sent, errors, histogram, service_histogram))
+
+
+def run_benchmark(middleware, topology, mode, targets, duration, messages, concurrency, batch_size,
+                  rate=None, profile="constant", arrivals="uniform"):
+    if mode == "add_insult":
+        batch_size = 1
+    n_requests = [None] * concurrency
+    if messages is not None and rate is None:
+        # Fixed-count run: split the messages among the processes, counted in texts as the StressTests do;
+        # the last one also sends the remainder
+        share, remainder = divmod(messages, concurrency)
+        n_requests = [share + (remainder if i == concurrency - 1 else 0) for i in range(concurrency)]
+
+    results_queue = Queue()
+    start_time = time.time()
+    end_time = start_time + duration
+    loads = [None] * concurrency
+    if rate is not None:
+        # Open loop: each process follows its own schedule with an equal share of the rate (in requests/s)
+        start_time += OPEN_LOOP_START_DELAY
+        loads = [{'rate': rate / concurrency, 'profile': profile, 'arrivals': arrivals, 'duration': duration,
+                  'start_time': start_time, 'seed': i, 'phase': i / concurrency} for i in range(concurrency)]
+    processes = [Process(target=benchmark_worker,
+                         args=(middleware, topology, mode, targets, batch_size, end_time, worker_requests, load,
+                               results_queue))
+                 for worker_requests, load in zip(n_requests, loads)]
+    for process in processes:
+        process.start()
+
+    # Drained before joining: a child does not exit until its queued histogram has been read
+    histogram = LatencyHistogram()
+    service_histogram = LatencyHistogram()
+    sent = 0
+    errors = 0
+    for _ in processes:
+        worker_sent, worker_errors, worker_histogram, worker_service_histogram = results_queue.get()
+        sent += worker_sent
+        errors += worker_errors
+        histogram.merge(worker_histogram)
+        if worker_service_histogram is not None:
+            service_histogram.merge(worker_service_histogram)
+    for process in processes:
+        process.join()
+    elapsed = time.time() - start_time
+
+    # Named apart so that a hand-off time is never compared with the latency of a whole call
+    prefix = "handoff_" if middleware in ASYNC_MIDDLEWARES else ""
+    result = {
+        "middleware": middleware,
+        "topology": topology,
+        "mode": mode,
+        "targets": targets,
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "duration_s": round(elapsed, 3),
+        "sent": sent,
+        "errors": errors,
+        "throughput_per_s": round(sent / elapsed, 2) if elapsed > 0 else None,
+        # RPC middlewares (XML-RPC, Pyro) time the whole call as latency; Redis and RabbitMQ time the
+        # hand-off to the server/broker as handoff_latency, since the filtering happens asynchronously
+        "latency_per": "call" if batch_size > 1 else "request",
+        f"{prefix}latency": histogram.summary(),
+        "histogram": histogram.to_dict(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if rate is not None:
+        # latency counts from the intended send time (queueing included); service_time only from the actual send
+        result["load"] = {"loop": "open", "rate_per_s": rate, "profile": profile, "arrivals": arrivals}
+        result[f"{prefix}service_time"] = service_histogram.summary()
+    else:
+        result["load"] = {"loop": "closed"}
+    return result
+
+
+def print_report(result):
+    handoff = "handoff_latency" in result
+    latency = result["handoff_latency" if handoff else "latency"]
+    print("-" * 30)
+    print(f"Benchmark ({result['middleware']}, {result['topology']}, {result['mode']}) finished")
+    print(f"Total time: {result['duration_s']:.2f} seconds")
+    print(f"Requests sent: {result['sent']}  Errors: {result['errors']}")
+    if result["throughput_per_s"] is not None:
+        print(f"Client throughput (requests/second): {result['throughput_per_s']:.2f}")
+    if result["load"]["loop"] == "open":
+        load = result["load"]
+        print(f"Open loop: {load['rate_per_s']} requests/s target, {load['profile']} profile, {load['arrivals']} arrivals")
+    if latency["count"]:
+        print(f"{'Hand-off latency' if handoff else 'Latency'} per {result['latency_per']} (ms): mean {latency['mean_ms']:.3f}  p50 {latency['p50_ms']:.3f}  "
+              f"p90 {latency['p90_ms']:.3f}  p99 {latency['p99_ms']:.3f}  p99.9 {latency['p99_9_ms']:.3f}  "
+              f"max {latency['max_ms']:.3f}")
+    print("-" * 30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency benchmark for every middleware and topology of the Insult service")
+    parser.add_argument("middleware", choices=sorted(TARGETS), help="Middleware to drive")
+    parser.add_argument("mode", choices=['add_insult', 'filter_text'], help="The functionality to test")
+    parser.add_argument("-t", "--topology", choices=['single', 'static', 'dynamic'], default='single',
+                        help="Deployment whose default targets are used (default: single)")
+    parser.add_argument("--targets", nargs='+', default=None,
+                        help="Override the targets: host:port (xmlrpc), Pyro names, Redis keys or RabbitMQ queues")
+    parser.add_argument("-d", "--duration", type=int, default=DEFAULT_DURATION,
+                        help=f"Test duration in seconds (default: {DEFAULT_DURATION})")
+    parser.add_argument("-m", "--messages", type=int, default=None,
+                        help="Send this many messages instead of running for --duration")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Number of concurrent client processes (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("-b", "--batch-size", type=int, default=1,
+                        help="Texts sent per request in filter_text mode (default: 1)")
+    parser.add_argument("-r", "--rate", type=float, default=None,
+                        help="Open loop: target requests/second over all processes, sent on schedule for --duration")
+    parser.add_argument("--profile", choices=PROFILES, default="constant",
+                        help="Open-loop rate profile: constant, ramp (0 to --rate), step (4 steps) or spike (default: constant)")
+    parser.add_argument("--arrivals", choices=ARRIVALS, default="uniform",
+                        help="Open-loop spacing between requests: uniform or poisson (default: uniform)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="JSON file for the results (default: benchmark-<middleware>-<topology>-<mode>-<time>.json)")
+    args = parser.parse_args()
+
+    targets = args.targets or TARGETS[args.middleware].get(args.topology, {}).get(args.mode)
+    if not targets:
+        print(f"Error: {args.middleware} has no '{args.topology}' deployment; pass --targets.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Starting benchmark ({args.middleware}, {args.topology}, {args.mode}) against {targets}...")
+    if args.rate is not None and args.rate <= 0:
+        print("Error: --rate must be positive.", file=sys.stderr)
+        sys.exit(1)
+    result = run_benchmark(args.middleware, args.topology, args.mode, targets, args.duration, args.messages,
+                           args.concurrency, args.batch_size, args.rate, args.profile, args.arrivals)
+    print_report(result)
+
+    output = args.output or (f"benchmark-{args.middleware}-{args.topology}-{args.mode}-"
+                             f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+import socket
+import threading
+import uuid
+from collections import OrderedDict
+
+DEFAULT_MAX_CLIENTS = 10000  # Clients that never ask for their count are forgotten, least recently acked first
+
+
+def new_client_id() -> str:
+    """Identifies the oneway calls of one client (one proxy) in CallAcks."""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class CallAcks:
+    """Counts the oneway calls processed per client.
+
+    A oneway call returns before the server has run it, so the caller passes its client id with every call and
+    asks take(client_id) at the end. Servers run with Pyro4.config.ONEWAY_THREADED = False, which executes
+    oneway calls in order on the thread serving their connection; a regular call made afterwards on the same
+    proxy is therefore only answered once every earlier oneway call on it has been processed, and the count it
+    returns is exact.
+
+    take() also forgets the client, and at most max_clients are kept for clients that exit without asking, so
+    memory stays bounded however many clients come and go.
+    """
+    def __init__(self, max_clients: int = DEFAULT_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self.counts = OrderedDict()  # Least recently acked client first
+        self.lock = threading.Lock()
+
+    def ack(self, client_id, amount: int = 1):
+        if client_id is None:
+            return
+        with self.lock:
+            self.counts[client_id] = self.counts.get(client_id, 0) + amount
+            self.counts.move_to_end(client_id)
+            if len(self.counts) > self.max_clients:
+                self.counts.popitem(last=False)
+
+    def take(self, client_id) -> int:
+        """The count of client_id, which is then forgotten: asking for it is the client's last call."""
+        with self.lock:
+            return self.counts.pop(client_id, 0)
@@ -0,0 +1,208 @@
+import sys
+import threading
+import xmlrpc.client
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from XmlRpcPool import TimeoutTransport
+
+DROP_OLDEST = "drop_oldest"  # A full queue discards its oldest message to make room
+DROP_NEWEST = "drop_newest"  # A full queue discards the message being published
+EVICT = "evict"  # A full queue unsubscribes its subscriber
+POLICIES = (DROP_OLDEST, DROP_NEWEST, EVICT)
+
+DEFAULT_WORKERS = 16
+DEFAULT_QUEUE_SIZE = 100  # Messages waiting per subscriber
+DEFAULT_BATCH_SIZE = 50  # Messages handed to one notify_many call
+DEFAULT_MAX_FAILURES = 3  # Consecutive failed sends before a subscriber is evicted
+DEFAULT_TIMEOUT = 5.0  # s a subscriber call may take
+
+
+def xmlrpc_sender(url, timeout=DEFAULT_TIMEOUT):
+    """Sender for an XML-RPC subscriber: notify(insult), or notify_many(insults) when it has it."""
+    proxy = xmlrpc.client.ServerProxy(url, allow_none=True, transport=TimeoutTransport(timeout))
+    bulk = [True]
+
+    def send(messages):
+        if len(messages) > 1 and bulk[0]:
+            try:
+                proxy.notify_many(messages)
+                return
+            except xmlrpc.client.Fault:
+                bulk[0] = False  # Subscriber without notify_many
+        for message in messages:
+            proxy.notify(message)
+    return send
+
+
+def pyro_sender(uri, timeout=DEFAULT_TIMEOUT):
+    """Sender for a Pyro subscriber: receive_insult(insult), or receive_insults(insults) when it has it."""
+    import Pyro4
+
+    proxy = Pyro4.Proxy(uri)
+    proxy._pyroTimeout = timeout
+    bulk = [True]
+
+    def send(messages):
+        if len(messages) > 1 and bulk[0]:
+            try:
+                proxy.receive_insults(messages)
+                return
+            except AttributeError:
+                bulk[0] = False
+        for message in messages:
+            proxy.receive_insult(message)
+    return send
+
+
+class Subscriber:
+    def __init__(self, key, send, queue_size):
+        self.key = key
+        self.send = send  # Cached connection, only ever used by the one drain running for this subscriber
+        self.pending = deque()
+        self.queue_size = queue_size
+        self.scheduled = False
+        self.failures = 0
+        self.dropped = 0
+
+
+class Broadcaster:
+    """Delivers every published message to every subscriber without waiting for any of them.
+
+    Each subscriber has a cached sender and a bounded queue. publish() only appends to the queues and
+    schedules a drain on the worker pool for subscribers that are not already being drained, so a slow or
+    dead subscriber holds one worker and fills its own queue instead of delaying the others. Messages that
+    piled up while a subscriber was busy go out together in one bulk call. A subscriber whose queue
+    overflows loses messages according to `policy`, and one that fails max_failures sends in a row is evicted.
+    """
+    def __init__(self, connect, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, policy=DROP_OLDEST,
+                 batch_size=DEFAULT_BATCH_SIZE, max_failures=DEFAULT_MAX_FAILURES, on_evict=None):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        self.connect = connect  # key -> send(messages) callable
+        self.queue_size = queue_size
+        self.policy = policy
+        self.batch_size = batch_size
+        self.max_failures = max_failures
+        self.on_evict = on_evict  # Called with the key of every evicted subscriber
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fanout")
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.evicted = 0
+
+    def subscribe(self, key) -> bool:
+        """Adds a subscriber. Returns False if it was already subscribed."""
+        with self.lock:
+            if key in self.subscribers:
+                return False
+        send = self.connect(key)  # Outside the lock: creating a proxy may resolve names
+        with self.lock:
+            if key in self.subscribers:
+                return False
+            self.subscribers[key] = Subscriber(key, send, self.queue_size)
+            return True
+
+    def sync(self, keys):
+        """Makes keys the subscribers (e.g. the contents of a list shared between processes): subscribes the
+        new keys and unsubscribes the ones no longer in it."""
+        keys = set(keys)
+        with self.lock:
+            for key in [key for key in self.subscribers if key not in keys]:
+                del self.subscribers[key]
+        for key in keys:
+            if key not in self.subscribers:
+                self.subscribe(key)
+
+    def unsubscribe(self, key) -> bool:
+        with self.lock:
+            return self.subscribers.pop(key, None) is not None
+
+    def publish(self, message):
+        self.publish_many([message])
+
+    def publish_many(self, messages):
+        """Queues the messages for every subscriber and returns at once."""
+        if not messages:
+            return
+        to_schedule, to_evict = [], []
+        with self.lock:
+            self.published += len(messages)
+            for subscriber in self.subscribers.values():
+                if not self._enqueue(subscriber, messages):
+                    to_evict.append(subscriber.key)
+                    continue
+                if not subscriber.scheduled:
+                    subscriber.scheduled = True
+                    to_schedule.append(subscriber)
+        for key in to_evict:
+            self._evict(key, "its queue is full")
+        for subscriber in to_schedule:
+            self.executor.submit(self._drain, subscriber)
+
+    def _enqueue(self, subscriber, messages) -> bool:
+        """Appends under self.lock; returns False if the subscriber has to be evicted."""
+        for message in messages:
+            if len(subscriber.pending) >= subscriber.queue_size:
+                if self.policy == EVICT:
+                    return False
+                subscriber.dropped += 1
+                self.dropped += 1
+                if self.policy == DROP_NEWEST:
+                    continue
+                subscriber.pending.popleft()
+            subscriber.pending.append(message)
+        return True
+
+    def _drain(self, subscriber):
+        while True:
+            with self.lock:
+                if not subscriber.pending or self.subscribers.get(subscriber.key) is not subscriber:
+                    subscriber.scheduled = False
+                    return
+                batch = [subscriber.pending.popleft()
+                         for _ in range(min(self.batch_size, len(subscriber.pending)))]
+            try:
+                subscriber.send(batch)
+            except Exception as e:
+                subscriber.failures += 1
+                with self.lock:
+                    self.dropped += len(batch)
+                print(f"FanOut: Error notifying {subscriber.key} ({subscriber.failures} in a row): {e}", file=sys.stderr)
+                if subscriber.failures >= self.max_failures:
+                    with self.lock:
+                        subscriber.scheduled = False
+                    self._evict(subscriber.key, f"{subscriber.failures} sends failed")
+                    return
+                continue
+            subscriber.failures = 0
+            with self.lock:
+                self.delivered += len(batch)
+
+    def _evict(self, key, reason):
+        if not self.unsubscribe(key):
+            return
+        with self.lock:
+            self.evicted += 1
+        print(f"FanOut: Evicted subscriber {key}: {reason}", file=sys.stderr)
+        if self.on_evict is not None:
+            try:
+                self.on_evict(key)
+            except Exception as e:
+                print(f"FanOut: Error in on_evict for {key}: {e}", file=sys.stderr)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "subscribers": len(self.subscribers),
+                "queued": sum(len(subscriber.pending) for subscriber in self.subscribers.values()),
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "evicted": self.evicted,
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
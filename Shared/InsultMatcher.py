@@ -0,0 +1,81 @@
+PUNCTUATION = '.,!?;:"\''
+CENSORED = "CENSORED"
+
+
+def normalize(word: str) -> str:
+    """Returns the lookup form of a word: surrounding punctuation removed and lowercased."""
+    return word.strip(PUNCTUATION).lower()
+
+
+def normalize_insult(insult: str) -> str:
+    """Returns the stored form of an insult: every word normalized, empty ones dropped."""
+    return " ".join(token for token in (normalize(word) for word in insult.split()) if token)
+
+
+class InsultMatcher:
+    def __init__(self, insults=()):
+        self.words = set()      # single-word insults, normalized
+        self.phrases = {}       # first word -> multi-word insults starting with it (longest first)
+        self.synced = 0         # entries already compiled from a shared list (see sync)
+        self.add_many(insults)
+
+    def add(self, insult: str) -> bool:
+        """Compiles an insult into the index. Returns True if it was not there yet."""
+        tokens = tuple(token for token in (normalize(word) for word in insult.split()) if token)
+        if not tokens:
+            return False
+        if len(tokens) == 1:
+            if tokens[0] in self.words:
+                return False
+            self.words.add(tokens[0])
+            return True
+        current = self.phrases.get(tokens[0], ())
+        if tokens in current:
+            return False
+        # Replace the tuple instead of mutating it so concurrent censor() calls never see it half-built
+        self.phrases[tokens[0]] = tuple(sorted(current + (tokens,), key=len, reverse=True))
+        return True
+
+    def add_many(self, insults) -> int:
+        """Compiles several insults. Returns how many were new."""
+        return sum(1 for insult in insults if self.add(insult))
+
+    def sync(self, shared_insults) -> int:
+        """Compiles the entries appended to an append-only (shared) list since the last sync."""
+        total = len(shared_insults)
+        if total <= self.synced:
+            return 0
+        added = self.add_many(shared_insults[self.synced:total])
+        self.synced = total
+        return added
+
+    def __contains__(self, insult: str) -> bool:
+        tokens = tuple(token for token in (normalize(word) for word in insult.split()) if token)
+        if len(tokens) == 1:
+            return tokens[0] in self.words
+        return bool(tokens) and tokens in self.phrases.get(tokens[0], ())
+
+    def __len__(self) -> int:
+        return len(self.words) + sum(len(phrases) for phrases in self.phrases.values())
+
+    def censor(self, text: str) -> str:
+        """Returns the text with every insult replaced by CENSORED, in a single pass over its words."""
+        words = text.split()
+        insults = self.words
+        if not self.phrases:
+            return " ".join([CENSORED if word.strip(PUNCTUATION).lower() in insults else word for word in words])
+
+        censored_words = []
+        i = 0
+        while i < len(words):
+            key = normalize(words[i])
+            for phrase in self.phrases.get(key, ()):
+                end = i + len(phrase)
+                if end <= len(words) and tuple(normalize(word) for word in words[i:end]) == phrase:
+                    censored_words.append(CENSORED)
+                    i = end
+                    break
+            else:
+                censored_words.append(CENSORED if key in insults else words[i])
+                i += 1
+        return " ".join(censored_words)
@@ -0,0 +1,78 @@
+import time
+
+from InsultMatcher import InsultMatcher, normalize_insult
+
+
+def version_key(set_key: str) -> str:
+    """Key of the counter bumped every time the insult set changes."""
+    return f"{set_key}:VERSION"
+
+
+def changes_channel(set_key: str) -> str:
+    """Pub/sub channel where every new version of the insult set is announced."""
+    return f"{set_key}:CHANGED"
+
+
+def bump_version(client, set_key: str) -> int:
+    """Marks the insult set as changed so every InsultSetCache reloads it."""
+    version = client.incr(version_key(set_key))
+    client.publish(changes_channel(set_key), version)
+    return version
+
+
+def add_to_insult_set(client, set_key: str, insult: str) -> bool:
+    """Adds an insult to the set, bumping its version only if it was not there yet.
+
+    The insult is stored normalized, the form RedisLuaFilter looks words up in, so "Beneit!" and "beneit"
+    are the same insult in both filter modes.
+    """
+    insult = normalize_insult(insult)
+    if not insult or not client.sadd(set_key, insult):
+        return False
+    bump_version(client, set_key)
+    return True
+
+
+class InsultSetCache:
+    def __init__(self, client, set_key: str, check_interval: float = 1.0):
+        self.client = client
+        self.set_key = set_key
+        self.version_key = version_key(set_key)
+        self.check_interval = check_interval  # s between version checks when no change is announced
+        self.matcher = InsultMatcher()
+        self.version = None
+        self.loaded = False
+        self.stale = True
+        self.last_check = 0.0
+
+        # Changes are pushed through pub/sub; the periodic version check covers missed messages
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(**{changes_channel(set_key): self._on_change})
+        self.listener = self.pubsub.run_in_thread(sleep_time=check_interval, daemon=True)
+
+    def _on_change(self, message):
+        self.stale = True
+
+    def reload(self):
+        """Fetches the insult set and its version atomically and recompiles the matcher."""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(self.version_key)
+        pipe.smembers(self.set_key)
+        version, insults = pipe.execute()
+        self.matcher = InsultMatcher(insults)
+        self.version = version
+        self.loaded = True
+
+    def get_matcher(self) -> InsultMatcher:
+        """Returns the compiled snapshot of the insult set, reloading it only if its version changed."""
+        now = time.monotonic()
+        if self.stale or now - self.last_check >= self.check_interval:
+            self.last_check = now
+            self.stale = False  # Cleared before reading, so a change announced meanwhile is not lost
+            if not self.loaded or self.client.get(self.version_key) != self.version:
+                self.reload()
+        return self.matcher
+
+    def close(self):
+        self.listener.stop()
+        self.pubsub.close()
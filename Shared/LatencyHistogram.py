@@ -0,0 +1,79 @@
+import math
+
+SUB_BUCKET_BITS = 7  # 128 linear sub-buckets per power of two: values are kept within 1/64 (~1.6%)
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    """Log-linear (HDR-style) histogram of latencies recorded in microseconds.
+
+    Memory grows with the log of the range, not with the number of samples, so every worker keeps
+    every request; histograms from several processes are combined with merge().
+    """
+    def __init__(self):
+        self.counts = {}  # bucket index -> samples
+        self.count = 0
+        self.total = 0  # µs, for the exact mean
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def _index(value: int) -> int:
+        shift = max(0, value.bit_length() - SUB_BUCKET_BITS)
+        return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+    @staticmethod
+    def _value(index: int) -> int:
+        """Middle of the bucket's range."""
+        shift, sub_bucket = index >> SUB_BUCKET_BITS, index & ((1 << SUB_BUCKET_BITS) - 1)
+        if shift == 0:
+            return sub_bucket
+        return (sub_bucket << shift) + (1 << (shift - 1))
+
+    def record(self, seconds: float):
+        value = max(0, int(seconds * 1e6))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percent: float) -> int:
+        """Value (µs) at or below which `percent` % of the samples fall."""
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """Count, mean, extremes and PERCENTILES in milliseconds."""
+        if not self.count:
+            return {"count": 0}
+        summary = {
+            "count": self.count,
+            "min_ms": self.min / 1000,
+            "mean_ms": round(self.total / self.count / 1000, 3),
+        }
+        for percent in PERCENTILES:
+            summary[f"p{percent:g}_ms".replace(".", "_")] = self.percentile(percent) / 1000
+        summary["max_ms"] = self.max / 1000
+        return summary
+
+    def to_dict(self) -> dict:
+        """Raw buckets, so runs can be merged or re-analysed later from their JSON."""
+        return {"sub_bucket_bits": SUB_BUCKET_BITS, "counts": {str(index): count for index, count in sorted(self.counts.items())}}
@@ -0,0 +1,43 @@
+import math
+import random
+
+PROFILES = ("constant", "ramp", "step", "spike")
+ARRIVALS = ("uniform", "poisson")
+
+STEPS = 4  # step: the rate climbs to its target in this many equal steps
+SPIKE_BASE_FRACTION = 0.2  # spike: base load, as a fraction of the target rate...
+SPIKE_WINDOW = (0.4, 0.6)  # ...with the full rate during this fraction of the run
+MIN_RATE_FRACTION = 0.01  # floor that keeps a ramp from waiting forever at t=0
+
+
+def rate_at(profile: str, rate: float, elapsed: float, duration: float) -> float:
+    """Target arrival rate (requests/s) of the profile `elapsed` seconds into a run of `duration` seconds."""
+    progress = min(max(elapsed / duration, 0.0), 1.0) if duration > 0 else 1.0
+    if profile == "ramp":
+        target = rate * progress
+    elif profile == "step":
+        target = rate * min(STEPS, math.floor(progress * STEPS) + 1) / STEPS
+    elif profile == "spike":
+        target = rate if SPIKE_WINDOW[0] <= progress < SPIKE_WINDOW[1] else rate * SPIKE_BASE_FRACTION
+    else:
+        target = rate
+    return max(target, rate * MIN_RATE_FRACTION)
+
+
+def schedule(profile: str, rate: float, duration: float, arrivals: str = "uniform", seed=None, phase: float = 0.0):
+    """Yields the intended send times (s from the start) of an open-loop run.
+
+    The times do not depend on how fast requests complete, so a slow server shows up as latency
+    measured from the intended time instead of as fewer requests (no coordinated omission).
+    Each sender process gets its own schedule with its share of the rate. Uniform schedules start
+    `phase` (a fraction of one interval) late: sender i of n passes phase=i/n, so the senders
+    interleave into one uniform stream instead of all firing at the same instants.
+    """
+    rng = random.Random(seed)
+    elapsed = phase / rate_at(profile, rate, 0.0, duration)
+    if arrivals == "poisson":
+        elapsed = rng.expovariate(rate_at(profile, rate, 0.0, duration))  # Random phase as well
+    while elapsed < duration:
+        yield elapsed
+        current_rate = rate_at(profile, rate, elapsed, duration)
+        elapsed += rng.expovariate(current_rate) if arrivals == "poisson" else 1.0 / current_rate
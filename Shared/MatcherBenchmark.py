@@ -0,0 +1,67 @@
+import argparse
+import random
+import timeit
+
+from InsultMatcher import InsultMatcher
+
+BASE_INSULTS = ["tonto", "lleig", "boig", "idiota", "estúpid", "inútil", "desastre", "fracassat", "covard", "mentider"]
+
+TEXTS_TO_FILTER = [
+    "Ets un tonto i un idiota",
+    "Quin desastre de persona, ets un inútil",
+    "No siguis covard i digues la veritat, mentider",
+    "Aquest projecte és un desastre total",
+    "M'agrada molt aquesta idea",
+    "Ets molt boig, però m'agrades",
+    "Ets un fracassat i un estúpid",
+    "Quina persona més lleig",
+    "No hi ha res a dir, ets un idiota",
+    "Aquest és un text normal sense insults",
+]
+
+
+def legacy_filter(text, insults):
+    """The per-word list scan every filter used before InsultMatcher (no punctuation handling)."""
+    censored_text = ""
+    for word in text.split():
+        if word.lower() in insults:
+            censored_text += "CENSORED "
+        else:
+            censored_text += word + " "
+    return censored_text.strip()
+
+
+def build_insults(size):
+    # Generated entries go first so the real insults sit at the end of the list, as they would
+    # once the dictionary has grown through add_insult calls
+    generated = [f"insult{i}" for i in range(max(0, size - len(BASE_INSULTS)))]
+    return (generated + BASE_INSULTS)[-size:]
+
+
+def time_per_text(func, texts):
+    number, elapsed = timeit.Timer(lambda: [func(text) for text in texts]).autorange()
+    return elapsed / (number * len(texts)) * 1e6    # µs per text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark: list-scan filter vs InsultMatcher")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[10, 1000, 100000],
+                        help="Insult dictionary sizes to benchmark (default: 10 1000 100000)")
+    parser.add_argument("-t", "--texts", type=int, default=100,
+                        help="Number of texts filtered per measurement (default: 100)")
+    args = parser.parse_args()
+
+    texts = [random.choice(TEXTS_TO_FILTER) for _ in range(args.texts)]
+
+    print(f"{'Insults':>10} | {'List scan (µs/text)':>20} | {'Matcher (µs/text)':>18} | {'Speedup':>8}")
+    print("-" * 66)
+    for size in args.sizes:
+        insults = build_insults(size)
+        matcher = InsultMatcher(insults)
+        legacy = time_per_text(lambda text: legacy_filter(text, insults), texts)
+        compiled = time_per_text(matcher.censor, texts)
+        print(f"{size:>10} | {legacy:>20.2f} | {compiled:>18.2f} | {legacy / compiled:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
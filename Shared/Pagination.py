@@ -0,0 +1,53 @@
+from collections import deque
+from itertools import islice
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+TAIL_SIZE = 5  # Items the status daemons print
+
+
+def clamp_limit(limit) -> int:
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def page(sequence, cursor=0, limit=DEFAULT_PAGE_SIZE) -> list:
+    """Returns [next_cursor, items] for up to `limit` items of a list (or deque) starting at offset `cursor`.
+
+    As with SSCAN, paging starts at cursor 0 and is over when the returned cursor is 0.
+    """
+    cursor, limit = max(0, int(cursor)), clamp_limit(limit)
+    if isinstance(sequence, deque):
+        items = list(islice(sequence, cursor, cursor + limit))
+    else:
+        items = list(sequence[cursor:cursor + limit])  # One call on a manager.list() proxy
+    return [cursor + len(items) if len(items) == limit else 0, items]
+
+
+def fan_out_page(fetch_pages, cursor=0, limit=DEFAULT_PAGE_SIZE) -> list:
+    """Pages through several backends one after the other.
+
+    fetch_pages are callables (cursor, limit) -> [next_cursor, items]; the combined cursor is
+    [backend index, backend cursor], and 0 once every backend has been read.
+    """
+    index, inner = cursor if cursor else (0, 0)
+    while index < len(fetch_pages):
+        inner, items = fetch_pages[index](inner, limit)
+        if not inner:
+            index += 1
+        if items:
+            return [[index, inner] if index < len(fetch_pages) else 0, items]
+    return [0, []]
+
+
+def iter_pages(fetch_page, limit=DEFAULT_PAGE_SIZE):
+    """Yields the pages of a paginated getter until its cursor comes back as 0.
+
+    Pyro services return this generator as is: Pyro streams it to the client one page per call.
+    """
+    cursor = 0
+    while True:
+        cursor, items = fetch_page(cursor, limit)
+        if items:
+            yield items
+        if not cursor:
+            return
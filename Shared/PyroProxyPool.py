@@ -0,0 +1,93 @@
+import queue
+import select
+import socket
+import sys
+from contextlib import contextmanager
+
+import Pyro4
+import Pyro4.errors
+
+
+class PyroProxyPool:
+    """Proxies to one Pyro backend, each with its own connection, lent to one thread at a time.
+
+    A Pyro4.Proxy serializes its calls with an internal lock, so threads sharing one proxy wait for each
+    other; borrowing a proxy per call lets up to `size` calls to the backend run in parallel. size defaults
+    to the Pyro daemon's thread pool (Pyro4.config.THREADPOOL_SIZE), the most calls the caller can be
+    serving at once. Like XmlRpcPool.ServerProxyPool, a thread that finds the pool empty gets a new proxy,
+    which is kept if there is room when it is returned. An idle proxy whose backend has closed the connection
+    (e.g. it was restarted) is dropped instead of being lent, so the call goes out on a new connection.
+    """
+    def __init__(self, uri, size=None, timeout=5, warm=0):
+        self.uri = uri
+        self.size = size or Pyro4.config.THREADPOOL_SIZE
+        self.timeout = timeout  # s per call
+        self.idle = queue.LifoQueue(maxsize=self.size)  # LIFO hands out the most recently used, still connected, proxy
+        self.warm_up(warm)
+
+    def create_proxy(self):
+        proxy = Pyro4.Proxy(self.uri)
+        proxy._pyroTimeout = self.timeout
+        return proxy
+
+    def warm_up(self, count):
+        """Connects up to `count` proxies ahead of the first calls."""
+        for _ in range(min(count, self.size - self.idle.qsize())):
+            proxy = self.create_proxy()
+            try:
+                proxy._pyroBind()
+            except Pyro4.errors.CommunicationError as e:
+                print(f"PyroProxyPool: Could not connect to {self.uri}: {e}", file=sys.stderr)
+                proxy._pyroRelease()
+                return
+            self.idle.put_nowait(proxy)
+
+    @staticmethod
+    def is_closed(proxy) -> bool:
+        """True if the backend closed the proxy's connection, checked without a round trip."""
+        connection = proxy._pyroConnection
+        if connection is None:
+            return False  # Connects on its first call
+        try:
+            readable, _, _ = select.select([connection.sock], [], [], 0)
+            # Nothing is sent to an idle connection, so readable means end of file (or an error)
+            return bool(readable) and not connection.sock.recv(1, socket.MSG_PEEK)
+        except (OSError, ValueError):
+            return True
+
+    def borrow(self):
+        while True:
+            try:
+                proxy = self.idle.get_nowait()
+            except queue.Empty:
+                return self.create_proxy()
+            if not self.is_closed(proxy):
+                return proxy
+            proxy._pyroRelease()
+
+    @contextmanager
+    def proxy(self):
+        """Lends a proxy; one that failed with a communication error is closed instead of being reused."""
+        proxy = self.borrow()
+        reusable = True
+        try:
+            yield proxy
+        except Pyro4.errors.CommunicationError:
+            reusable = False  # Broken or timed out connection: the next borrower gets a fresh proxy
+            raise
+        finally:
+            if reusable:
+                try:
+                    self.idle.put_nowait(proxy)
+                    proxy = None
+                except queue.Full:
+                    pass
+            if proxy is not None:
+                proxy._pyroRelease()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait()._pyroRelease()
+            except queue.Empty:
+                return
@@ -0,0 +1,154 @@
+import atexit
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+DEFAULT_SHARDS = 1  # 1 keeps the plain key; more spreads the INCRBYs over KEY:0..KEY:n-1
+MAX_SHARDS = 16  # read_counter sums every shard up to this, whatever the writers use
+DEFAULT_FLUSH_INTERVAL = 0.05  # s
+DEFAULT_BARRIER_TIMEOUT = 5.0  # s read_counter_exact waits for the counting processes to flush
+
+
+def shard_keys(key: str, shards: int = MAX_SHARDS) -> list:
+    return [f"{key}:{shard}" for shard in range(shards)]
+
+
+def flush_channel(key: str) -> str:
+    return f"{key}:flush"
+
+
+def read_counter(client, key: str) -> int:
+    """What Redis holds for the counter: the plain key plus every shard, read in one MGET.
+
+    Increments still buffered in a BufferedCounter are missing until its next flush; see read_counter_exact.
+    """
+    return sum(int(value) for value in client.mget([key] + shard_keys(key)) if value)
+
+
+def flush_counters(client, key: str, timeout: float = DEFAULT_BARRIER_TIMEOUT) -> bool:
+    """Makes every process counting key flush what it has buffered, and waits until they all have.
+
+    The request is published on key:flush, which every started BufferedCounter listens to; PUBLISH returns
+    how many of them received it, and each one pushes a reply once its INCRBY is done. Returns False if
+    some did not reply within timeout.
+    """
+    request = uuid.uuid4().hex
+    reply_key = f"{flush_channel(key)}:{request}"
+    expected = client.publish(flush_channel(key), request)
+    replies = 0
+    deadline = time.monotonic() + timeout
+    try:
+        while replies < expected:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or client.blpop([reply_key], timeout=remaining) is None:
+                return False
+            replies += 1
+        return True
+    finally:
+        client.delete(reply_key)
+
+
+def read_counter_exact(client, key: str, timeout: float = DEFAULT_BARRIER_TIMEOUT) -> int:
+    """Total of the counter including every increment made, in any process, before the call."""
+    if not flush_counters(client, key, timeout):
+        print(f"RedisCounter: Not every process flushed {key} within {timeout}s; the total may be short",
+              file=sys.stderr)
+    return read_counter(client, key)
+
+
+def reset_counter(client, key: str):
+    client.delete(key, *shard_keys(key))
+
+
+class BufferedCounter:
+    """Counts in-process and adds the total to Redis with one INCRBY every flush_interval.
+
+    A request then costs a lock instead of a round trip, and with shards > 1 the flushes of many
+    processes land on different keys. The flusher thread is started by the first incr() of each
+    process, so a counter created before a fork keeps working in the child. It also starts a listener
+    that flushes on demand for flush_counters().
+    """
+    start_lock = threading.Lock()  # Only one of the threads that race into the first incr() starts the flusher
+
+    def __init__(self, client, key: str, shards: int = DEFAULT_SHARDS, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        if not 1 <= shards <= MAX_SHARDS:
+            raise ValueError(f"shards must be between 1 and {MAX_SHARDS}")
+        self.client = client
+        self.key = key
+        self.keys = [key] if shards == 1 else shard_keys(key, shards)
+        self.flush_interval = flush_interval
+        self.pid = None
+        self.lock = None
+        self.pending = 0
+        self.stop_event = None
+        self.pubsub = None
+
+    def _start(self):
+        self.lock = threading.Lock()
+        self.pending = 0  # Counts inherited through fork belong to the parent
+        self.stop_event = threading.Event()
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(flush_channel(self.key))  # Before the first increment, so no barrier misses it
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+        threading.Thread(target=self._listen_loop, daemon=True).start()
+        atexit.register(self.close)
+        self.pid = os.getpid()  # Last: other threads skip _start() and use the lock as soon as it is set
+
+    def incr(self, amount: int = 1):
+        if self.pid != os.getpid():
+            with BufferedCounter.start_lock:
+                if self.pid != os.getpid():
+                    self._start()
+        with self.lock:
+            self.pending += amount
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def _listen_loop(self):
+        try:
+            for message in self.pubsub.listen():
+                self.flush()
+                request = message["data"]
+                if isinstance(request, bytes):
+                    request = request.decode()
+                reply_key = f"{flush_channel(self.key)}:{request}"
+                pipe = self.client.pipeline(transaction=False)
+                pipe.rpush(reply_key, os.getpid())
+                pipe.expire(reply_key, int(DEFAULT_BARRIER_TIMEOUT) + 1)  # The reader may have given up
+                pipe.execute()
+        except Exception as e:
+            if not self.stop_event.is_set():
+                print(f"BufferedCounter: Flush listener stopped: {e}", file=sys.stderr)
+
+    def flush(self):
+        if self.lock is None:
+            return
+        with self.lock:
+            delta, self.pending = self.pending, 0
+        if not delta:
+            return
+        try:
+            self.client.incrby(random.choice(self.keys), delta)
+        except Exception as e:
+            print(f"BufferedCounter: Error flushing {delta} to Redis: {e}")
+            with self.lock:
+                self.pending += delta  # Retried on the next flush
+
+    def close(self):
+        """Stops the flusher and writes what is still buffered."""
+        if self.stop_event is not None and self.pid == os.getpid():
+            self.stop_event.set()
+            self.flush()
+            self.pubsub.close()
+
+    @classmethod
+    def _reset_start_lock(cls):
+        cls.start_lock = threading.Lock()  # A thread of the parent may have held it when it forked
+
+
+os.register_at_fork(after_in_child=BufferedCounter._reset_start_lock)
@@ -0,0 +1,65 @@
+from InsultMatcher import CENSORED, PUNCTUATION
+from ResultsStore import DEFAULT_MAX_RESULTS
+
+# KEYS: insult set, results key, [counter key]. ARGV: "list" (RPUSH) or "set" (SADD) results, the most results
+# to keep (see ResultsStore.RedisResults), then the texts.
+# Words are normalized like InsultMatcher.normalize (punctuation stripped, lowercased) and looked up in the set,
+# which InsultSetCache.add_to_insult_set fills with normalized insults. string.lower only folds ASCII letters,
+# and multi-word insults are only matched by the client-side InsultMatcher.
+FILTER_SCRIPT = """
+local pattern = [[^[__PUNCTUATION__]*(.-)[__PUNCTUATION__]*$]]
+local insults, results = KEYS[1], KEYS[2]
+local is_insult = {}
+local censored = {}
+for i = 3, #ARGV do
+    local words = {}
+    for word in string.gmatch(ARGV[i], "%S+") do
+        local key = string.lower(string.match(word, pattern))
+        if is_insult[key] == nil then
+            is_insult[key] = key ~= "" and redis.call("SISMEMBER", insults, key) == 1
+        end
+        words[#words + 1] = is_insult[key] and "__CENSORED__" or word
+    end
+    censored[#censored + 1] = table.concat(words, " ")
+end
+if #censored > 0 then
+    local max_results = tonumber(ARGV[2])
+    if ARGV[1] == "set" then
+        redis.call("SADD", results, unpack(censored))
+        local excess = redis.call("SCARD", results) - max_results
+        if excess > 0 then
+            redis.call("SPOP", results, excess)
+        end
+    else
+        redis.call("RPUSH", results, unpack(censored))
+        redis.call("LTRIM", results, -max_results, -1)
+    end
+    if KEYS[3] then
+        redis.call("INCRBY", KEYS[3], #censored)
+    end
+end
+return censored
+"""
+
+
+class LuaInsultFilter:
+    """Censors texts inside Redis with a registered Lua script.
+
+    One EVALSHA tokenizes the texts, looks every word up with SISMEMBER, stores the results and bumps the
+    counter atomically, so filtering costs a single round trip and the insult set never leaves Redis.
+    """
+    def __init__(self, client, insult_set: str, results_key: str, counter_key: str = None, results_type: str = "list",
+                 max_results: int = DEFAULT_MAX_RESULTS):
+        self.keys = [insult_set, results_key] + ([counter_key] if counter_key else [])
+        self.results_type = results_type
+        self.max_results = max_results
+        source = (FILTER_SCRIPT.replace("__PUNCTUATION__", "".join("%" + char for char in PUNCTUATION))
+                  .replace("__CENSORED__", CENSORED))
+        self.script = client.register_script(source)  # Runs with EVALSHA, loading the script again on NOSCRIPT
+
+    def filter_texts(self, texts, pipe=None) -> list:
+        """Censors and stores the texts; returns the censored texts (or queues the call on `pipe`)."""
+        return self.script(keys=self.keys, args=[self.results_type, self.max_results, *texts], client=pipe)
+
+    def filter_text(self, text: str) -> str:
+        return self.filter_texts([text])[0]
@@ -0,0 +1,102 @@
+import os
+import socket
+import time
+
+import redis
+
+TEXT_FIELD = "text"
+
+
+def default_consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def add_to_stream(client, stream: str, texts) -> list:
+    """Appends texts to the work stream in one pipelined round trip; returns their entry ids."""
+    pipe = client.pipeline(transaction=False)
+    for text in texts:
+        pipe.xadd(stream, {TEXT_FIELD: text})
+    return pipe.execute()
+
+
+class StreamConsumer:
+    """Reads a Redis stream as one consumer of a consumer group.
+
+    Entries stay pending until ack() confirms them, so a filter that dies mid-batch loses nothing:
+    the entries are read again by the same consumer name on restart, or claimed by another consumer
+    once they have been idle for claim_idle_ms.
+    """
+    def __init__(self, client, stream: str, group: str, consumer: str = None, count: int = 100,
+                 block_ms: int = 1000, claim_idle_ms: int = 30000):
+        self.client = client
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or default_consumer_name()
+        self.count = count  # Max entries per XREADGROUP / XAUTOCLAIM
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_cursor = "0-0"
+        self.last_claim = 0.0
+        self.own_pending = True  # Starts by re-reading what this consumer name left unacknowledged
+        self.ensure_group()
+
+    def ensure_group(self):
+        try:
+            self.client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _claim_stale(self) -> list:
+        """Takes over entries other consumers read but did not acknowledge within claim_idle_ms."""
+        result = self.client.xautoclaim(self.stream, self.group, self.consumer, self.claim_idle_ms,
+                                        start_id=self.claim_cursor, count=self.count)
+        self.claim_cursor = result[0]
+        return [(entry_id, fields) for entry_id, fields in result[1] if fields]  # Deleted entries come back empty
+
+    def read(self) -> list:
+        """Returns up to `count` (entry_id, fields) pairs, blocking up to block_ms when the stream is empty."""
+        try:
+            return self._read()
+        except redis.exceptions.ResponseError as e:
+            if "NOGROUP" not in str(e):
+                raise
+            # The stream was deleted (e.g. another filter instance reset the keys on startup)
+            self.ensure_group()
+            self.claim_cursor = "0-0"
+            return []
+
+    def _read(self) -> list:
+        if self.own_pending:
+            entries = self.client.xreadgroup(self.group, self.consumer, {self.stream: "0"}, count=self.count)
+            pending = entries[0][1] if entries else []
+            if pending:
+                deleted = [entry_id for entry_id, fields in pending if not fields]
+                if deleted:
+                    self.client.xack(self.stream, self.group, *deleted)  # Nothing left to process
+                return [(entry_id, fields) for entry_id, fields in pending if fields]
+            self.own_pending = False
+
+        now = time.monotonic()
+        if now - self.last_claim >= self.claim_idle_ms / 2000:
+            self.last_claim = now
+            claimed = self._claim_stale()
+            if claimed:
+                return claimed
+
+        entries = self.client.xreadgroup(self.group, self.consumer, {self.stream: ">"},
+                                         count=self.count, block=self.block_ms)
+        return entries[0][1] if entries else []
+
+    def ack(self, entry_ids, pipe=None):
+        """Acknowledges and deletes processed entries, so the stream does not grow with finished work.
+
+        Pass the pipeline that stores the results to make both atomic (MULTI/EXEC).
+        """
+        if not entry_ids:
+            return
+        target = pipe if pipe is not None else self.client.pipeline(transaction=True)
+        target.xack(self.stream, self.group, *entry_ids)
+        target.xdel(self.stream, *entry_ids)
+        if pipe is None:
+            target.execute()
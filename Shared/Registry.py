@@ -0,0 +1,57 @@
+import sys
+import threading
+import time
+
+DEFAULT_TTL = 10  # s a registration outlives its last heartbeat
+SERVICE_KIND = "xmlrpc.service"
+FILTER_KIND = "xmlrpc.filter"
+
+
+def registry_key(kind: str) -> str:
+    return f"registry:{kind}"
+
+
+def discover(client, kind: str) -> list:
+    """URLs registered under kind whose heartbeat has not expired."""
+    key = registry_key(kind)
+    pipe = client.pipeline(transaction=False)
+    pipe.zremrangebyscore(key, "-inf", time.time())
+    pipe.zrange(key, 0, -1)
+    return pipe.execute()[1]
+
+
+class Registration:
+    """Announces a backend URL in Redis so that load balancers started with --discover pick it up.
+
+    The URL is a member of the sorted set registry:<kind> scored with its expiry time. A heartbeat thread
+    pushes the expiry forward every ttl/3 s, so a backend that dies without unregistering drops out of
+    discover() after at most ttl s.
+    """
+    def __init__(self, client, kind: str, url: str, ttl: float = DEFAULT_TTL):
+        self.client = client
+        self.key = registry_key(kind)
+        self.url = url
+        self.ttl = ttl
+        self.stop_event = threading.Event()
+
+    def heartbeat(self):
+        self.client.zadd(self.key, {self.url: time.time() + self.ttl})
+
+    def start(self):
+        self.heartbeat()
+        threading.Thread(target=self._run, daemon=True, name="registry-heartbeat").start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.wait(self.ttl / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Registry: Error renewing {self.url}: {e}", file=sys.stderr)
+
+    def stop(self):
+        self.stop_event.set()
+        try:
+            self.client.zrem(self.key, self.url)
+        except Exception as e:
+            print(f"Registry: Error unregistering {self.url}: {e}", file=sys.stderr)
@@ -0,0 +1,122 @@
+import threading
+from collections import deque
+from multiprocessing.managers import SyncManager
+
+from Pagination import DEFAULT_PAGE_SIZE, TAIL_SIZE, clamp_limit, page
+
+DEFAULT_MAX_RESULTS = 10000
+
+# Drops random members once the set holds more than ARGV[1]
+TRIM_SET_SCRIPT = """
+local excess = redis.call("SCARD", KEYS[1]) - tonumber(ARGV[1])
+if excess > 0 then
+    redis.call("SPOP", KEYS[1], excess)
+end
+return excess
+"""
+
+
+class BoundedResults:
+    """The newest max_items distinct censored texts.
+
+    A hash set of the stored texts makes the duplicate check O(1), and the oldest text (and its set
+    entry) is dropped once max_items is reached, so memory and the cost of add() stay constant however
+    long the service runs.
+    """
+    def __init__(self, max_items: int = DEFAULT_MAX_RESULTS):
+        self.max_items = max_items
+        self.ring = deque()
+        self.stored = set()
+        self.lock = threading.Lock()  # Shared by the Pyro / XML-RPC / manager threads
+
+    def add(self, text: str) -> bool:
+        """Stores the text unless it is already stored. Returns True if it was added."""
+        with self.lock:
+            if text in self.stored:
+                return False
+            if len(self.ring) >= self.max_items:
+                self.stored.discard(self.ring.popleft())
+            self.ring.append(text)
+            self.stored.add(text)
+            return True
+
+    def add_many(self, texts) -> int:
+        return sum(1 for text in texts if self.add(text))
+
+    def items(self) -> list:
+        with self.lock:
+            return list(self.ring)
+
+    def page(self, cursor=0, limit=DEFAULT_PAGE_SIZE) -> list:
+        """[next_cursor, items] from the oldest stored text (see Pagination.page)."""
+        with self.lock:
+            return page(self.ring, cursor, limit)
+
+    def tail(self, count=TAIL_SIZE) -> list:
+        with self.lock:
+            return list(self.ring)[-count:] if count > 0 else []
+
+    def __len__(self) -> int:
+        return len(self.ring)
+
+
+class ResultsManager(SyncManager):
+    """SyncManager that can also serve a BoundedResults to several processes.
+
+    The duplicate check then runs inside the manager with one call per add, instead of a `text in
+    manager.list()` that scans the whole list.
+    """
+
+
+ResultsManager.register("BoundedResults", BoundedResults, exposed=("add", "add_many", "items", "page", "tail", "__len__"))
+
+
+class RedisResults:
+    """A Redis results key capped at max_items.
+
+    Lists keep the newest max_items texts (RPUSH + LTRIM). Sets keep deduplicating with SADD and drop random
+    members beyond max_items with a small Lua script.
+    """
+    def __init__(self, client, key: str, kind: str = "list", max_items: int = DEFAULT_MAX_RESULTS):
+        self.client = client
+        self.key = key
+        self.kind = kind
+        self.max_items = max_items
+        self.trim_set = client.register_script(TRIM_SET_SCRIPT) if kind == "set" else None
+
+    def add_many(self, texts, pipe=None):
+        """Stores the texts, queuing the commands on `pipe` (e.g. a MULTI/EXEC) if one is given."""
+        if not texts:
+            return
+        target = pipe if pipe is not None else self.client.pipeline(transaction=False)
+        if self.kind == "set":
+            target.sadd(self.key, *texts)
+            self.trim_set(keys=[self.key], args=[self.max_items], client=target)
+        else:
+            target.rpush(self.key, *texts)
+            target.ltrim(self.key, -self.max_items, -1)
+        if pipe is None:
+            target.execute()
+
+    def add(self, text: str, pipe=None):
+        self.add_many([text], pipe)
+
+    def count(self) -> int:
+        return self.client.scard(self.key) if self.kind == "set" else self.client.llen(self.key)
+
+    def page(self, cursor=0, limit=DEFAULT_PAGE_SIZE) -> list:
+        """[next_cursor, items]: an LRANGE window of a list, or one SSCAN step of a set (cursor 0 ends)."""
+        cursor, limit = int(cursor), clamp_limit(limit)
+        if self.kind == "set":
+            cursor, items = self.client.sscan(self.key, cursor, count=limit)
+            return [cursor, items]
+        items = self.client.lrange(self.key, cursor, cursor + limit - 1)
+        return [cursor + len(items) if len(items) == limit else 0, items]
+
+    def tail(self, count=TAIL_SIZE) -> list:
+        """The newest texts of a list, or a random sample of a set."""
+        if count <= 0:
+            return []
+        if self.kind == "set":
+            return self.client.srandmember(self.key, count)
+        return self.client.lrange(self.key, -count, -1)
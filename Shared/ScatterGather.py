@@ -0,0 +1,41 @@
+import concurrent.futures
+
+DEFAULT_TIMEOUT = 5.0  # s the slowest backend may take before the gather returns without it
+DEFAULT_MAX_ITEMS = 100000  # Items merged by gather_lists; larger results have to be paged
+DEFAULT_WORKERS = 32
+
+
+def scatter(executor, targets, call, timeout=DEFAULT_TIMEOUT):
+    """Runs call(target) for every target at once and yields (target, result, error) as each one completes.
+
+    Targets still running after `timeout` s are yielded last with a TimeoutError, so the whole gather takes
+    as long as its slowest backend, capped at timeout, instead of the sum of them. Their calls are left to
+    finish (or time out) in the executor.
+    """
+    futures = {executor.submit(call, target): target for target in targets}
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=timeout):
+            target = futures.pop(future)
+            error = future.exception()
+            yield target, None if error is not None else future.result(), error
+    except concurrent.futures.TimeoutError:
+        for future, target in futures.items():
+            future.cancel()
+            yield target, None, TimeoutError(f"no answer within {timeout}s")
+
+
+def gather_lists(executor, targets, call, timeout=DEFAULT_TIMEOUT, max_items=DEFAULT_MAX_ITEMS, label=str):
+    """Concatenates the lists returned by call(target), in completion order.
+
+    Returns (items, failures), failures being one "label: error" per target that failed or timed out; the
+    items are then a partial result. Merging stops at max_items without waiting for the remaining targets.
+    """
+    items, failures = [], []
+    for target, result, error in scatter(executor, targets, call, timeout):
+        if error is not None:
+            failures.append(f"{label(target)}: {error}")
+            continue
+        items.extend(result[:max_items - len(items)])
+        if len(items) >= max_items:
+            break
+    return items, failures
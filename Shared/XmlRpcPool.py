@@ -0,0 +1,61 @@
+import queue
+import xmlrpc.client
+from contextlib import contextmanager
+
+
+class TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout  # Applied when the socket is (re)opened
+        return connection
+
+
+class ServerProxyPool:
+    def __init__(self, url, size=8, timeout=None, **proxy_kwargs):
+        self.url = url
+        self.timeout = timeout  # s per call; None waits forever
+        self.proxy_kwargs = proxy_kwargs
+        self.idle = queue.LifoQueue(maxsize=size)  # LIFO hands out the most recently used, still open, connection
+
+    def create_proxy(self):
+        if self.timeout is not None:
+            # Every proxy needs its own transport: the transport holds the connection
+            return xmlrpc.client.ServerProxy(self.url, allow_none=True, transport=TimeoutTransport(self.timeout),
+                                             **self.proxy_kwargs)
+        return xmlrpc.client.ServerProxy(self.url, allow_none=True, **self.proxy_kwargs)
+
+    @contextmanager
+    def proxy(self):
+        """Lends a ServerProxy with its own keep-alive connection to the backend; never shared between threads."""
+        try:
+            proxy = self.idle.get_nowait()
+        except queue.Empty:
+            proxy = self.create_proxy()
+        reusable = True
+        try:
+            yield proxy
+        except xmlrpc.client.Fault:
+            raise  # Raised by the backend method itself: the connection is still fine
+        except Exception:
+            reusable = False
+            raise
+        finally:
+            if reusable:
+                try:
+                    self.idle.put_nowait(proxy)
+                    proxy = None
+                except queue.Full:
+                    pass
+            if proxy is not None:
+                proxy("close")()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait()("close")()
+            except queue.Empty:
+                return
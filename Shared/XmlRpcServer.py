@@ -0,0 +1,132 @@
+import multiprocessing
+import select
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+    # Persistent HTTP/1.1 connections, so a ServerProxy reuses its TCP connection across calls
+    protocol_version = "HTTP/1.1"
+    timeout = 10            # s a connection may stay idle before the server closes it
+    max_requests = 1000     # calls served on one connection before asking the client to reconnect
+    idle_poll = 0.05        # s between checks for waiting connections while this one is idle
+
+    def setup(self):
+        super().setup()
+        self.requests_served = 0
+        if getattr(self.server, "executor", None) is None:
+            # A single-threaded server would be blocked by whichever client holds the connection open
+            self.protocol_version = "HTTP/1.0"
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.wait_for_request():
+            self.handle_one_request()
+
+    def wait_for_request(self):
+        """Waits for the next request on this connection; False if the connection should be closed instead.
+
+        Every open connection holds a pool thread, so an idle one gives its thread up as soon as a
+        connection is waiting for it, instead of after the whole idle timeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.server.oversubscribed():
+                return False
+            readable, _, _ = select.select([self.connection], [], [], self.idle_poll)
+            if readable:
+                return True
+        return False
+
+    def handle_one_request(self):
+        self.requests_served += 1
+        super().handle_one_request()
+
+    def end_headers(self):
+        if self.protocol_version == "HTTP/1.1" and (self.requests_served >= self.max_requests
+                                                    or self.server.oversubscribed()):
+            self.send_header("Connection", "close")  # Also sets close_connection
+        super().end_headers()
+
+
+class XMLRPCServer(SimpleXMLRPCServer):
+    def __init__(self, addr, threads=1, reuse_port=False, **kwargs):
+        self.reuse_port = reuse_port  # Must be set before the base constructor binds the socket
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        self.connections = 0  # Accepted and not closed yet, including those queued for a thread
+        self.connections_lock = threading.Lock()
+        super().__init__(addr, **kwargs)
+
+    def oversubscribed(self) -> bool:
+        # More open connections than threads: some connection is waiting for a keep-alive one to close
+        return self.connections > self.threads
+
+    def server_bind(self):
+        if self.reuse_port:
+            # Lets several pre-forked processes bind the same port; the kernel balances connections among them
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        if self.executor is None:
+            super().process_request(request, client_address)
+        else:
+            with self.connections_lock:
+                self.connections += 1
+            self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        """Same as the synchronous path of BaseServer, run by a pool thread."""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.connections_lock:
+                self.connections -= 1
+
+    def server_close(self):
+        super().server_close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _serve_forever(build_server):
+    try:
+        with build_server() as server:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def serve(build_server, workers=1):
+    """Runs build_server() in this process, or in `workers` pre-forked processes sharing its port.
+
+    With workers > 1 the server must be created with reuse_port=True, and any state shared by the
+    processes must live outside them (multiprocessing.Manager, Value or Redis).
+    """
+    if workers <= 1:
+        with build_server() as server:
+            server.serve_forever()
+        return
+
+    # build_server is usually a closure, so the children are forked rather than spawned
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_serve_forever, args=(build_server,)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        raise
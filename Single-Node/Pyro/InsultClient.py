@@ -37,10 +37,15 @@ class InsultClient:
                 pass
 
     def send_insults(self):
+        # Batch proxies send all the (oneway) add_insult calls to each server in a single message
+        service_batch = Pyro4.batch(self.insult_service)
+        filter_batch = Pyro4.batch(self.insult_filter)
         for insult in self.insults:
-            self.insult_service.add_insult(insult)
-            self.insult_filter.add_insult(insult)
+            service_batch.add_insult(insult)
+            filter_batch.add_insult(insult)
             print("Insult sent to server:", insult)
+        service_batch(oneway=True)
+        filter_batch(oneway=True)
 
     def broadcast(self):
         while True:
@@ -73,12 +78,14 @@ def main():
             t = input()
             if t == "I":
                 try:
-                    print("Insult list:", client.insult_service.get_insults())
+                    cursor, insults = client.insult_service.get_insults_page(0)
+                    print(f"Insult list (first {len(insults)}{', more available' if cursor else ''}):", insults)
                 except Pyro4.errors.CommunicationError as e:
                     print(f"Communication error: {e}.")
             elif t == "T":
                 try:
-                    print("Censored texts:", client.insult_filter.get_censored_texts())
+                    cursor, censored_texts = client.insult_filter.get_censored_texts_page(0)
+                    print(f"Censored texts (first {len(censored_texts)}{', more available' if cursor else ''}):", censored_texts)
                 except Pyro4.errors.CommunicationError as e:
                     print(f"Communication error: {e}.")
             elif t == "K":
@@ -1,45 +1,68 @@
+import os
+import sys
 import threading
 import Pyro4
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from CallAcks import CallAcks
+from InsultMatcher import InsultMatcher
+from Pagination import DEFAULT_PAGE_SIZE, iter_pages
+from ResultsStore import BoundedResults
+
 @Pyro4.expose
 @Pyro4.behavior(instance_mode="single")
 class InsultFilter:
     def __init__(self):
-        self.censored_Texts = []
+        self.censored_Texts = BoundedResults()  # Newest distinct censored texts
         self.insults_List = []
+        self.matcher = InsultMatcher()  # Compiled index of insults_List used by filter_text
         self.processed_requests_count = 0
         self._lock = threading.Lock() # Lock to securely access the counter
+        self.acks = CallAcks()  # Oneway calls processed per client
 
-    def add_insult(self, insult):
+    @Pyro4.oneway
+    def add_insult(self, insult, client_id=None):
         with self._lock:
             self.processed_requests_count += 1
-        if insult not in self.insults_List:
+        if self.matcher.add(insult):
             self.insults_List.append(insult)
             # print(f"Insult added: {insult}")
         # else:
             # print(f"Insult already exists: {insult}")
+        self.acks.ack(client_id)
+
+    def get_acked(self, client_id):
+        # Regular call: answered after the client's earlier oneway calls on this connection (see CallAcks)
+        return self.acks.take(client_id)
 
     def filter_text(self, text):
-        censored_text = ""
-        # we use a copy of the insults list to avoid any modifications it while iterating
-        current_insults = list(self.insults_List) # Use the insult list available to this service
-        for word in text.split():
-            if word.lower() in current_insults:
-                censored_text += "CENSORED "
-            else:
-                censored_text += word + " "
-        return censored_text
+        return self.matcher.censor(text)
 
     def filter_service(self, text):
         with self._lock:
             self.processed_requests_count += 1
         censored_text = self.filter_text(text)
-        self.censored_Texts.append(censored_text)
-        return censored_text.strip() # We add strip() to remove trailing spaces
+        self.censored_Texts.add(censored_text)
+        return censored_text
+
+    def filter_many(self, texts):
+        # Batch version of filter_service: one call, results returned in the same order as texts
+        with self._lock:
+            self.processed_requests_count += len(texts)
+        censored_texts = [self.filter_text(text) for text in texts]
+        self.censored_Texts.add_many(censored_texts)
+        return censored_texts
 
     def get_censored_texts(self):
-        return self.censored_Texts
+        return self.censored_Texts.items()
+
+    def get_censored_texts_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, censored texts]; next_cursor is 0 once every stored text has been returned
+        return self.censored_Texts.page(cursor, limit)
+
+    def iter_censored_texts(self, limit=DEFAULT_PAGE_SIZE):
+        return iter_pages(self.get_censored_texts_page, limit)
 
     def get_processed_count(self):
         with self._lock:
@@ -47,6 +70,7 @@ class InsultFilter:
 
 def main():
     print("Starting Pyro Insult Filter...")
+    Pyro4.config.ONEWAY_THREADED = False  # Oneway calls run in order on their connection (see CallAcks)
     try:
         daemon = Pyro4.Daemon()  # Create the Pyro daemon
         ns = Pyro4.locateNS()  # Locate the name server
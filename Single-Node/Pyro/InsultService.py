@@ -1,18 +1,27 @@
+import os
 import random
+import sys
 import threading
 import Pyro4
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from CallAcks import CallAcks
+from FanOut import Broadcaster, pyro_sender
+from Pagination import DEFAULT_PAGE_SIZE, iter_pages, page
+
 @Pyro4.expose
 @Pyro4.behavior(instance_mode="single")
 class InsultService:
     def __init__(self):
         self.insults_List = []
-        self.subscribers = []
+        self.fanout = Broadcaster(pyro_sender)  # Subscribers, each with its own proxy and send queue
         self.processed_requests_count = 0
         self._lock = threading.Lock() # Lock to securely access the counter
+        self.acks = CallAcks()  # Oneway calls processed per client
 
-    def add_insult(self, insult):
+    @Pyro4.oneway
+    def add_insult(self, insult, client_id=None):
         with self._lock:
             self.processed_requests_count += 1
         if insult not in self.insults_List:
@@ -20,11 +29,24 @@ class InsultService:
             # print(f"Insult added: {insult}")
         # else:
             # print(f"Insult already exists: {insult}")
+        self.acks.ack(client_id)
+
+    def get_acked(self, client_id):
+        # Regular call: answered after the client's earlier oneway calls on this connection (see CallAcks)
+        return self.acks.take(client_id)
 
     def get_insults(self):
-        print(f"Insult list: {self.insults_List}")
+        print(f"Insult list requested: {len(self.insults_List)} insults")
         return self.insults_List
 
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, insults]; next_cursor is 0 once every insult has been returned
+        return page(self.insults_List, cursor, limit)
+
+    def iter_insults(self, limit=DEFAULT_PAGE_SIZE):
+        # Streamed by Pyro one page per next() call
+        return iter_pages(self.get_insults_page, limit)
+
     def insult_me(self):
         if not self.insults_List:
             return "No insults available"
@@ -34,19 +56,22 @@ class InsultService:
 
     def subscribe(self, url):
         try:
-            client_proxy = Pyro4.Proxy(url)
-            self.subscribers.append(client_proxy)
-            print("New subscriber added.")
+            if self.fanout.subscribe(str(url)):  # Keeps one proxy per subscriber
+                print("New subscriber added.")
         except Exception as e:
              print(f"Error afegint subscriptor {url}: {e}")
 
+    @Pyro4.oneway
     def notify_subscribers(self, insult):
-        for subscriber in self.subscribers:
-            try:
-                print(f"Notifying subscriber: {subscriber} with:" + insult) # Comentem
-                subscriber.receive_insult(insult)
-            except Pyro4.errors.CommunicationError:
-                print("Failed to contact a subscriber.")
+        # Queued for every subscriber; the deliveries run on the fan-out pool
+        self.fanout.publish(insult)
+
+    @Pyro4.oneway
+    def notify_many(self, insults):
+        self.fanout.publish_many(insults)
+
+    def get_fanout_stats(self):
+        return self.fanout.stats()
 
     def get_processed_count(self):
         with self._lock:
@@ -55,6 +80,7 @@ class InsultService:
 
 def main():
     print("Starting Pyro Insult Service...")
+    Pyro4.config.ONEWAY_THREADED = False  # Oneway calls run in order on their connection (see CallAcks)
     try:
         daemon = Pyro4.Daemon()  # Create the Pyro daemon
         ns = Pyro4.locateNS()  # Locate the name server
@@ -5,6 +5,11 @@ class InsultSubscriber:
     def receive_insult(self, insult):
         print(f"Received broadcast insult: {insult}")
 
+    def receive_insults(self, insults):
+        # Insults that queued up for this subscriber at the service, delivered in one call
+        for insult in insults:
+            self.receive_insult(insult)
+
 def main():
     insult_service = Pyro4.Proxy("PYRONAME:pyro.service")  # Connect to the insult service
     subscriber = InsultSubscriber()
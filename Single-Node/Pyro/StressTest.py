@@ -4,8 +4,12 @@ import multiprocessing
 from multiprocessing import Process, Queue
 import random
 import argparse
+import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from CallAcks import new_client_id
+
 DEFAULT_PYRO_SERVICE = "pyro.service"
 DEFAULT_PYRO_FILTER = "pyro.filter"
 DEFAULT_DURATION = 10  # Seconds
@@ -23,10 +27,11 @@ TEXTS_TO_FILTER = [
 ]
 
 # --- Worker Functions (performed in different processes) ---
-def worker_add_insult(pyro_name, results_queue, end_time):
+def worker_add_insult(pyro_name, results_queue, end_time, batch_size=1):
     local_request_count = 0
     local_error_count = 0
     server_proxy = None
+    client_id = new_client_id()
     try:
         # We create a proxy for each process
         server_proxy = Pyro4.Proxy(f"PYRONAME:{pyro_name}")
@@ -34,21 +39,34 @@ def worker_add_insult(pyro_name, results_queue, end_time):
     except Exception as e:
         print(f"[Process {multiprocessing.current_process().pid}] Error connecting to the server: {e}", file=sys.stderr)
         local_error_count += 1
-        results_queue.put((local_request_count, local_error_count))
+        results_queue.put((local_request_count, local_error_count, 0))
         return
 
     while time.time() < end_time:
         try:
-            insult = random.choice(INSULTS_TO_ADD) + str(random.randint(1, 10000))
-            server_proxy.add_insult(insult)
-            local_request_count += 1
+            # add_insult is oneway: the call returns once it is sent, without waiting for the server
+            if batch_size > 1:
+                batch = Pyro4.batch(server_proxy)  # batch_size calls in a single message
+                for _ in range(batch_size):
+                    batch.add_insult(random.choice(INSULTS_TO_ADD) + str(random.randint(1, 10000)), client_id)
+                batch(oneway=True)
+                local_request_count += batch_size
+            else:
+                insult = random.choice(INSULTS_TO_ADD) + str(random.randint(1, 10000))
+                server_proxy.add_insult(insult, client_id)
+                local_request_count += 1
         except Exception:
             local_error_count += 1
 
+    acknowledged = 0
+    try:
+        acknowledged = server_proxy.get_acked(client_id)  # Waits for the oneway calls still being processed
+    except Exception as e:
+        print(f"[Process {multiprocessing.current_process().pid}] Error reading the acknowledged calls: {e}", file=sys.stderr)
     # Send local results to the main process
-    results_queue.put((local_request_count, local_error_count))
+    results_queue.put((local_request_count, local_error_count, acknowledged))
 
-def worker_filter_text(pyro_name, results_queue, end_time):
+def worker_filter_text(pyro_name, results_queue, end_time, batch_size=1):
     local_request_count = 0
     local_error_count = 0
     server_proxy = None
@@ -58,21 +76,26 @@ def worker_filter_text(pyro_name, results_queue, end_time):
     except Exception as e:
         print(f"[Process {multiprocessing.current_process().pid}] Error connecting to the server: {e}", file=sys.stderr)
         local_error_count += 1
-        results_queue.put((local_request_count, local_error_count))
+        results_queue.put((local_request_count, local_error_count, 0))
         return
 
     while time.time() < end_time:
         try:
-            text = random.choice(TEXTS_TO_FILTER)
-            server_proxy.filter_service(text)
-            local_request_count += 1
+            if batch_size > 1:
+                # One call censors a whole batch, amortising the per-call overhead
+                server_proxy.filter_many(random.choices(TEXTS_TO_FILTER, k=batch_size))
+                local_request_count += batch_size
+            else:
+                text = random.choice(TEXTS_TO_FILTER)
+                server_proxy.filter_service(text)
+                local_request_count += 1
         except Exception:
             local_error_count += 1
 
-    results_queue.put((local_request_count, local_error_count))
+    results_queue.put((local_request_count, local_error_count, local_request_count))  # Regular calls: all answered
 
 # --- Main function ---
-def run_stress_test(mode, duration, concurrency):
+def run_stress_test(mode, duration, concurrency, batch_size=1):
     pyro_name = ""
     if mode == "filter_text": pyro_name = DEFAULT_PYRO_FILTER
     if mode == "add_insult": pyro_name = DEFAULT_PYRO_SERVICE
@@ -80,6 +103,10 @@ def run_stress_test(mode, duration, concurrency):
     print(f"Pyro name: {pyro_name}")
     print(f"Duration: {duration} seconds")
     print(f"Concurrency: {concurrency} processes")
+    if mode == "filter_text":
+        print(f"Batch size: {batch_size} texts per call")
+    elif batch_size > 1:
+        print(f"Batch size: {batch_size} oneway calls per batch proxy message")
     print("-" * 30)
 
     if mode == 'add_insult':
@@ -94,10 +121,11 @@ def run_stress_test(mode, duration, concurrency):
     processes = []
     start_time = time.time()
     end_time = start_time + duration
+    worker_args = (pyro_name, results_queue, end_time, batch_size)
 
     # Create and start the processes
     for _ in range(concurrency):
-        process = Process(target=worker_function, args=(pyro_name, results_queue, end_time))
+        process = Process(target=worker_function, args=worker_args)
         processes.append(process)
         process.start()
 
@@ -107,10 +135,12 @@ def run_stress_test(mode, duration, concurrency):
 
     total_client_requests_sent = 0
     total_client_errors = 0
+    total_acknowledged = 0
     while not results_queue.empty():
-        req, err = results_queue.get()
+        req, err, acked = results_queue.get()
         total_client_requests_sent += req
         total_client_errors += err
+        total_acknowledged += acked
 
     actual_duration = time.time() - start_time
 
@@ -119,6 +149,7 @@ def run_stress_test(mode, duration, concurrency):
     print(f"Total duration: {actual_duration:.2f} seconds")
     print(f"Intended petitions by the client: {total_client_requests_sent}")
     print(f"Total client errors: {total_client_errors}")
+    print(f"Petitions acknowledged by the server: {total_acknowledged}")
 
     server_processed_count = -1
     try:
@@ -153,7 +184,10 @@ if __name__ == "__main__":
                         help=f"Duration in seconds (default: {DEFAULT_DURATION})")
     parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
                         help=f"Number of concurrent processes (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("-b", "--batch-size", type=int, default=1,
+                        help="Above 1, filter_text sends this many texts per filter_many call and add_insult this many "
+                             "oneway calls per batch proxy message (default: 1)")
 
     args = parser.parse_args()
     # It may be necessary to start the name server manually first: python3 -m Pyro4.naming
-    run_stress_test(args.mode, args.duration, args.concurrency)
\ No newline at end of file
+    run_stress_test(args.mode, args.duration, args.concurrency, args.batch_size)
\ No newline at end of file
@@ -68,12 +68,14 @@ if __name__ == "__main__":
             t = input()
             if t == "I":
                 try:
-                    print("Insult list:", client.insult_service.get_insults())
+                    cursor, insults = client.insult_service.get_insults_page(0)
+                    print(f"Insult list (first {len(insults)}{', more available' if cursor else ''}):", insults)
                 except Pyro4.errors.CommunicationError as e:
                     print(f"Communication error: {e}.")
             elif t == "T":
                 try:
-                    print("Censored texts:", client.insult_filter.get_results())
+                    cursor, censored_texts = client.insult_filter.get_results_page(0)
+                    print(f"Censored texts (first {len(censored_texts)}{', more available' if cursor else ''}):", censored_texts)
                 except Pyro4.errors.CommunicationError as e:
                     print(f"Communication error: {e}.")
             elif t == "K":
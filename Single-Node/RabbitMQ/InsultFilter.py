@@ -1,7 +1,14 @@
 import Pyro4
 import pika
-from multiprocessing import Manager, Value, Process
+from multiprocessing import Value, Process
 from Pyro4 import errors
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from InsultMatcher import InsultMatcher
+from Pagination import DEFAULT_PAGE_SIZE
+from ResultsStore import ResultsManager
 
 processed_requests_counter = Value('i', 0)
 
@@ -11,7 +18,8 @@ class InsultFilter:
     def __init__(self, req_counter, shared_insult_list, shared_censored_texts):
         self.channel_insults = "Insults_channel"
         self.insults_list = shared_insult_list  # list of insults
-        self.censored_texts = shared_censored_texts # list for censored texts
+        self.matcher = InsultMatcher()  # Per-process compiled copy of insults_list (see filter)
+        self.censored_texts = shared_censored_texts # newest distinct censored texts (BoundedResults)
         self.text_queue = "text_queue"
         self.insults_exchange = "insults_exchange"
         self.counter = req_counter  # Shared counter for processed requests
@@ -24,14 +32,9 @@ class InsultFilter:
             # print(f"Insult added: {insult}")
 
     def filter(self, text):
-        censored_text = ""
-        current_insults = list(self.insults_list)
-        for word in text.split():
-            if word.lower() in current_insults:
-                censored_text += "CENSORED "
-            else:
-                censored_text += word + " "
-        return censored_text.strip()
+        # insults_list is append-only, so only the new tail has to be fetched from the manager
+        self.matcher.sync(self.insults_list)
+        return self.matcher.censor(text)
 
     def filter_service(self):
         connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
@@ -43,8 +46,7 @@ class InsultFilter:
             filtered_text = self.filter(text)
             with self.counter.get_lock():
                 self.counter.value += 1
-            if filtered_text not in self.censored_texts:
-                self.censored_texts.append(filtered_text)
+            self.censored_texts.add(filtered_text)
             # print(f"Censored text: {filtered_text}")
 
         channel.basic_consume(queue=self.text_queue, on_message_callback=callback, auto_ack=True)
@@ -76,7 +78,11 @@ class InsultFilter:
         channel.start_consuming()
 
     def get_results(self):
-        return f"Censored texts: {list(self.censored_texts)}"
+        return f"Censored texts: {self.censored_texts.items()}"
+
+    def get_results_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, censored texts]; next_cursor is 0 once every stored text has been returned
+        return self.censored_texts.page(cursor, limit)
 
     def get_processed_count(self):
         with self.counter.get_lock():
@@ -84,11 +90,12 @@ class InsultFilter:
 
 # Example of how to run the InsultFilterService
 if __name__ == "__main__":
-    manager = Manager()
+    manager = ResultsManager()
+    manager.start()
     # Create a shared list for insults
     shared_insults = manager.list()
-    # Create a shared list for censored texts
-    shared_texts = manager.list()
+    # Create a shared, bounded store for censored texts
+    shared_texts = manager.BoundedResults()
     # Create the service instance with the shared resources
     filter_service_instance = InsultFilter(processed_requests_counter, shared_insults, shared_texts)
 
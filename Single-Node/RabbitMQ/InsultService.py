@@ -1,3 +1,5 @@
+import os
+import sys
 import pika
 import time
 import random
@@ -5,6 +7,9 @@ from multiprocessing import Process, Manager, Value
 import Pyro4
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from Pagination import DEFAULT_PAGE_SIZE, page
+
 # Global counter for processed requests
 processed_requests_counter = Value('i', 0)
 
@@ -27,6 +32,10 @@ class Insults:
     def get_insults(self):
         return f"Insult list: {list(self.insults_list)}"
 
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, insults], sliced inside the manager; next_cursor is 0 once every insult has been returned
+        return page(self.insults_list, cursor, limit)
+
     def insult_me(self):
         if self.insults_list:
             insult = random.choice(self.insults_list)
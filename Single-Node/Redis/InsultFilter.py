@@ -2,40 +2,62 @@ import redis
 import Pyro4
 from multiprocessing import Value, Process
 import time
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from InsultSetCache import InsultSetCache, add_to_insult_set, bump_version
+from RedisStreamQueue import StreamConsumer, TEXT_FIELD
+from RedisLuaFilter import LuaInsultFilter
+from Pagination import DEFAULT_PAGE_SIZE, TAIL_SIZE
+from ResultsStore import RedisResults
 
 client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
 
 @Pyro4.behavior(instance_mode="single")
 class InsultFilter:
-    def __init__(self, filter_counter):
+    def __init__(self, filter_counter, filter_mode="client"):
         self.insultSet = "INSULTS"
         self.censoredTextsList = "RESULTS"
+        self.results = RedisResults(client, self.censoredTextsList)  # Keeps the newest results (LTRIM)
         self.workQueue = "Work_queue"
+        self.workStream = "Work_stream"
+        self.consumerGroup = "filters"
         self.counter = filter_counter # Counter for the number of times filtered text
+        self.insult_cache = None # Local versioned snapshot of INSULTS (see get_insult_matcher)
+        # Server mode censors and stores the texts inside Redis with one EVALSHA per call
+        self.lua_filter = LuaInsultFilter(client, self.insultSet, self.censoredTextsList) if filter_mode == "server" else None
 
     def add_insult(self, insult):
         with self.counter.get_lock():
              self.counter.value += 1
-        client.sadd(self.insultSet, insult)
+        add_to_insult_set(client, self.insultSet, insult)
         # print(f"InsultFilter: Insult added (internal): {insult} (Counter: {self.counter.value})")
         return f"Insult added (internal): {insult}"
 
     def filter_text(self, text):
         # print(f"InsultFilter: Received text to filter: {text}")
-        censored_text = ""
-        if text is not None:
-            insults = client.smembers(self.insultSet)
-            for word in text.split():
-                if word.lower() in insults:
-                    censored_text += "CENSORED "
-                else:
-                    censored_text += word + " "
-        return censored_text.strip() # Remove trailing space
+        if text is None:
+            return ""
+        return self.get_insult_matcher().censor(text)
+
+    def get_insult_matcher(self):
+        # The cache subscribes to Redis from a background thread, so it is created lazily
+        # inside the filter_service process instead of being inherited through fork
+        if self.insult_cache is None:
+            self.insult_cache = InsultSetCache(client, self.insultSet)
+        return self.insult_cache.get_matcher()
 
     def get_censored_texts(self):
         results = client.lrange(self.censoredTextsList, 0, -1)
         return f"Censored texts:{results}"
 
+    @Pyro4.expose
+    def get_censored_texts_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, censored texts] read with LRANGE; next_cursor is 0 once the list has been read
+        return self.results.page(cursor, limit)
+
     def filter_service(self):
         print("InsultFilter Service: Starting filter_service...")
         try:
@@ -46,19 +68,46 @@ class InsultFilter:
                     # print(f"InsultFilter Worker: Processing text from {queue_name}: Text: {text}")
                     with self.counter.get_lock():
                         self.counter.value += 1
+                    if self.lua_filter:
+                        self.lua_filter.filter_text(text)
+                        continue
                     filtered_text = self.filter_text(text)
                     # print(f"InsultFilter Worker: Filtered text: {filtered_text} (Counter: {self.counter.value})")
-                    client.rpush(self.censoredTextsList, filtered_text)
+                    self.results.add(filtered_text)
         except KeyboardInterrupt:
             print("\nInsultFilter Service: Stopping filter_service...")
             exit(1)
 
+    def filter_stream_service(self, batch_size):
+        # Entries stay pending in the group until the EXEC that stores their results, so a batch
+        # interrupted by a crash is read again when the filter restarts under the same consumer name
+        print("InsultFilter Service: Starting filter_stream_service...")
+        consumer = StreamConsumer(client, self.workStream, self.consumerGroup, "filter", count=batch_size)
+        try:
+            while True:
+                entries = consumer.read()
+                if not entries:
+                    continue
+                pipe = client.pipeline(transaction=True)
+                if self.lua_filter:
+                    self.lua_filter.filter_texts([fields.get(TEXT_FIELD, "") for _, fields in entries], pipe)
+                else:
+                    filtered_texts = [self.filter_text(fields.get(TEXT_FIELD)) for _, fields in entries]
+                    self.results.add_many(filtered_texts, pipe)
+                consumer.ack([entry_id for entry_id, _ in entries], pipe)
+                pipe.execute()
+                with self.counter.get_lock():
+                    self.counter.value += len(entries)
+        except KeyboardInterrupt:
+            print("\nInsultFilter Service: Stopping filter_stream_service...")
+            exit(1)
+
     def get_status_daemon(self):
         print("InsultFilter Worker: Starting get_status_daemon...")
         try:
             while True:
                 print("\n--- InsultFilter Status ---")
-                print(self.get_censored_texts())
+                print(f"Censored texts stored: {self.results.count()}, newest: {self.results.tail(TAIL_SIZE)}")
                 print(f"InsultFilter processed count: {self.get_processed_count()}")
                 print("------------------------------\n")
                 time.sleep(10)
@@ -73,10 +122,17 @@ class InsultFilter:
 
 # --- Main execution block for InsultFilter ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transport", choices=["list", "stream"], default="list",
+                        help="Read work from the Work_queue list (BLPOP) or the Work_stream consumer group (default: list)")
+    parser.add_argument("--filter-mode", choices=["client", "server"], default="client",
+                        help="Censor texts here with the cached insult set, or inside Redis with a Lua script (default: client)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Stream entries read per XREADGROUP (default: 100)")
+    args = parser.parse_args()
     print("Starting InsultFilter...")
 
     filtered_requests_counter = Value('i', 0)
-    insult_filter = InsultFilter(filtered_requests_counter)     # Create the InsultFilter instance
+    insult_filter = InsultFilter(filtered_requests_counter, args.filter_mode)     # Create the InsultFilter instance
 
     # --- Set up Pyro server ---
     print("Starting Pyro InsultFilter for remote access...")
@@ -100,15 +156,20 @@ if __name__ == "__main__":
         print(f"Error registering the service with the name server: {e}")
         exit(1)
 
-    print("InsultFilter: Clearing initial Redis keys (INSULTS, RESULTS, Work_queue)...")
+    print("InsultFilter: Clearing initial Redis keys (INSULTS, RESULTS, Work_queue, Work_stream)...")
     client.delete(insult_filter.insultSet)
+    bump_version(client, insult_filter.insultSet)
     client.delete(insult_filter.censoredTextsList)
     client.delete(insult_filter.workQueue)
+    client.delete(insult_filter.workStream)
     print("Redis keys cleared.")
 
     # --- Start background processes for InsultFilter ---
     print("InsultFilter: Starting worker processes...")
-    process_filter_service = Process(target=insult_filter.filter_service)
+    if args.transport == "stream":
+        process_filter_service = Process(target=insult_filter.filter_stream_service, args=(args.batch_size,))
+    else:
+        process_filter_service = Process(target=insult_filter.filter_service)
     process_service_status = Process(target=insult_filter.get_status_daemon)
 
     process_filter_service.start()
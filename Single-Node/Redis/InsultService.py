@@ -1,9 +1,15 @@
+import os
+import sys
 import redis
 import time
 import Pyro4
 from multiprocessing import Process, Value
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from InsultSetCache import add_to_insult_set, bump_version
+from Pagination import DEFAULT_PAGE_SIZE, TAIL_SIZE, clamp_limit
+
 # Connect to Redis
 client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
 
@@ -18,7 +24,7 @@ class InsultService:
     def add_insult(self, insult):
         with self.counter.get_lock():
              self.counter.value += 1
-        client.sadd(self.insultSet, insult)
+        add_to_insult_set(client, self.insultSet, insult)  # Bumps the set version read by the filters
         #print(f"InsultService added: {insult} (Counter: {self.counter.value})")
         return f"Insult added: {insult}"
 
@@ -26,6 +32,12 @@ class InsultService:
         insults_list = client.smembers(self.insultSet)
         return f"Insult list: {insults_list}"
 
+    @Pyro4.expose
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, insults] from one SSCAN step; next_cursor is 0 once the scan is complete
+        cursor, insults = client.sscan(self.insultSet, int(cursor), count=clamp_limit(limit))
+        return [cursor, insults]
+
     def insult_me(self):
         if client.scard(self.insultSet) != 0:
             insult = client.srandmember(self.insultSet)
@@ -65,7 +77,7 @@ class InsultService:
         try:
             while True:
                 print("\n--- InsultService Status ---")
-                print(self.get_insults())
+                print(f"Insults stored: {client.scard(self.insultSet)}, sample: {client.srandmember(self.insultSet, TAIL_SIZE)}")
                 print(f"InsultService processed count: {self.get_processed_count()}")
                 print("------------------------------\n")
                 time.sleep(10)
@@ -108,6 +120,7 @@ if __name__ == "__main__":
 
     print("InsultService: Clearing initial Redis keys (INSULTS)...")
     client.delete(insults_service.insultSet)
+    bump_version(client, insults_service.insultSet)
     print("Redis keys cleared.")
 
 
@@ -9,11 +9,21 @@ import os
 import Pyro4
 from Pyro4 import errors
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from RedisStreamQueue import TEXT_FIELD
+from RedisLuaFilter import LuaInsultFilter
+from InsultSetCache import InsultSetCache, add_to_insult_set
+from ResultsStore import DEFAULT_MAX_RESULTS
+
 # --- Configuration ---
 DEFAULT_REDIS_HOST = 'localhost'
 DEFAULT_REDIS_PORT = 6379
 DEFAULT_INSULT_CHANNEL = 'Insults_channel' # Channel where new insults are published
 DEFAULT_WORK_QUEUE = 'Work_queue'         # List (queue) where texts to filter are sent
+DEFAULT_WORK_STREAM = 'Work_stream'       # Stream read by the filters' consumer group (--transport stream)
+INSULT_SET = 'INSULTS'                    # Set the filters censor against
+INLINE_RESULTS = 'Inline_results'         # filter_inline mode: results and counter written by the test itself
+INLINE_COUNTER = 'Inline_counter'
 
 
 # Pyro names for retrieving statistics
@@ -75,7 +85,7 @@ def worker_add_insult(host, port, channel_name, results_queue, end_time):
             redis_client.close()
             # print(f"[Procés {pid}] Connexió Redis tancada.") # TODO: Uncomment this line to see the Redis connection close message
 
-def worker_filter_text(host, port, queue_name, results_queue, end_time):
+def worker_filter_text(host, port, queue_name, results_queue, end_time, transport='list'):
     local_request_count = 0
     local_error_count = 0
     redis_client = None
@@ -89,7 +99,10 @@ def worker_filter_text(host, port, queue_name, results_queue, end_time):
         while time.time() < end_time:
             try:
                 text = random.choice(TEXTS_TO_FILTER)
-                redis_client.rpush(queue_name, text) # RPUSH adds to the end of the list
+                if transport == 'stream':
+                    redis_client.xadd(queue_name, {TEXT_FIELD: text})
+                else:
+                    redis_client.rpush(queue_name, text) # RPUSH adds to the end of the list
                 local_request_count += 1
             except redis.exceptions.ConnectionError as e:
                 print(f"[Process {pid}] Redis connection error sending to queue: {e}", file=sys.stderr)
@@ -111,31 +124,98 @@ def worker_filter_text(host, port, queue_name, results_queue, end_time):
             redis_client.close()
             # print(f"[Procés {pid}] Connexió Redis tancada.")  # TODO: Uncomment this line to see the Redis connection close message
 
+def worker_filter_inline(host, port, results_key, results_queue, end_time, filter_mode='client'):
+    # Each process acts as a filter: censor, store the result and count it, one text per call
+    local_request_count = 0
+    local_error_count = 0
+    redis_client = None
+    pid = os.getpid()
+
+    try:
+        redis_client = redis.Redis(host=host, port=port, db=0, decode_responses=True,
+                                   socket_connect_timeout=5, socket_timeout=5)
+        redis_client.ping()
+        if filter_mode == 'server':
+            lua_filter = LuaInsultFilter(redis_client, INSULT_SET, results_key, INLINE_COUNTER)
+        else:
+            insult_cache = InsultSetCache(redis_client, INSULT_SET)
+
+        while time.time() < end_time:
+            try:
+                text = random.choice(TEXTS_TO_FILTER)
+                if filter_mode == 'server':
+                    lua_filter.filter_text(text) # One EVALSHA: censor, RPUSH and INCRBY inside Redis
+                else:
+                    pipe = redis_client.pipeline(transaction=True)
+                    pipe.rpush(results_key, insult_cache.get_matcher().censor(text))
+                    pipe.ltrim(results_key, -DEFAULT_MAX_RESULTS, -1) # Same cap as the Lua script applies
+                    pipe.incr(INLINE_COUNTER)
+                    pipe.execute()
+                local_request_count += 1
+            except redis.exceptions.ConnectionError as e:
+                print(f"[Process {pid}] Redis connection error filtering text: {e}", file=sys.stderr)
+                local_error_count += 1
+                break
+            except Exception as e:
+                print(f"[Process {pid}] Unexpected error filtering text: {e}", file=sys.stderr)
+                local_error_count += 1
+
+    except redis.exceptions.ConnectionError as e:
+         print(f"[Process {pid}] Severe error connecting to Redis in worker_filter_inline: {e}", file=sys.stderr)
+         local_error_count += 1
+    except Exception as e:
+        print(f"[Process {pid}] Unexpected error in worker_filter_inline: {e}", file=sys.stderr)
+        local_error_count += 1
+    finally:
+        results_queue.put((local_request_count, local_error_count))
+        if redis_client:
+            redis_client.close()
+
 # --- Main Test Function ---
-def run_stress_test(mode, host, port, insult_channel, work_queue, duration, concurrency):
+def run_stress_test(mode, host, port, insult_channel, work_queue, duration, concurrency, transport='list',
+                    work_stream=DEFAULT_WORK_STREAM, filter_mode='client'):
     if mode == 'add_insult': pyro_name = DEFAULT_PYRO_SERVICE_NAME
     elif mode == 'filter_text': pyro_name = DEFAULT_PYRO_FILTER_NAME
+    elif mode == 'filter_inline': pyro_name = None # The test processes are the filters: counts are read from Redis
     else:
-        print(f"Error: Mode '{mode}' not recognized.\nOptions: 'add_insult', 'filter_text'.", file=sys.stderr)
+        print(f"Error: Mode '{mode}' not recognized.\nOptions: 'add_insult', 'filter_text', 'filter_inline'.", file=sys.stderr)
         return
 
     print(f"Starting stress test (Redis direct interaction) in mode '{mode}'...")
     print(f"Redis Host: {host}:{port}")
     print(f"Insult Channel (for add_insult mode): {insult_channel}")
-    print(f"Filter Queue (for filter_text mode): {work_queue}")
-    print(f"Pyro Name (Statistics): {pyro_name}")
+    print(f"Filter {'Stream' if transport == 'stream' else 'Queue'} (for filter_text mode): {work_stream if transport == 'stream' else work_queue}")
+    if mode == 'filter_inline':
+        print(f"Filter mode (for filter_inline mode): {filter_mode}")
+    else:
+        print(f"Pyro Name (Statistics): {pyro_name}")
     print(f"Duration: {duration} seconds")
     print(f"Concurrency: {concurrency} processes")
     print("-" * 30)
 
     if mode == 'add_insult':
         worker_function = worker_add_insult
+        worker_args = ()
         target = insult_channel
     elif mode == 'filter_text':
         worker_function = worker_filter_text
-        target = work_queue
+        target = work_stream if transport == 'stream' else work_queue
+        worker_args = (transport,)
+    elif mode == 'filter_inline':
+        worker_function = worker_filter_inline
+        target = INLINE_RESULTS
+        worker_args = (filter_mode,)
+        try:
+            redis_client = redis.Redis(host=host, port=port, db=0, decode_responses=True,
+                                       socket_connect_timeout=5, socket_timeout=5)
+            redis_client.delete(INLINE_RESULTS, INLINE_COUNTER)
+            for insult in INSULTS_TO_ADD:
+                add_to_insult_set(redis_client, INSULT_SET, insult) # The texts must contain known insults
+        except redis.exceptions.ConnectionError as e:
+            print(f"Severe error connecting to Redis in run_stress_test: {e}", file=sys.stderr)
+            return
     else:
-        print(f"Error: Mode '{mode}' not recognized.\nOptions: 'add_insult', 'filter_text'.", file=sys.stderr)
+        print(f"Error: Mode '{mode}' not recognized.\nOptions: 'add_insult', 'filter_text', 'filter_inline'.", file=sys.stderr)
         return
 
     results_queue = Queue()
@@ -147,7 +227,7 @@ def run_stress_test(mode, host, port, insult_channel, work_queue, duration, conc
     # Create and start processes
     print("Starting processes to send load to Redis...")
     for _ in range(concurrency):
-        process = Process(target=worker_function, args=(host, port, target, results_queue, end_time))
+        process = Process(target=worker_function, args=(host, port, target, results_queue, end_time, *worker_args))
         processes.append(process)
         process.start()
 
@@ -174,23 +254,28 @@ def run_stress_test(mode, host, port, insult_channel, work_queue, duration, conc
     # --- Phase 2: Get statistics from service via Pyro ---
     processed_count_service = -1    # Default value if Pyro call fails
 
-    print(f"Connecting to Pyro ('{pyro_name}') to get statistics...")
-    # Get stats from Service
-    try:
-        # Connect to the service exposed by Pyro
-        server_proxy = Pyro4.Proxy(f"PYRONAME:{pyro_name}")
-        server_proxy._pyroTimeout = 10  # Set a timeout for Pyro connection/calls
-
-        # Call the exposed get_processed_count method to get the counter
-        processed_count_service = server_proxy.get_processed_count()
-        print(f"Statistics received from {pyro_name} via Pyro.")
-    except Pyro4.errors.NamingError:
-        print(f"Error: Pyro service '{pyro_name}' not found. Ensure the Name Server is running and the service is registered.", file=sys.stderr)
-    except AttributeError:
-        print(f"Error: '{pyro_name}' does not have the exposed method 'get_processed_count'.", file=sys.stderr)
-        print("Ensure the method is correctly defined with @Pyro4.expose", file=sys.stderr)
-    except Exception as e:
-        print(f"Error retrieving stats from ('{pyro_name}'): {e}", file=sys.stderr)
+    if mode == 'filter_inline':
+        processed_count_service = int(redis_client.get(INLINE_COUNTER) or 0)
+        redis_client.delete(INLINE_RESULTS, INLINE_COUNTER)
+        redis_client.close()
+    else:
+        print(f"Connecting to Pyro ('{pyro_name}') to get statistics...")
+        # Get stats from Service
+        try:
+            # Connect to the service exposed by Pyro
+            server_proxy = Pyro4.Proxy(f"PYRONAME:{pyro_name}")
+            server_proxy._pyroTimeout = 10  # Set a timeout for Pyro connection/calls
+
+            # Call the exposed get_processed_count method to get the counter
+            processed_count_service = server_proxy.get_processed_count()
+            print(f"Statistics received from {pyro_name} via Pyro.")
+        except Pyro4.errors.NamingError:
+            print(f"Error: Pyro service '{pyro_name}' not found. Ensure the Name Server is running and the service is registered.", file=sys.stderr)
+        except AttributeError:
+            print(f"Error: '{pyro_name}' does not have the exposed method 'get_processed_count'.", file=sys.stderr)
+            print("Ensure the method is correctly defined with @Pyro4.expose", file=sys.stderr)
+        except Exception as e:
+            print(f"Error retrieving stats from ('{pyro_name}'): {e}", file=sys.stderr)
 
     # --- Phase 3: Display results ---
     print("-" * 30)
@@ -206,7 +291,7 @@ def run_stress_test(mode, host, port, insult_channel, work_queue, duration, conc
     else:
         print("Client sending throughput: N/A (duration too short)")
 
-    print("\n--- Service Statistics (via Pyro) ---")
+    print(f"\n--- Service Statistics ({'from Redis' if mode == 'filter_inline' else 'via Pyro'}) ---")
     if processed_count_service != -1:
         print(f"Requests processed by the service: {processed_count_service}")
         if actual_duration > 0:
@@ -223,8 +308,9 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(
         description="Stress Test Script (Multiprocessing) for Insult Services via Redis (Load) and Pyro (Stats)")
-    parser.add_argument("mode", choices=['add_insult', 'filter_text'],
-                        help="The functionality to test ('add_insult' publishes to Redis channel; 'filter_text' pushes to Redis queue)")
+    parser.add_argument("mode", choices=['add_insult', 'filter_text', 'filter_inline'],
+                        help="The functionality to test ('add_insult' publishes to Redis channel; 'filter_text' pushes to Redis queue; "
+                             "'filter_inline' filters texts from the test processes themselves, see --filter-mode)")
     parser.add_argument("--host", default=DEFAULT_REDIS_HOST,
                         help=f"Redis server host (default: {DEFAULT_REDIS_HOST})")
     parser.add_argument("--port", type=int, default=DEFAULT_REDIS_PORT,
@@ -233,6 +319,12 @@ if __name__ == "__main__":
                         help=f"Name of the Redis channel for publishing insults (default: {DEFAULT_INSULT_CHANNEL})")
     parser.add_argument("--work-queue", default=DEFAULT_WORK_QUEUE,
                         help=f"Name of the Redis list/queue for filtering texts (default: {DEFAULT_WORK_QUEUE})")
+    parser.add_argument("--work-stream", default=DEFAULT_WORK_STREAM,
+                        help=f"Name of the Redis stream for filtering texts with --transport stream (default: {DEFAULT_WORK_STREAM})")
+    parser.add_argument("--transport", choices=['list', 'stream'], default='list',
+                        help="Send texts to filter to the list (RPUSH) or the stream (XADD); must match the filters (default: list)")
+    parser.add_argument("--filter-mode", choices=['client', 'server'], default='client',
+                        help="filter_inline mode: censor in the test process with the cached insult set, or inside Redis with the Lua script (default: client)")
     parser.add_argument("-d", "--duration", type=int, default=DEFAULT_DURATION,
                         help=f"Test duration in seconds (default: {DEFAULT_DURATION})")
     parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
@@ -240,4 +332,5 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    run_stress_test(args.mode, args.host, args.port, args.insult_channel, args.work_queue, args.duration, args.concurrency)
\ No newline at end of file
+    run_stress_test(args.mode, args.host, args.port, args.insult_channel, args.work_queue, args.duration, args.concurrency,
+                    args.transport, args.work_stream, args.filter_mode)
\ No newline at end of file
@@ -66,12 +66,14 @@ try:
         t = input()
         if t == "I":
             try:
-                print("Insult list:", hostService.get_insults())
+                cursor, insults = hostService.get_insults_page(0)
+                print(f"Insult list (first {len(insults)}{', more available' if cursor else ''}):", insults)
             except Exception as e:
                 print(f"Communication error: {e}.")
         elif t == "T":
             try:
-                print("Censored texts:", hostFilter.get_results())
+                cursor, censored_texts = hostFilter.get_results_page(0)
+                print(f"Censored texts (first {len(censored_texts)}{', more available' if cursor else ''}):", censored_texts)
             except Exception as e:
                 print(f"Communication error: {e}.")
         elif t == "K":
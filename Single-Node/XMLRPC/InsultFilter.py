@@ -1,54 +1,86 @@
+import argparse
 from multiprocessing import Value
-from xmlrpc.server import SimpleXMLRPCRequestHandler
-from xmlrpc.server import SimpleXMLRPCServer
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from InsultMatcher import InsultMatcher
+from Pagination import DEFAULT_PAGE_SIZE
+from ResultsStore import BoundedResults, ResultsManager
+from XmlRpcServer import KeepAliveRequestHandler, XMLRPCServer, serve
 
 # Global counter for processed requests
 processed_requests_counter = Value('i', 0)
 
 # Restrict to a particular path.
-class RequestHandler(SimpleXMLRPCRequestHandler):
+class RequestHandler(KeepAliveRequestHandler):
     rpc_paths = ('/RPC2',)
 
+parser = argparse.ArgumentParser(description="Insult Filter XML-RPC Server")
+parser.add_argument("-t", "--threads", type=int, default=1,
+                    help="Threads serving requests in each process (default: 1)")
+parser.add_argument("-w", "--workers", type=int, default=1,
+                    help="Pre-forked processes sharing the port through SO_REUSEPORT (default: 1)")
+args = parser.parse_args()
+
+class InsultFilter:
+    def __init__(self, req_counter, insults, results):
+        self.insults = insults   # received insults (append-only)
+        self.matcher = InsultMatcher()   # this process' compiled copy of insults
+        self.results = results   # newest distinct censored texts (BoundedResults)
+        self.counter = req_counter
+
+    def filter(self, text):
+        with self.counter.get_lock():
+            self.counter.value += 1
+        self.matcher.sync(self.insults)
+        censored_text = self.matcher.censor(text)
+        self.results.add(censored_text)
+        # print(f"Filtered text: {censored_text}")
+        return censored_text
+
+    def filter_many(self, texts):
+        # Batch version of filter: one call, results returned in the same order as texts
+        with self.counter.get_lock():
+            self.counter.value += len(texts)
+        self.matcher.sync(self.insults)
+        censored_texts = [self.matcher.censor(text) for text in texts]
+        self.results.add_many(censored_texts)
+        return censored_texts
+
+    def add_insult(self, insult):
+        with self.counter.get_lock():
+            self.counter.value += 1
+        self.insults.append(insult)
+        return f"Insult added: {insult}"
+
+    def get_results(self):
+        return self.results.items()
+
+    def get_results_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, censored texts]; next_cursor is 0 once every stored text has been returned
+        return self.results.page(cursor, limit)
+
+    def get_processed_count(self):
+        with self.counter.get_lock():
+            return self.counter.value
+
+if args.workers > 1:
+    # Pre-forked processes share the insults and results through a manager process
+    manager = ResultsManager()
+    manager.start()
+    insult_filter = InsultFilter(processed_requests_counter, manager.list(), manager.BoundedResults())
+else:
+    insult_filter = InsultFilter(processed_requests_counter, [], BoundedResults())
+
 # Create server
-with SimpleXMLRPCServer(('localhost', 8010),
-                        requestHandler=RequestHandler) as server:
+def build_server():
+    server = XMLRPCServer(('localhost', 8010), threads=args.threads, reuse_port=args.workers > 1,
+                          requestHandler=RequestHandler)
     server.register_introspection_functions()
-
-    class InsultFilter:
-        def __init__(self, req_counter):
-            self.insults = []   # received insults
-            self.results = []   # censored text
-            self.counter = req_counter
-
-        def filter(self, text):
-            with self.counter.get_lock():
-                self.counter.value += 1
-            censored_text = ""
-            for word in text.split():
-                if word in self.insults:
-                    censored_text += "CENSORED "
-                else:
-                    censored_text += word + " "
-            if censored_text not in self.results:
-                self.results.append(censored_text)
-            # print(f"Filtered text: {censored_text}")
-            return censored_text
-
-        def add_insult(self, insult):
-            with self.counter.get_lock():
-                self.counter.value += 1
-            self.insults.append(insult)
-            return f"Insult added: {insult}"
-
-        def get_results(self):
-            return self.results
-
-        def get_processed_count(self):
-            with self.counter.get_lock():
-                return self.counter.value
-
-    insult_filter = InsultFilter(processed_requests_counter)
     server.register_instance(insult_filter)
-    # Run the server's main loop
-    print("Server is running...")
-    server.serve_forever()
\ No newline at end of file
+    return server
+
+# Run the server's main loop
+print(f"Server is running ({args.workers} process(es), {args.threads} thread(s) each)...")
+serve(build_server, args.workers)
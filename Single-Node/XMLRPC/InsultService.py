@@ -1,67 +1,122 @@
+import argparse
+import os
 import random
-import xmlrpc.client
-from multiprocessing import Value
-from xmlrpc.server import SimpleXMLRPCRequestHandler
-from xmlrpc.server import SimpleXMLRPCServer
+import sys
+import threading
+from multiprocessing import Manager, Value
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from FanOut import Broadcaster, xmlrpc_sender
+from Pagination import DEFAULT_PAGE_SIZE, page
+from XmlRpcServer import KeepAliveRequestHandler, XMLRPCServer, serve
 
 # Global counter for processed requests
 processed_requests_counter = Value('i', 0)
 
 # Restrict to a particular path.
-class RequestHandler(SimpleXMLRPCRequestHandler):
+class RequestHandler(KeepAliveRequestHandler):
     rpc_paths = ('/RPC2',)
 
+parser = argparse.ArgumentParser(description="Insult Service XML-RPC Server")
+parser.add_argument("-t", "--threads", type=int, default=1,
+                    help="Threads serving requests in each process (default: 1)")
+parser.add_argument("-w", "--workers", type=int, default=1,
+                    help="Pre-forked processes sharing the port through SO_REUSEPORT (default: 1)")
+args = parser.parse_args()
+
+class Insults:
+    def __init__(self, req_counter, insults, subscribers):
+        self.insults = insults   # received insults
+        self.results = []   # censored text
+        self.subscribers = subscribers
+        self.counter = req_counter
+        self.fanout = None  # Created by the first broadcast of each (forked) process
+        self.fanout_lock = threading.Lock()  # Never held before the workers are forked
+        self.subscribers_version = Value('i', 0)  # Bumped on every change to subscribers, seen by every process
+        self.synced_version = 0  # subscribers_version when fanout was last synced with subscribers
+
+    def add_subscriber(self, url):
+        if url not in self.subscribers:
+            self.subscribers.append(url)
+            self.subscribers_changed()
+            self.get_fanout().subscribe(url)
+            return f"Subscriber {url} added."
+        return f"Subscriber {url} already exists."
+
+    def get_fanout(self):
+        if self.fanout is None:
+            with self.fanout_lock:
+                if self.fanout is None:
+                    self.fanout = Broadcaster(xmlrpc_sender, on_evict=self.remove_subscriber)
+        # Copying a Manager list is a round trip, so it is only read again after a change
+        version = self.subscribers_version.value
+        if version != self.synced_version:
+            self.synced_version = version  # Before the read: a change made meanwhile bumps the version again
+            self.fanout.sync(list(self.subscribers))  # Changes made through the other processes
+        return self.fanout
+
+    def subscribers_changed(self):
+        with self.subscribers_version.get_lock():
+            self.subscribers_version.value += 1
+
+    def remove_subscriber(self, url):
+        try:
+            self.subscribers.remove(url)
+            self.subscribers_changed()
+        except ValueError:
+            pass
+
+    def notify_subscribers(self, insult):
+        # Queued for every subscriber; the deliveries run on the fan-out pool
+        self.get_fanout().publish(insult)
+        return "Subscribers notified."
+
+    def notify_many(self, insults):
+        self.get_fanout().publish_many(insults)
+        return f"{len(insults)} insults queued for the subscribers."
+
+    def get_fanout_stats(self):
+        return self.get_fanout().stats()
+
+    def add_insult(self, insult):
+        with self.counter.get_lock():
+            self.counter.value += 1
+        self.insults.append(insult)
+        return f"Insult added: {insult}"
+
+    def get_insults(self):
+        return list(self.insults)
+
+    def get_insults_page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        # [next_cursor, insults]; next_cursor is 0 once every insult has been returned
+        return page(self.insults, cursor, limit)
+
+    def insult_me(self):
+        if len(self.insults) == 0:
+            return "No insults available"
+        i = random.randint(0, len(self.insults)-1)
+        print(f"Chosen insult: {self.insults[i]}")
+        return self.insults[i]
+
+    def get_processed_count(self):
+        with self.counter.get_lock():
+            return self.counter.value
+
+if args.workers > 1:
+    # Pre-forked processes share the insults and subscribers through a manager process
+    manager = Manager()
+    insults = Insults(processed_requests_counter, manager.list(), manager.list())
+else:
+    insults = Insults(processed_requests_counter, [], [])
+
 # Create server
-with SimpleXMLRPCServer(('localhost', 8000),
-                        requestHandler=RequestHandler) as server:
+def build_server():
+    server = XMLRPCServer(('localhost', 8000), threads=args.threads, reuse_port=args.workers > 1,
+                          requestHandler=RequestHandler)
     server.register_introspection_functions()
-
-    class Insults:
-        def __init__(self, req_counter):
-            self.insults = []   # received insults
-            self.results = []   # censored text
-            self.subscribers = []
-            self.counter = req_counter
-
-        def add_subscriber(self, url):
-            if url not in self.subscribers:
-                self.subscribers.append(url)
-                return f"Subscriber {url} added."
-            return f"Subscriber {url} already exists."
-
-        def notify_subscribers(self, insult):
-            for subscriber_url in self.subscribers:
-                try:
-                    proxy = xmlrpc.client.ServerProxy(subscriber_url)
-                    proxy.notify(insult)
-                    print(f"Subscriber {subscriber_url} notified. Insult: {insult}")
-                    print("Notified subscriber.")
-                except Exception as e:
-                    print(f"Error notifying {subscriber_url}: {e}")
-            return "Subscribers notified."
-
-        def add_insult(self, insult):
-            with self.counter.get_lock():
-                self.counter.value += 1
-            self.insults.append(insult)
-            return f"Insult added: {insult}"
-
-        def get_insults(self):
-            return self.insults
-
-        def insult_me(self):
-            if len(self.insults) == 0:
-                return "No insults available"
-            i = random.randint(0, len(self.insults)-1)
-            print(f"Chosen insult: {self.insults[i]}")
-            return self.insults[i]
-
-        def get_processed_count(self):
-            with self.counter.get_lock():
-                return self.counter.value
-
-    insults = Insults(processed_requests_counter)
     server.register_instance(insults)
-    # Run the server's main loop
-    print("Server is running...")
-    server.serve_forever()
\ No newline at end of file
+    return server
+
+# Run the server's main loop
+print(f"Server is running ({args.workers} process(es), {args.threads} thread(s) each)...")
+serve(build_server, args.workers)
@@ -14,10 +14,17 @@ class Subscriber:
         print(f"New insult received: {insult}")
         return "Insult received."
 
+    def notify_many(self, insults):
+        # Insults that queued up for this subscriber at the service, delivered in one call
+        for insult in insults:
+            self.notify(insult)
+        return f"{len(insults)} insults received."
+
 server = SimpleXMLRPCServer(('localhost', 8001), requestHandler=RequestHandler, allow_none=True)
 subscriber_service = Subscriber()
 
 server.register_function(subscriber_service.notify, "notify")
+server.register_function(subscriber_service.notify_many, "notify_many")
 
 print(f"Subscriber running on port 8001...")
 server.serve_forever()
@@ -65,7 +65,7 @@ def worker_add_insult(server_url, results_queue, end_time):
         results_queue.put((local_request_count, local_error_count, server_request_count))
         # There is no explicit 'close' method for ServerProxy
 
-def worker_filter_text(server_url, results_queue, end_time):
+def worker_filter_text(server_url, results_queue, end_time, batch_size=1):
     local_request_count = 0
     local_error_count = 0
     server_request_count = 0
@@ -77,9 +77,14 @@ def worker_filter_text(server_url, results_queue, end_time):
 
         while time.time() < end_time:
             try:
-                text = random.choice(TEXTS_TO_FILTER)
-                server_proxy.filter(text)
-                local_request_count += 1
+                if batch_size > 1:
+                    # One call censors a whole batch, amortising the per-call overhead
+                    server_proxy.filter_many(random.choices(TEXTS_TO_FILTER, k=batch_size))
+                    local_request_count += batch_size
+                else:
+                    text = random.choice(TEXTS_TO_FILTER)
+                    server_proxy.filter(text)
+                    local_request_count += 1
             except Exception as e:
                 # print(f"[Process {pid}] Error filtering text (XML-RPC): {e}", file=sys.stderr)
                 local_error_count += 1
@@ -98,7 +103,7 @@ def worker_filter_text(server_url, results_queue, end_time):
 
 
 # --- Main Test Function ---
-def run_stress_test(mode, duration, concurrency):
+def run_stress_test(mode, duration, concurrency, batch_size=1):
     server_url = ""
     if mode == "filter_text":
         server_url = FILTER_URL
@@ -109,6 +114,8 @@ def run_stress_test(mode, duration, concurrency):
     print(f"Server URL: {server_url}")
     print(f"Duration: {duration} seconds")
     print(f"Concurrency: {concurrency} processes")
+    if mode == "filter_text":
+        print(f"Batch size: {batch_size} texts per call")
     print("-" * 30)
 
     # Select the worker function based on the mode
@@ -124,10 +131,13 @@ def run_stress_test(mode, duration, concurrency):
     processes = []
     start_time = time.time()
     end_time = start_time + duration
+    worker_args = (server_url, results_queue, end_time)
+    if mode == 'filter_text':
+        worker_args += (batch_size,)
 
     # Create and start the processes
     for _ in range(concurrency):
-        process = Process(target=worker_function, args=(server_url, results_queue, end_time))
+        process = Process(target=worker_function, args=worker_args)
         processes.append(process)
         process.start()
 
@@ -177,7 +187,9 @@ if __name__ == "__main__":
                         help=f"Test duration in seconds (default: {DEFAULT_DURATION})")
     parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
                         help=f"Number of concurrent processes (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("-b", "--batch-size", type=int, default=1,
+                        help="Texts sent per call in filter_text mode; above 1 uses filter_many (default: 1)")
 
     args = parser.parse_args()
 
-    run_stress_test(args.mode, args.duration, args.concurrency)
\ No newline at end of file
+    run_stress_test(args.mode, args.duration, args.concurrency, args.batch_size)
\ No newline at end of file